@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import tensorflow as tf
+
+# ops with multiply-adds computed from the weight shape, covering conv2d,
+# group_conv2d, factorized and separable (depthwise + pointwise) convolutions
+_CONV_OPS = ("Conv2D", "DepthwiseConv2dNative")
+
+# ops without own activation memory (views, control flow, and inputs)
+_NO_MEMORY_OPS = (
+        "Identity", "Switch", "Merge", "Const", "Placeholder", "PlaceholderWithDefault",
+        "VariableV2", "VarHandleOp", "ReadVariableOp", "Shape", "Reshape",
+        "Squeeze", "ExpandDims", "StopGradient")
+
+
+def _scope(name, depth):
+    return "/".join(name.split("/")[:depth])
+
+
+def _forward_ops(outputs):
+    """Returns the ops the output tensors depend on, without the untaken
+    branches of conditionals, i.e. the inference branches of the ones on the
+    training flag (e.g. batch normalization and dropout).
+    """
+    found = dict()
+    stack = [t.op for t in outputs]
+    while stack:
+        op = stack.pop()
+        if op.name in found:
+            continue
+        context = getattr(op, "_control_flow_context", None)
+        if getattr(context, "branch", None) == 0:
+            continue
+        found[op.name] = op
+        stack.extend(t.op for t in op.inputs)
+    return found
+
+
+def _n_per_example(shape):
+    """Returns the number of items of a tensor per example, or None if the
+    shape is not fully known apart from the batch dimension.
+    """
+    dims = shape.as_list() if shape.ndims is not None else None
+    if (not dims) or any(d is None for d in dims[1:]):
+        return None
+    return int(np.prod(dims[1:]))
+
+
+def op_macs(op):
+    """Computes the multiply-adds of an op per example.
+    Args:
+        op: A TensorFlow operation.
+    Returns:
+        An integer, zero for the ops without multiply-adds.
+    """
+    if op.type in _CONV_OPS:
+        w_shape = op.inputs[1].get_shape().as_list()
+        out_shape = op.outputs[0].get_shape().as_list()
+        if op.get_attr("data_format") == b"NCHW":
+            spatial = out_shape[2]*out_shape[3]
+        else:
+            spatial = out_shape[1]*out_shape[2]
+        return int(spatial*np.prod(w_shape))
+    if op.type == "MatMul":
+        return int(np.prod(op.inputs[1].get_shape().as_list()))
+    return 0
+
+
+def analyze(layers, depth = 1):
+    """Computes the multiply-adds, the parameters and the activation memory
+    of a network per layer, i.e. per variable scope of the given depth.
+    Args:
+        layers: A list of tuples of layer names and output tensors, as
+            returned by the graph builders. Any built graph can be analyzed
+            by passing its outputs, e.g. [("logit", logit)].
+        depth: An integer representing the depth of the scopes the ops are
+            grouped by.
+    Returns:
+        A dictionary with the totals ('macs', 'params', 'activation_bytes')
+        and the same values per layer in a list ('layers'). The values are per
+        example, the activation memory is the size of all forward tensors
+        needed by the backpropagation.
+    """
+    outputs = [t for _, t in layers]
+    ops = _forward_ops(outputs)
+    stats = dict()
+    order = []
+
+    def layer_stats(name):
+        key = _scope(name, depth)
+        if key not in stats:
+            stats[key] = {'name': key, 'macs': 0, 'params': 0, 'activation_bytes': 0}
+            order.append(key)
+        return stats[key]
+
+    # layers in the order of the layers list
+    for _, t in layers:
+        layer_stats(t.op.name)
+    for op in ops.values():
+        s = layer_stats(op.name)
+        s['macs'] += op_macs(op)
+        if op.type in _NO_MEMORY_OPS:
+            continue
+        for t in op.outputs:
+            n = _n_per_example(t.get_shape())
+            if (n is not None) and t.dtype.is_floating:
+                s['activation_bytes'] += n*t.dtype.size
+    graph = outputs[0].graph
+    for v in graph.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES):
+        layer_stats(v.op.name)['params'] += int(np.prod(v.get_shape().as_list()))
+
+    result = {'layers': [stats[key] for key in order]}
+    for key in ('macs', 'params', 'activation_bytes'):
+        result[key] = sum(s[key] for s in result['layers'])
+    return result
+
+
+def max_batch_size(result, budget_bytes,
+                   param_copies = 4,
+                   activation_factor = 2.0,
+                   reserve_bytes = 0):
+    """Estimates the largest training batch size fitting a memory budget.
+    Args:
+        result: A dictionary returned by analyze.
+        budget_bytes: A number representing the memory budget in bytes.
+        param_copies: A number representing the copies of the parameters,
+            e.g. weights, gradients, and two optimizer slots for Adam. The
+            parameters are assumed to be float32.
+        activation_factor: A number representing the memory of the
+            activations and their gradients relative to the activations.
+        reserve_bytes: A number representing the memory reserved for others,
+            e.g. the framework and the input data.
+    Returns:
+        An integer, zero if not even a single example fits.
+    """
+    fixed = 4*result['params']*param_copies + reserve_bytes
+    per_example = result['activation_bytes']*activation_factor
+    if per_example <= 0:
+        return 0
+    return max(0, int((budget_bytes - fixed) // per_example))
+
+
+def print_report(result):
+    """Prints a table of the layers and the totals of a result."""
+    row = "{:<40} {:>16} {:>12} {:>16}"
+    print(row.format("layer", "MACs", "params", "activation KB"))
+    for s in result['layers']:
+        print(row.format(s['name'], s['macs'], s['params'],
+                         "{:.1f}".format(s['activation_bytes'] / 1024.0)))
+    print(row.format("total", result['macs'], result['params'],
+                     "{:.1f}".format(result['activation_bytes'] / 1024.0)))
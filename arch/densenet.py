@@ -4,7 +4,9 @@
 
 import tensorflow as tf
 from arch.layers import bn_act_conv2d, avg_pool2d, global_avg_pool2d
+from arch.layers import channel_axis, n_channels
 from arch.initializers import He_normal
+from arch.recompute import add_checkpoint
 
 #Huang et al. Densely Connected Convolutional Networks
 #https://arxiv.org/abs/1608.06993
@@ -21,11 +23,18 @@ def dense_block(
         regularizer = None,
         kernel_init = He_normal(seed = 42),
         is_training = False,
+        efficient = False,
         seed = 42,
         name = "dense_block"):
+    """Creates a dense block. If efficient is True, only the inputs and the
+    new features of the layers are kept for the backpropagation (with
+    arch.recompute), the concatenations and the batch normalizations are
+    recomputed, so the memory grows linearly with the depth instead of
+    quadratically.
+    """
     with tf.variable_scope(name):    
         shortcuts = []
-        shortcuts.append(inputs)
+        shortcuts.append(add_checkpoint(inputs) if efficient else inputs)
         x = inputs
         for r in range(n_repeat):
             x = bn_act_conv2d(
@@ -40,8 +49,8 @@ def dense_block(
                         x, rate = drop_rate,
                         training = is_training,
                         seed = seed, name = "dropout_"+str(r))
-            shortcuts.append(x)
-            x = tf.concat(shortcuts, axis = 3)
+            shortcuts.append(add_checkpoint(x) if efficient else x)
+            x = tf.concat(shortcuts, axis = channel_axis())
     return x
 
 
@@ -56,12 +65,17 @@ def bottleneck_block(
         regularizer = None,
         kernel_init = He_normal(seed = 42),
         is_training = False,
+        efficient = False,
         seed = 42,
         name = "dense_bottleneck_block"):
+    """Creates a dense block with bottleneck layers. If efficient is True,
+    the outputs of the bottleneck convolutions are kept too, as in dense_block
+    only the concatenations and the batch normalizations are recomputed.
+    """
     n_filters_reduction = n_filters*reduction_ratio
     with tf.variable_scope(name):    
         shortcuts = []
-        shortcuts.append(inputs)
+        shortcuts.append(add_checkpoint(inputs) if efficient else inputs)
         x = inputs
         for r in range(n_repeat):
             x = bn_act_conv2d(
@@ -77,6 +91,8 @@ def bottleneck_block(
                         x, rate = drop_rate,
                         training = is_training,
                         seed = seed+1, name = "reduction_dropout_"+str(r))
+            if efficient:
+                x = add_checkpoint(x)
             
             x = bn_act_conv2d(
                     x, size = size, n_filters = n_filters, stride = 1,
@@ -92,8 +108,8 @@ def bottleneck_block(
                         training = is_training,
                         seed = seed+2, name = "dropout_"+str(r))
             
-            shortcuts.append(x)
-            x = tf.concat(shortcuts, axis = 3)
+            shortcuts.append(add_checkpoint(x) if efficient else x)
+            x = tf.concat(shortcuts, axis = channel_axis())
     return x
 
 
@@ -110,7 +126,7 @@ def transition_layer(
         kernel_init = He_normal(seed = 42),
         seed = 42,
         name = "trasition_layer"):
-    in_filt = inputs.shape[3].value
+    in_filt = n_channels(inputs)
     n_filters = int(in_filt*theta)
     with tf.variable_scope(name):
         x = bn_act_conv2d(
@@ -138,7 +154,7 @@ def final_layer(
         name = "final_layer"):
     with tf.variable_scope(name):  
         x = tf.layers.batch_normalization(
-                inputs, training = is_training, name = "batch_norm")
+                inputs, axis = channel_axis(), training = is_training, name = "batch_norm")
         x = activation(x, name = "activation")
         x = global_avg_pool2d(x)
     return x
\ No newline at end of file
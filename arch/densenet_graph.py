@@ -10,7 +10,7 @@ from functools import partial
 
 # depth 40 -> 40-4 (initial + 2 trans + 1 dense) = 36
 # 36/3 = 12 -> 12 convolutions per block
-def cifar10_densenet(x, n_repeat, drop_rate = 0.2, seed = 42):
+def cifar10_densenet(x, n_repeat, drop_rate = 0.2, efficient = False, seed = 42):
     layers = []
     variables = []
 
@@ -26,6 +26,7 @@ def cifar10_densenet(x, n_repeat, drop_rate = 0.2, seed = 42):
     dblock1 = densenet.dense_block(
             conv, n_repeat = n_repeat, n_filters = 12,
             drop_rate = drop_rate,
+            efficient = efficient,
             is_training = training,
             kernel_init = He_normal(seed = seed+2),
             seed = seed+2,
@@ -44,6 +45,7 @@ def cifar10_densenet(x, n_repeat, drop_rate = 0.2, seed = 42):
     dblock2 = densenet.dense_block(
             tlayer1, n_repeat = n_repeat, n_filters = 12,
             drop_rate = drop_rate,
+            efficient = efficient,
             is_training=training,
             kernel_init = He_normal(seed = seed+4),
             seed = seed+4,
@@ -62,6 +64,7 @@ def cifar10_densenet(x, n_repeat, drop_rate = 0.2, seed = 42):
     dblock3 = densenet.dense_block(
             tlayer2, n_repeat = n_repeat, n_filters = 12,
             drop_rate = drop_rate,
+            efficient = efficient,
             is_training = training,
             kernel_init = He_normal(seed = seed+6),
             seed = seed+6,
@@ -84,10 +87,12 @@ def cifar10_densenet(x, n_repeat, drop_rate = 0.2, seed = 42):
 
 # 3*12+4 = 40
 cifar10_densenet_40 = partial(cifar10_densenet, n_repeat = 12)
+# the same network, with the concatenations recomputed in the backpropagation
+cifar10_densenet_40_efficient = partial(cifar10_densenet, n_repeat = 12, efficient = True)
 
 
 #https://github.com/Lasagne/Recipes/blob/master/papers/densenet/densenet.py
-def cifar10_densenet_wd(x, n_repeat, drop_rate = 0.2, weight_decay = 0.0001, seed = 42):
+def cifar10_densenet_wd(x, n_repeat, drop_rate = 0.2, efficient = False, weight_decay = 0.0001, seed = 42):
     layers = []
     variables = []
 
@@ -104,6 +109,7 @@ def cifar10_densenet_wd(x, n_repeat, drop_rate = 0.2, weight_decay = 0.0001, see
     dblock1 = densenet.dense_block(
             conv, n_repeat = n_repeat, n_filters = 12,
             drop_rate = drop_rate,
+            efficient = efficient,
             is_training = training,
             regularizer = tf.contrib.layers.l2_regularizer(weight_decay),
             kernel_init = He_normal(seed = seed+2),
@@ -124,6 +130,7 @@ def cifar10_densenet_wd(x, n_repeat, drop_rate = 0.2, weight_decay = 0.0001, see
     dblock2 = densenet.dense_block(
             tlayer1, n_repeat = n_repeat, n_filters = 12,
             drop_rate = drop_rate,
+            efficient = efficient,
             is_training=training,
             regularizer = tf.contrib.layers.l2_regularizer(weight_decay),
             kernel_init = He_normal(seed = seed+4),
@@ -144,6 +151,7 @@ def cifar10_densenet_wd(x, n_repeat, drop_rate = 0.2, weight_decay = 0.0001, see
     dblock3 = densenet.dense_block(
             tlayer2, n_repeat = n_repeat, n_filters = 12,
             drop_rate = drop_rate,
+            efficient = efficient,
             is_training = training,
             regularizer = tf.contrib.layers.l2_regularizer(weight_decay),
             kernel_init = He_normal(seed = seed+6),
@@ -166,11 +174,12 @@ def cifar10_densenet_wd(x, n_repeat, drop_rate = 0.2, weight_decay = 0.0001, see
     return layers, variables
 
 cifar10_densenet_40_wd = partial(cifar10_densenet_wd, n_repeat = 12)
+cifar10_densenet_40_wd_efficient = partial(cifar10_densenet_wd, n_repeat = 12, efficient = True)
 
 
 # depth 100 -> 100-4 (initial + 2 trans + 1 dense) = 96
 # 96/3 = 32 -> 16x2 convolutions per block (16 1x1 + 16 3x3)
-def cifar10_bottleneck_densenet(x, n_repeat, drop_rate = 0.25, seed = 42):
+def cifar10_bottleneck_densenet(x, n_repeat, drop_rate = 0.25, efficient = False, seed = 42):
     layers = []
     variables = []
 
@@ -186,6 +195,7 @@ def cifar10_bottleneck_densenet(x, n_repeat, drop_rate = 0.25, seed = 42):
     dblock1 = densenet.bottleneck_block(
             conv, n_repeat = n_repeat, n_filters = 12, reduction_ratio = 4,
             drop_rate = drop_rate,
+            efficient = efficient,
             is_training = training,
             kernel_init = He_normal(seed = seed+2),
             seed = seed+2,
@@ -204,6 +214,7 @@ def cifar10_bottleneck_densenet(x, n_repeat, drop_rate = 0.25, seed = 42):
     dblock2 = densenet.bottleneck_block(
             tlayer1, n_repeat = n_repeat, n_filters = 12, reduction_ratio = 4,
             drop_rate = drop_rate,
+            efficient = efficient,
             is_training = training,
             kernel_init = He_normal(seed = seed+4),
             seed = seed+4,
@@ -222,6 +233,7 @@ def cifar10_bottleneck_densenet(x, n_repeat, drop_rate = 0.25, seed = 42):
     dblock3 = densenet.bottleneck_block(
             tlayer2, n_repeat = n_repeat, n_filters = 12, reduction_ratio = 4,
             drop_rate = drop_rate,
+            efficient = efficient,
             is_training = training,
             kernel_init = He_normal(seed = seed+6),
             seed = seed+6,
@@ -243,4 +255,5 @@ def cifar10_bottleneck_densenet(x, n_repeat, drop_rate = 0.25, seed = 42):
     return layers, variables
 
 cifar10_bottleneck_densenet_100 = partial(cifar10_bottleneck_densenet, n_repeat = 16)
+cifar10_bottleneck_densenet_100_efficient = partial(cifar10_bottleneck_densenet, n_repeat = 16, efficient = True)
 
@@ -3,7 +3,7 @@
 
 from functools import partial
 import tensorflow as tf
-from arch.layers import conv2d, conv2d_bn, max_pool, flatten, dense, dense_bn
+from arch.layers import conv2d, conv2d_bn, max_pool, flatten, dense, dense_bn, global_avg_pool2d
 from arch.layers import Kumar_initializer, truncated_n_seeded, Kumar_initializer_multi
 from arch.inception import grid_module_v1
 from arch.inception import grid_module_v2, factorized_grid_module_v2
@@ -217,7 +217,7 @@ def mnist_resnet_cbn1r3d1(x):
             is_training=training, name="residual3")
     layers.append(("residual3", res3))
 
-    pool1 = tf.reduce_mean(res3, [1,2]) # global average pooling
+    pool1 = global_avg_pool2d(res3) # global average pooling
     layers.append(("pool", pool1))
     
     fc2 = dense(pool1, n_units=10, activation=None,
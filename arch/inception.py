@@ -4,11 +4,51 @@
 
 import tensorflow as tf
 from arch.layers import conv2d_relu, conv2d_bn_relu, factorized_conv2d_bn_relu
+from arch.layers import channel_axis, fused_conv2d_1x1
 from arch.layers import dense_relu, dense_bn_relu
 from arch.layers import max_pool2d, avg_pool2d, flatten
 from arch.initializers import He_normal
 
 
+def _conv_1x1(
+        inputs, n_filters, names, kernel_inits,
+        batch_norm = False,
+        fused = False,
+        is_training = False,
+        regularizer = None):
+    """Creates the 1x1 convolutions of the inputs of a module, computed by a
+    single convolution if fused.
+    Returns:
+        A list of the outputs of the convolutions.
+    """
+    if fused:
+        return fused_conv2d_1x1(
+                inputs, n_filters, names,
+                batch_norm = batch_norm,
+                is_training = is_training,
+                regularizer = regularizer,
+                kernel_init = kernel_inits)
+    outputs = []
+    for n, name, kernel_init in zip(n_filters, names, kernel_inits):
+        if batch_norm:
+            x = conv2d_bn_relu(
+                    inputs, size = 1, n_filters = n,
+                    stride = 1,
+                    is_training = is_training,
+                    regularizer = regularizer,
+                    kernel_init = kernel_init,
+                    name = name)
+        else:
+            x = conv2d_relu(
+                    inputs, size = 1, n_filters = n,
+                    stride = 1,
+                    regularizer = regularizer,
+                    kernel_init = kernel_init,
+                    name = name)
+        outputs.append(x)
+    return outputs
+
+
 #Szegedy et al. Going deeper with convolutions
 #https://arxiv.org/pdf/1409.4842v1.pdf
 def grid(
@@ -24,24 +64,20 @@ def grid(
         regularizer = None,
         kernel_init = He_normal(seed = 42),
         kernel_init_reduce = He_normal(seed = 42),
+        fused = False,
         name = "inception_grid"
         ):
     with tf.variable_scope(name):
-        # 1x1
-        x_1x1 = conv2d_relu(
-                    inputs, size = 1, n_filters = n_filters_1x1,
-                    stride = 1,
-                    regularizer = regularizer,
-                    kernel_init = kernel_init,
-                    name = "conv_1x1")
+        # 1x1 and reductions
+        x_1x1, reduce_3x3, reduce_5x5 = _conv_1x1(
+                inputs,
+                [n_filters_1x1, n_reduce_3x3, n_reduce_5x5],
+                ["conv_1x1", "conv_reduce_3x3", "conv_reduce_5x5"],
+                kernel_inits = [kernel_init, kernel_init_reduce, kernel_init_reduce],
+                fused = fused,
+                regularizer = regularizer)
         
         # 3x3
-        reduce_3x3 = conv2d_relu(
-                    inputs, size = 1, n_filters = n_reduce_3x3,
-                    stride = 1,
-                    regularizer = regularizer,
-                    kernel_init = kernel_init_reduce,
-                    name = "conv_reduce_3x3")
         x_3x3 = conv2d_relu(
                     reduce_3x3, size = 3, n_filters = n_filters_3x3,
                     stride = 1,
@@ -50,12 +86,6 @@ def grid(
                     name = "conv_3x3")
         
         # 5x5
-        reduce_5x5 = conv2d_relu(
-                    inputs, size = 1, n_filters = n_reduce_5x5,
-                    stride = 1,
-                    regularizer = regularizer,
-                    kernel_init = kernel_init_reduce,
-                    name = "conv_reduce_5x5")
         x_5x5 = conv2d_relu(
                     reduce_5x5, size = 5, n_filters = n_filters_5x5,
                     stride = 1,
@@ -72,7 +102,7 @@ def grid(
                     kernel_init = kernel_init_reduce,
                     name = "conv_pool_proj")
         
-        inception = tf.concat([x_1x1,x_3x3,x_5x5,proj_pool], axis = 3)
+        inception = tf.concat([x_1x1,x_3x3,x_5x5,proj_pool], axis = channel_axis())
         
     return inception
 
@@ -94,24 +124,20 @@ def grid_fact2d(
         regularizer = None,
         kernel_init = He_normal(seed = 42),
         kernel_init_reduce = He_normal(seed = 42),
+        fused = False,
         name = "inception_grid_2d_factorized"
         ):
     with tf.variable_scope(name):
-        # 1x1
-        x_1x1 = conv2d_relu(
-                    inputs, size = 1, n_filters = n_filters_1x1,
-                    stride = 1,
-                    regularizer = regularizer,
-                    kernel_init = kernel_init,
-                    name = "conv_1x1")
+        # 1x1 and reductions
+        x_1x1, reduce_3x3, reduce_5x5 = _conv_1x1(
+                inputs,
+                [n_filters_1x1, n_reduce_3x3, n_reduce_5x5],
+                ["conv_1x1", "conv_reduce_3x3", "conv_reduce_5x5"],
+                kernel_inits = [kernel_init, kernel_init_reduce, kernel_init_reduce],
+                fused = fused,
+                regularizer = regularizer)
         
         # 3x3
-        reduce_3x3 = conv2d_relu(
-                    inputs, size = 1, n_filters = n_reduce_3x3,
-                    stride = 1,
-                    regularizer = regularizer,
-                    kernel_init = kernel_init_reduce,
-                    name = "conv_reduce_3x3")
         x_3x3 = conv2d_relu(
                     reduce_3x3, size = 3, n_filters = n_filters_3x3,
                     stride = 1,
@@ -120,12 +146,6 @@ def grid_fact2d(
                     name = "conv_3x3")
         
         # factorized 5x5
-        reduce_5x5 = conv2d_relu(
-                    inputs, size = 1, n_filters = n_reduce_5x5,
-                    stride = 1,
-                    regularizer = regularizer,
-                    kernel_init = kernel_init_reduce,
-                    name = "conv_reduce_5x5")
         fact_5x5_1 = conv2d_relu(
                     reduce_5x5, size = 3, n_filters = n_filters_5x5,
                     stride = 1,
@@ -148,7 +168,7 @@ def grid_fact2d(
                     kernel_init = kernel_init_reduce,
                     name = "conv_pool_proj")
         
-        inception = tf.concat([x_1x1,x_3x3,fact_5x5_2,proj_pool], axis = 3)
+        inception = tf.concat([x_1x1,x_3x3,fact_5x5_2,proj_pool], axis = channel_axis())
         
     return inception
 
@@ -170,26 +190,22 @@ def grid_fact2d_bn(
         regularizer = None,
         kernel_init = He_normal(seed = 42),
         kernel_init_reduce = He_normal(seed = 42),
+        fused = False,
         name = "inception_grid_2d_factorized_batchnorm"
         ):
     with tf.variable_scope(name):
-        # 1x1
-        x_1x1 = conv2d_bn_relu(
-                    inputs, size = 1, n_filters = n_filters_1x1,
-                    stride = 1,
-                    is_training = is_training,
-                    regularizer = regularizer,
-                    kernel_init = kernel_init,
-                    name = "conv_1x1")
+        # 1x1 and reductions
+        x_1x1, reduce_3x3, reduce_5x5 = _conv_1x1(
+                inputs,
+                [n_filters_1x1, n_reduce_3x3, n_reduce_5x5],
+                ["conv_1x1", "conv_reduce_3x3", "conv_reduce_5x5"],
+                kernel_inits = [kernel_init, kernel_init_reduce, kernel_init_reduce],
+                batch_norm = True,
+                fused = fused,
+                is_training = is_training,
+                regularizer = regularizer)
         
         # 3x3
-        reduce_3x3 = conv2d_bn_relu(
-                    inputs, size = 1, n_filters = n_reduce_3x3,
-                    stride = 1,
-                    is_training = is_training,
-                    regularizer = regularizer,
-                    kernel_init = kernel_init_reduce,
-                    name = "conv_reduce_3x3")
         x_3x3 = conv2d_bn_relu(
                     reduce_3x3, size = 3, n_filters = n_filters_3x3,
                     stride = 1,
@@ -199,13 +215,6 @@ def grid_fact2d_bn(
                     name = "conv_3x3")
         
         # factorized 5x5
-        reduce_5x5 = conv2d_bn_relu(
-                    inputs, size = 1, n_filters = n_reduce_5x5,
-                    stride = 1,
-                    is_training = is_training,
-                    regularizer = regularizer,
-                    kernel_init = kernel_init_reduce,
-                    name = "conv_reduce_5x5")
         fact_5x5_1 = conv2d_bn_relu(
                     reduce_5x5, size = 3, n_filters = n_filters_5x5,
                     stride = 1,
@@ -231,7 +240,7 @@ def grid_fact2d_bn(
                     kernel_init = kernel_init_reduce,
                     name = "conv_pool_proj")
         
-        inception = tf.concat([x_1x1,x_3x3,fact_5x5_2,proj_pool], axis = 3)
+        inception = tf.concat([x_1x1,x_3x3,fact_5x5_2,proj_pool], axis = channel_axis())
         
     return inception
 
@@ -254,26 +263,20 @@ def grid_fact1d_bn(
         regularizer = None,
         kernel_init = He_normal(seed = 42),
         kernel_init_reduce = He_normal(seed = 42),
+        fused = False,
         name = "inception_grid_1d_factorized_batchnorm"
         ):
     with tf.variable_scope(name):
-        # 1x1
-        x_1x1 = conv2d_bn_relu(
-                    inputs, size = 1, n_filters = n_filters_1x1,
-                    stride = 1,
-                    is_training = is_training,
-                    regularizer = regularizer,
-                    kernel_init = kernel_init,
-                    name = "conv_1x1")
-
-        # 1x7 + 7x1
-        reduce_7x7_1 = conv2d_bn_relu(
-                    inputs, size = 1, n_filters = n_reduce_7x7_1,
-                    stride = 1,
-                    is_training = is_training,
-                    regularizer = regularizer,
-                    kernel_init = kernel_init_reduce,
-                    name = "conv_reduce_7x7_1")
+        # 1x1 and reductions
+        x_1x1, reduce_7x7_1, reduce_7x7_2 = _conv_1x1(
+                inputs,
+                [n_filters_1x1, n_reduce_7x7_1, n_reduce_7x7_2],
+                ["conv_1x1", "conv_reduce_7x7_1", "conv_reduce_7x7_2"],
+                kernel_inits = [kernel_init, kernel_init_reduce, kernel_init_reduce],
+                batch_norm = True,
+                fused = fused,
+                is_training = is_training,
+                regularizer = regularizer)
         
         x_7x7_1 = factorized_conv2d_bn_relu(
                     reduce_7x7_1, size = 7, n_repeat = 1,
@@ -283,17 +286,7 @@ def grid_fact1d_bn(
                     regularizer = regularizer,
                     kernel_init = kernel_init,
                     name = "conv_fact_7x7_1")
-       
-        # 1x7 + 7x1 + 1x7 + 7x1        
-        reduce_7x7_2 = conv2d_bn_relu(
-                    inputs, size = 1, n_filters = n_reduce_7x7_2,
-                    stride = 1,
-                    is_training = is_training,
-                    regularizer = regularizer,
-                    kernel_init = kernel_init_reduce,
-                    name = "conv_reduce_7x7_2")
-
-
+        
         x_7x7_2 = factorized_conv2d_bn_relu(
                     reduce_7x7_2, size = 7, n_repeat = 2,
                     n_filters = n_filters_7x7_2,
@@ -313,7 +306,7 @@ def grid_fact1d_bn(
                     kernel_init = kernel_init_reduce,
                     name = "conv_pool_proj")
         
-        inception = tf.concat([x_1x1,x_7x7_1,x_7x7_2,proj_pool], axis = 3)
+        inception = tf.concat([x_1x1,x_7x7_1,x_7x7_2,proj_pool], axis = channel_axis())
         
     return inception
 
@@ -337,26 +330,22 @@ def expanded_filterbank_bn(
         regularizer = None,
         kernel_init = He_normal(seed = 42),
         kernel_init_reduce = He_normal(seed = 42),
+        fused = False,
         name = "inception_expanded_filterbank_batchnorm"
         ):
     with tf.variable_scope(name):
-        # 1x1
-        x_1x1 = conv2d_bn_relu(
-                    inputs, size = 1, n_filters = n_filters_1x1,
-                    stride = 1,
-                    is_training = is_training,
-                    regularizer = regularizer,
-                    kernel_init = kernel_init,
-                    name = "conv_1x1")
+        # 1x1 and reductions
+        x_1x1, reduce_1x3_3x1, reduce_3x3 = _conv_1x1(
+                inputs,
+                [n_filters_1x1, n_reduce_1x3_3x1, n_reduce_3x3],
+                ["conv_1x1", "conv_reduce_1x3_3x1", "conv_reduce_3x3"],
+                kernel_inits = [kernel_init, kernel_init_reduce, kernel_init_reduce],
+                batch_norm = True,
+                fused = fused,
+                is_training = is_training,
+                regularizer = regularizer)
         
         # 1x3 + 3x1
-        reduce_1x3_3x1 = conv2d_bn_relu(
-                    inputs, size = 1, n_filters = n_reduce_1x3_3x1,
-                    stride = 1,
-                    is_training = is_training,
-                    regularizer = regularizer,
-                    kernel_init = kernel_init_reduce,
-                    name = "conv_reduce_1x3_3x1")
         x_1x3 = conv2d_bn_relu(
                     reduce_1x3_3x1, size = [1,3], n_filters = n_filters_1x3_3x1,
                     stride = 1,
@@ -373,13 +362,6 @@ def expanded_filterbank_bn(
                     name = "conv_3x1")
         
         # 3x3 + (1x3 + 3x1)
-        reduce_3x3 = conv2d_bn_relu(
-                    inputs, size = 1, n_filters = n_reduce_3x3,
-                    stride = 1,
-                    is_training = is_training,
-                    regularizer = regularizer,
-                    kernel_init = kernel_init_reduce,
-                    name = "conv_reduce_3x3")
         x_3x3 = conv2d_bn_relu(
                     reduce_3x3, size = 3, n_filters = n_filters_3x3,
                     stride = 1,
@@ -411,7 +393,7 @@ def expanded_filterbank_bn(
                     kernel_init = kernel_init_reduce,
                     name = "conv_pool_proj")
         
-        inception = tf.concat([x_1x1,x_1x3,x_3x1,x_3x3_1x3,x_3x3_3x1,proj_pool], axis = 3)
+        inception = tf.concat([x_1x1,x_1x3,x_3x1,x_3x3_1x3,x_3x3_3x1,proj_pool], axis = channel_axis())
         
     return inception
 
@@ -437,26 +419,22 @@ def expanded_filterbank_fact1d_bn(
         regularizer = None,
         kernel_init = He_normal(seed = 42),
         kernel_init_reduce = He_normal(seed = 42),
+        fused = False,
         name = "inception_expanded_filterbank_batchnorm"
         ):
     with tf.variable_scope(name):
-        # 1x1
-        x_1x1 = conv2d_bn_relu(
-                    inputs, size = 1, n_filters = n_filters_1x1,
-                    stride = 1,
-                    is_training = is_training,
-                    regularizer = regularizer,
-                    kernel_init = kernel_init,
-                    name = "conv_1x1")
+        # 1x1 and reductions
+        x_1x1, reduce_1x3_3x1, reduce_1x3 = _conv_1x1(
+                inputs,
+                [n_filters_1x1, n_reduce_1x3_3x1, n_reduce_1x3],
+                ["conv_1x1", "conv_reduce_1x3_3x1", "conv_reduce_1x3"],
+                kernel_inits = [kernel_init, kernel_init_reduce, kernel_init_reduce],
+                batch_norm = True,
+                fused = fused,
+                is_training = is_training,
+                regularizer = regularizer)
         
         # 1x3 + 3x1
-        reduce_1x3_3x1 = conv2d_bn_relu(
-                    inputs, size = 1, n_filters = n_reduce_1x3_3x1,
-                    stride = 1,
-                    is_training = is_training,
-                    regularizer = regularizer,
-                    kernel_init = kernel_init_reduce,
-                    name = "conv_reduce_1x3_3x1")
         x_1x3 = conv2d_bn_relu(
                     reduce_1x3_3x1, size = [1,3], n_filters = n_filters_1x3_3x1,
                     stride = 1,
@@ -473,13 +451,6 @@ def expanded_filterbank_fact1d_bn(
                     name = "conv_3x1_1")
         
         # 1x3 + 3x1 + (1x3 + 3x1)
-        reduce_1x3 = conv2d_bn_relu(
-                    inputs, size = 1, n_filters = n_reduce_1x3,
-                    stride = 1,
-                    is_training = is_training,
-                    regularizer = regularizer,
-                    kernel_init = kernel_init_reduce,
-                    name = "conv_reduce_1x3")
         x_1x3_2 = conv2d_bn_relu(
                     reduce_1x3, size = [1,3], n_filters = n_filters_1x3,
                     stride = 1,
@@ -518,7 +489,7 @@ def expanded_filterbank_fact1d_bn(
                     kernel_init = kernel_init_reduce,
                     name = "conv_pool_proj")
         
-        inception = tf.concat([x_1x1,x_1x3,x_3x1,x_3x3_1x3,x_3x3_3x1,proj_pool], axis = 3)
+        inception = tf.concat([x_1x1,x_1x3,x_3x1,x_3x3_1x3,x_3x3_3x1,proj_pool], axis = channel_axis())
         
     return inception
 
@@ -540,17 +511,22 @@ def reduction_bn(
         regularizer = None,
         kernel_init = He_normal(seed = 42),
         kernel_init_reduce = He_normal(seed = 42),
+        fused = False,
         name = "inception_reduction_batchnorm"
         ):
     with tf.variable_scope(name):
+        # 1x1 reductions
+        reduce_3x3_1, reduce_3x3_2 = _conv_1x1(
+                inputs,
+                [n_reduce_3x3_1, n_reduce_3x3_2],
+                ["conv_reduce_3x3_1", "conv_reduce_3x3_2"],
+                kernel_inits = [kernel_init_reduce, kernel_init_reduce],
+                batch_norm = True,
+                fused = fused,
+                is_training = is_training,
+                regularizer = regularizer)
+        
         # 3x3 stride 2
-        reduce_3x3_1 = conv2d_bn_relu(
-                    inputs, size = 1, n_filters = n_reduce_3x3_1,
-                    stride = 1,
-                    is_training = is_training,
-                    regularizer = regularizer,
-                    kernel_init = kernel_init_reduce,
-                    name = "conv_reduce_3x3_1")
         x_3x3_1 = conv2d_bn_relu(
                     reduce_3x3_1, size = 3, n_filters = n_filters_3x3_1,
                     stride = 2,
@@ -560,13 +536,6 @@ def reduction_bn(
                     name = "conv_3x3_1")        
         
         # 3x3 stride 1 + 3x3 stride 2
-        reduce_3x3_2 = conv2d_bn_relu(
-                    inputs, size = 1, n_filters = n_reduce_3x3_2,
-                    stride = 1,
-                    is_training = is_training,
-                    regularizer = regularizer,
-                    kernel_init = kernel_init_reduce,
-                    name = "conv_reduce_3x3_2")
         x_3x3_2_1 = conv2d_bn_relu(
                     reduce_3x3_2, size = 3, n_filters = n_filters_3x3_2_1,
                     stride = 1,
@@ -585,7 +554,7 @@ def reduction_bn(
         # pool
         pool = pool(inputs, size = pool_size, stride = 2, name = "pool")
 
-        inception = tf.concat([x_3x3_1, x_3x3_2_2, pool], axis = 3)
+        inception = tf.concat([x_3x3_1, x_3x3_2_2, pool], axis = channel_axis())
         
     return inception
 
@@ -650,7 +619,7 @@ def reduction_bn_v4_1(
                 inputs, size = pool_size, stride = 2,
                 padding = padding, name = "pool")
 
-        inception = tf.concat([x_3x3_1, x_3x3_2_2, pool], axis = 3)
+        inception = tf.concat([x_3x3_1, x_3x3_2_2, pool], axis = channel_axis())
         
     return inception
 
@@ -675,17 +644,22 @@ def reduction_bn_v4_2(
         regularizer = None,
         kernel_init = He_normal(seed = 42),
         kernel_init_reduce = He_normal(seed = 42),
+        fused = False,
         name = "inception_v4_reduction_2"
         ):
     with tf.variable_scope(name):
+        # 1x1 reductions
+        reduce_3x3, reduce_7x7 = _conv_1x1(
+                inputs,
+                [n_reduce_3x3, n_reduce_7x7],
+                ["conv_reduce_3x3", "conv_reduce_7x7"],
+                kernel_inits = [kernel_init_reduce, kernel_init_reduce],
+                batch_norm = True,
+                fused = fused,
+                is_training = is_training,
+                regularizer = regularizer)
+        
         # 3x3 stride 2
-        reduce_3x3 = conv2d_bn_relu(
-                    inputs, size = 1, n_filters = n_reduce_3x3,
-                    stride = 1,
-                    is_training = is_training,
-                    regularizer = regularizer,
-                    kernel_init = kernel_init_reduce,
-                    name = "conv_reduce_3x3")
         x_3x3 = conv2d_bn_relu(
                     reduce_3x3, size = 3, n_filters = n_filters_3x3,
                     stride = 2,
@@ -696,13 +670,6 @@ def reduction_bn_v4_2(
                     name = "conv_3x3")        
         
         # 1x7 + 7x1 + 3x3 stride 2
-        reduce_7x7 = conv2d_bn_relu(
-                    inputs, size = 1, n_filters = n_reduce_7x7,
-                    stride = 1,
-                    is_training = is_training,
-                    regularizer = regularizer,
-                    kernel_init = kernel_init_reduce,
-                    name = "conv_reduce_7x7")
         x_1x7 = conv2d_bn_relu(
                     reduce_7x7, size = [1,7], n_filters = n_filters_1x7,
                     stride = 1,
@@ -731,7 +698,7 @@ def reduction_bn_v4_2(
                 inputs, size = pool_size, stride = 2,
                 padding = padding, name = "pool")
 
-        inception = tf.concat([x_3x3, x_7x7_3x3, pool], axis = 3)
+        inception = tf.concat([x_3x3, x_7x7_3x3, pool], axis = channel_axis())
         
     return inception
 
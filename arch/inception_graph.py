@@ -2,13 +2,14 @@
 # -*- coding: utf-8 -*-
 
 import tensorflow as tf
+from functools import partial
 from arch.layers import conv2d_bn_relu, conv2d_relu, max_pool2d, avg_pool2d, global_avg_pool2d, dense
 from arch.initializers import He_normal, Kumar_normal
 from arch import inception
 
 
 #https://arxiv.org/pdf/1409.4842v1.pdf
-def cifar10_inception_v1(x, drop_rate = 0.4, seed = 42):
+def cifar10_inception_v1(x, drop_rate = 0.4, fused = False, seed = 42):
     layers = []
     variables = []
 
@@ -33,6 +34,7 @@ def cifar10_inception_v1(x, drop_rate = 0.4, seed = 42):
                     n_filters_pool = 32,
                     kernel_init = He_normal(seed = seed+2),
                     kernel_init_reduce = He_normal(seed = seed+2),
+                    fused = fused,
                     name = "inception_grid_3a"
                     )
     layers.append(("grid_3a", grid_3a))
@@ -48,6 +50,7 @@ def cifar10_inception_v1(x, drop_rate = 0.4, seed = 42):
                     n_filters_pool = 64,
                     kernel_init = He_normal(seed = seed+3),
                     kernel_init_reduce = He_normal(seed = seed+3),
+                    fused = fused,
                     name = "inception_grid_3b"
                     )
     layers.append(("grid_3b", grid_3b))
@@ -67,6 +70,7 @@ def cifar10_inception_v1(x, drop_rate = 0.4, seed = 42):
                     n_filters_pool = 64,
                     kernel_init = He_normal(seed = seed+4),
                     kernel_init_reduce = He_normal(seed = seed+4),
+                    fused = fused,
                     name = "inception_grid_4a"
                     )
     layers.append(("grid_4a", grid_4a))
@@ -82,6 +86,7 @@ def cifar10_inception_v1(x, drop_rate = 0.4, seed = 42):
                     n_filters_pool = 64,
                     kernel_init = He_normal(seed = seed+5),
                     kernel_init_reduce = He_normal(seed = seed+5),
+                    fused = fused,
                     name = "inception_grid_4d"
                     )
     layers.append(("grid_4d", grid_4d))
@@ -101,6 +106,7 @@ def cifar10_inception_v1(x, drop_rate = 0.4, seed = 42):
                     n_filters_pool = 128,
                     kernel_init = He_normal(seed = seed+6),
                     kernel_init_reduce = He_normal(seed = seed+6),
+                    fused = fused,
                     name = "inception_grid_5a" 
                     )
     layers.append(("grid_5a", grid_5a))
@@ -116,6 +122,7 @@ def cifar10_inception_v1(x, drop_rate = 0.4, seed = 42):
                     n_filters_pool = 128,
                     kernel_init = He_normal(seed = seed+7),
                     kernel_init_reduce = He_normal(seed = seed+7),
+                    fused = fused,
                     name = "inception_grid_5b" 
                     )
     layers.append(("grid_5b", grid_5b))
@@ -142,7 +149,7 @@ def cifar10_inception_v1(x, drop_rate = 0.4, seed = 42):
 
 # http://proceedings.mlr.press/v37/ioffe15.pdf
 # batch normalized version, and using factorized convolution
-def cifar10_bn_inception_v1(x, seed = 42):
+def cifar10_bn_inception_v1(x, fused = False, seed = 42):
     layers = []
     variables = []
 
@@ -169,6 +176,7 @@ def cifar10_bn_inception_v1(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+2),
                     kernel_init_reduce = He_normal(seed = seed+2),
+                    fused = fused,
                     name = "inception_grid_3a_bn_fact"
                     )
     layers.append(("grid_3a", grid_3a))
@@ -185,6 +193,7 @@ def cifar10_bn_inception_v1(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+3),
                     kernel_init_reduce = He_normal(seed = seed+3),
+                    fused = fused,
                     name = "inception_grid_3b_bn_fact"
                     )
     layers.append(("grid_3b", grid_3b))
@@ -205,6 +214,7 @@ def cifar10_bn_inception_v1(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+4),
                     kernel_init_reduce = He_normal(seed = seed+4),
+                    fused = fused,
                     name = "inception_grid_4a_bn_fact"
                     )
     layers.append(("grid_4a", grid_4a))
@@ -221,6 +231,7 @@ def cifar10_bn_inception_v1(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+5),
                     kernel_init_reduce = He_normal(seed = seed+5),
+                    fused = fused,
                     name = "inception_grid_4d_bn_fact"
                     )
     layers.append(("grid_4d", grid_4d))
@@ -241,6 +252,7 @@ def cifar10_bn_inception_v1(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+6),
                     kernel_init_reduce = He_normal(seed = seed+6),
+                    fused = fused,
                     name = "inception_grid_5a_bn_fact" 
                     )
     layers.append(("grid_5a", grid_5a))
@@ -257,6 +269,7 @@ def cifar10_bn_inception_v1(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+7),
                     kernel_init_reduce = He_normal(seed = seed+7),
+                    fused = fused,
                     name = "inception_grid_5b_bn_fact" 
                     )
     layers.append(("grid_5b", grid_5b))
@@ -279,7 +292,7 @@ def cifar10_bn_inception_v1(x, seed = 42):
 #https://arxiv.org/pdf/1512.00567.pdf
 #https://github.com/keras-team/keras/blob/master/keras/applications/inception_v3.py
 #https://github.com/tensorflow/tensorflow/blob/master/tensorflow/contrib/slim/python/slim/nets/inception_v3.py
-def cifar10_inception_v2(x, seed = 42):
+def cifar10_inception_v2(x, fused = False, seed = 42):
     layers = []
     variables = []
 
@@ -306,6 +319,7 @@ def cifar10_inception_v2(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+2),
                     kernel_init_reduce = He_normal(seed = seed+2),
+                    fused = fused,
                     name = "inception_grid_2a_bn_fact"
                     )
     layers.append(("grid_2a", grid_2a))
@@ -322,6 +336,7 @@ def cifar10_inception_v2(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+3),
                     kernel_init_reduce = He_normal(seed = seed+3),
+                    fused = fused,
                     name = "inception_grid_2b_bn_fact"
                     )
     layers.append(("grid_2b", grid_2b))
@@ -337,6 +352,7 @@ def cifar10_inception_v2(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+4),
                     kernel_init_reduce = He_normal(seed = seed+4),
+                    fused = fused,
                     name = "reduction_1")
     layers.append(("reduction1", reduction1))
     
@@ -352,6 +368,7 @@ def cifar10_inception_v2(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+5),
                     kernel_init_reduce = He_normal(seed = seed+5),
+                    fused = fused,
                     name = "inception_grid_4a_bn_fact"
                     )
     layers.append(("grid_4a", grid_4a))
@@ -368,6 +385,7 @@ def cifar10_inception_v2(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+6),
                     kernel_init_reduce = He_normal(seed = seed+6),
+                    fused = fused,
                     name = "inception_grid_4b_bn_fact"
                     )
     layers.append(("grid_4b", grid_4b))
@@ -384,6 +402,7 @@ def cifar10_inception_v2(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+7),
                     kernel_init_reduce = He_normal(seed = seed+7),
+                    fused = fused,
                     name = "reduction_2")
     layers.append(("reduction2", reduction2))
 
@@ -400,6 +419,7 @@ def cifar10_inception_v2(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+8),
                     kernel_init_reduce = He_normal(seed = seed+8),
+                    fused = fused,
                     name = "inception_filterbank_6a_bn" 
                     )
     layers.append(("fb_6a", fb_6a))
@@ -417,6 +437,7 @@ def cifar10_inception_v2(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+9),
                     kernel_init_reduce = He_normal(seed = seed+9),
+                    fused = fused,
                     name = "inception_filterbank_6b_bn" 
                     )
     layers.append(("fb_6b", fb_6b))
@@ -440,7 +461,7 @@ def cifar10_inception_v2(x, seed = 42):
 #https://github.com/keras-team/keras/blob/master/keras/applications/inception_v3.py
 #https://github.com/tensorflow/tensorflow/blob/master/tensorflow/contrib/slim/python/slim/nets/inception_v3.py
 # same as v2 + bn_auxiliary + label smoothing
-def cifar10_inception_v3(x, seed = 42):
+def cifar10_inception_v3(x, fused = False, seed = 42):
     layers = []
     variables = []
 
@@ -467,6 +488,7 @@ def cifar10_inception_v3(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+2),
                     kernel_init_reduce = He_normal(seed = seed+2),
+                    fused = fused,
                     name = "inception_grid_2a_bn_fact"
                     )
     layers.append(("grid_2a", grid_2a))
@@ -483,6 +505,7 @@ def cifar10_inception_v3(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+3),
                     kernel_init_reduce = He_normal(seed = seed+3),
+                    fused = fused,
                     name = "inception_grid_2b_bn_fact"
                     )
     layers.append(("grid_2b", grid_2b))
@@ -498,6 +521,7 @@ def cifar10_inception_v3(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+4),
                     kernel_init_reduce = He_normal(seed = seed+4),
+                    fused = fused,
                     name = "reduction_1")
     layers.append(("reduction1", reduction1))
     
@@ -513,6 +537,7 @@ def cifar10_inception_v3(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+5),
                     kernel_init_reduce = He_normal(seed = seed+5),
+                    fused = fused,
                     name = "inception_grid_4a_bn_fact"
                     )
     layers.append(("grid_4a", grid_4a))
@@ -529,6 +554,7 @@ def cifar10_inception_v3(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+6),
                     kernel_init_reduce = He_normal(seed = seed+6),
+                    fused = fused,
                     name = "inception_grid_4b_bn_fact"
                     )
     layers.append(("grid_4b", grid_4b))
@@ -562,6 +588,7 @@ def cifar10_inception_v3(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+7),
                     kernel_init_reduce = He_normal(seed = seed+7),
+                    fused = fused,
                     name = "reduction_2")
     layers.append(("reduction2", reduction2))
 
@@ -578,6 +605,7 @@ def cifar10_inception_v3(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+8),
                     kernel_init_reduce = He_normal(seed = seed+8),
+                    fused = fused,
                     name = "inception_filterbank_6a_bn" 
                     )
     layers.append(("fb_6a", fb_6a))
@@ -595,6 +623,7 @@ def cifar10_inception_v3(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+9),
                     kernel_init_reduce = He_normal(seed = seed+9),
+                    fused = fused,
                     name = "inception_filterbank_6b_bn" 
                     )
     layers.append(("fb_6b", fb_6b))
@@ -616,7 +645,7 @@ def cifar10_inception_v3(x, seed = 42):
 
 # Szegedy et al., Inception-v4, Inception-ResNet and the Impact of Residual Connections on Learning
 # https://arxiv.org/pdf/1602.07261.pdf
-def cifar10_inception_v4(x, seed = 42):
+def cifar10_inception_v4(x, fused = False, seed = 42):
     layers = []
     variables = []
 
@@ -644,6 +673,7 @@ def cifar10_inception_v4(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+2),
                     kernel_init_reduce = He_normal(seed = seed+2),
+                    fused = fused,
                     name = "inception_grid_2a_bn_fact"
                     )
     layers.append(("grid_2a", grid_2a))
@@ -661,6 +691,7 @@ def cifar10_inception_v4(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+3),
                     kernel_init_reduce = He_normal(seed = seed+3),
+                    fused = fused,
                     name = "inception_grid_2b_bn_fact"
                     )
     layers.append(("grid_2b", grid_2b))
@@ -692,6 +723,7 @@ def cifar10_inception_v4(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+5),
                     kernel_init_reduce = He_normal(seed = seed+5),
+                    fused = fused,
                     name = "inception_grid_4a_bn_fact"
                     )
     layers.append(("grid_4a", grid_4a))
@@ -709,6 +741,7 @@ def cifar10_inception_v4(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+6),
                     kernel_init_reduce = He_normal(seed = seed+6),
+                    fused = fused,
                     name = "inception_grid_4b_bn_fact"
                     )
     layers.append(("grid_4b", grid_4b))
@@ -726,6 +759,7 @@ def cifar10_inception_v4(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+7),
                     kernel_init_reduce = He_normal(seed = seed+7),
+                    fused = fused,
                     name = "reduction_2")
     layers.append(("reduction2", reduction2))
 
@@ -743,6 +777,7 @@ def cifar10_inception_v4(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+8),
                     kernel_init_reduce = He_normal(seed = seed+8),
+                    fused = fused,
                     name = "inception_filterbank_6a_bn" 
                     )
     layers.append(("fb_6a", fb_6a))
@@ -761,6 +796,7 @@ def cifar10_inception_v4(x, seed = 42):
                     is_training = training,
                     kernel_init = He_normal(seed = seed+9),
                     kernel_init_reduce = He_normal(seed = seed+9),
+                    fused = fused,
                     name = "inception_filterbank_6b_bn" 
                     )
     layers.append(("fb_6b", fb_6b))
@@ -780,9 +816,12 @@ def cifar10_inception_v4(x, seed = 42):
     return layers, variables
 
 
+cifar10_inception_v1_fused = partial(cifar10_inception_v1, fused = True)
 
+cifar10_bn_inception_v1_fused = partial(cifar10_bn_inception_v1, fused = True)
 
+cifar10_inception_v2_fused = partial(cifar10_inception_v2, fused = True)
 
+cifar10_inception_v3_fused = partial(cifar10_inception_v3, fused = True)
 
-
-
+cifar10_inception_v4_fused = partial(cifar10_inception_v4, fused = True)
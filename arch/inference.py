@@ -0,0 +1,514 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import tensorflow as tf
+from util.misc import tuple_list_find
+from arch.io import Checkpoint
+from arch.layers import with_data_format
+
+
+_BATCH_NORM_OPS = ("FusedBatchNorm", "FusedBatchNormV2", "FusedBatchNormV3")
+
+_LINEAR_OPS = ("Conv2D", "DepthwiseConv2dNative", "MatMul")
+
+# elementwise ops evaluated on constant inputs by fold_constants
+_FOLDABLE_OPS = {
+        'Identity': lambda x: x,
+        'Add': np.add,
+        'AddV2': np.add,
+        'Sub': np.subtract,
+        'Mul': np.multiply,
+        'RealDiv': np.divide,
+        'Neg': np.negative,
+        'Square': np.square,
+        'Sqrt': np.sqrt,
+        'Rsqrt': lambda x: 1.0 / np.sqrt(x),
+        'Reciprocal': np.reciprocal,
+        'Maximum': np.maximum,
+        'Minimum': np.minimum,
+        'Reshape': np.reshape,
+        'GatherV2': lambda params, indices, axis: np.take(params, indices, axis = int(axis))}
+
+# ops which can absorb a permutation of their input channels into their
+# constant weights
+_PERMUTABLE_OPS = ("Conv2D", "DepthwiseConv2dNative")
+
+
+def _parse_input(name):
+    """Splits an input string of a node into the node name, the output index
+    and a flag of control dependencies.
+    """
+    if name.startswith("^"):
+        return name[1:], -1, True
+    if ":" in name:
+        node_name, port = name.rsplit(":", 1)
+        return node_name, int(port), False
+    return name, 0, False
+
+
+def _tensor_key(name):
+    node_name, port, _ = _parse_input(name)
+    return node_name + ":" + str(port)
+
+
+def _sorted_nodes(graph_def):
+    """Returns the nodes of a graph in topological order."""
+    nodes = {node.name: node for node in graph_def.node}
+    order = []
+    state = dict()
+    for root in graph_def.node:
+        stack = [(root.name, False)]
+        while stack:
+            name, done = stack.pop()
+            if done:
+                state[name] = 2
+                order.append(nodes[name])
+                continue
+            if state.get(name, 0) != 0:
+                continue
+            state[name] = 1
+            stack.append((name, True))
+            for inp in nodes[name].input:
+                inp_name = _parse_input(inp)[0]
+                if (inp_name in nodes) and (state.get(inp_name, 0) == 0):
+                    stack.append((inp_name, False))
+    return order
+
+
+def _consumers(graph_def):
+    """Counts the data consumers of each tensor and node."""
+    counts = dict()
+    for node in graph_def.node:
+        for inp in node.input:
+            node_name, port, control = _parse_input(inp)
+            if control:
+                continue
+            key = node_name + ":" + str(port)
+            counts[key] = counts.get(key, 0) + 1
+            counts[node_name] = counts.get(node_name, 0) + 1
+    return counts
+
+
+def _const_value(nodes, name):
+    """Returns the value of a constant tensor (also through Identity nodes),
+    or None if the tensor is not constant.
+    """
+    node_name, port, _ = _parse_input(name)
+    node = nodes.get(node_name)
+    while (node is not None) and (node.op == "Identity"):
+        node = nodes.get(_parse_input(node.input[0])[0])
+    if (node is None) or (node.op != "Const") or (port != 0):
+        return None
+    return tf.make_ndarray(node.attr["value"].tensor)
+
+
+def _set_const(node, value):
+    """Turns a node into a constant of the given value keeping its dtype."""
+    for key in ("dtype", "T", "Tparams"):
+        if key in node.attr:
+            dtype = tf.as_dtype(node.attr[key].type)
+            break
+    node.op = "Const"
+    del node.input[:]
+    for key in list(node.attr.keys()):
+        del node.attr[key]
+    node.attr["dtype"].type = dtype.as_datatype_enum
+    node.attr["value"].tensor.CopyFrom(
+            tf.make_tensor_proto(np.asarray(value, dtype = dtype.as_numpy_dtype),
+                                 dtype = dtype))
+
+
+def _set_identity(node, inp, dtype):
+    """Turns a node into an identity of a tensor."""
+    node.op = "Identity"
+    del node.input[:]
+    node.input.append(inp)
+    for key in list(node.attr.keys()):
+        del node.attr[key]
+    node.attr["T"].type = dtype
+
+
+def freeze_graph(session, output_names, training_name = "training"):
+    """Converts the variables of the graph of a session into constants, and
+    the training placeholder into a constant False.
+    Args:
+        session: A TensorFlow session holding the trained variables.
+        output_names: A list of the names of the output operations.
+        training_name: The name of the boolean training placeholder.
+    Returns:
+        A frozen GraphDef.
+    """
+    graph_def = tf.graph_util.convert_variables_to_constants(
+            session, session.graph.as_graph_def(), list(output_names))
+    for node in graph_def.node:
+        if (node.name == training_name) and (node.op == "Placeholder"):
+            _set_const(node, False)
+    return graph_def
+
+
+def prune_training_branches(graph_def):
+    """Removes the branches of conditionals (e.g. of batch normalization and
+    dropout) which are not taken due to a constant predicate, and the Switch
+    and Merge nodes of these conditionals.
+    Args:
+        graph_def: A GraphDef.
+    Returns:
+        A new GraphDef.
+    """
+    nodes = {node.name: node for node in graph_def.node}
+    alias = dict()  # tensor -> replacing tensor
+    dead = set()  # dead tensors and nodes
+    removed = set()  # resolved Switch and Merge nodes
+
+    def resolve(name):
+        key = _tensor_key(name)
+        while key in alias:
+            key = alias[key]
+        return key
+
+    for node in _sorted_nodes(graph_def):
+        data_inputs = [inp for inp in node.input if not inp.startswith("^")]
+        control_inputs = [inp[1:] for inp in node.input if inp.startswith("^")]
+        if node.op == "Merge":
+            live = [inp for inp in data_inputs if resolve(inp) not in dead]
+            if len(live) == 1:
+                alias[node.name + ":0"] = resolve(live[0])
+                removed.add(node.name)
+            elif not live:
+                dead.update([node.name, node.name + ":0", node.name + ":1"])
+            continue
+        is_dead = any(resolve(inp) in dead for inp in data_inputs) or \
+                  any(inp in dead for inp in control_inputs)
+        if is_dead:
+            dead.update([node.name] + [node.name + ":" + str(i) for i in range(8)])
+            continue
+        if node.op == "Switch":
+            pred = _const_value(nodes, resolve(data_inputs[1]))
+            if pred is not None:
+                live_port = 1 if bool(pred) else 0
+                alias[node.name + ":" + str(live_port)] = resolve(data_inputs[0])
+                dead.add(node.name + ":" + str(1-live_port))
+                removed.add(node.name)
+
+    pruned = tf.GraphDef()
+    pruned.versions.CopyFrom(graph_def.versions)
+    pruned.library.CopyFrom(graph_def.library)
+    for node in graph_def.node:
+        if (node.name in dead) or (node.name in removed):
+            continue
+        new_node = pruned.node.add()
+        new_node.CopyFrom(node)
+        del new_node.input[:]
+        for inp in node.input:
+            node_name, _, control = _parse_input(inp)
+            if control:
+                # without control flow constants need no control inputs
+                if (node_name not in removed) and (node.op != "Const"):
+                    new_node.input.append(inp)
+            else:
+                key = resolve(inp)
+                new_node.input.append(key[:-2] if key.endswith(":0") else key)
+    return pruned
+
+
+def fold_constants(graph_def):
+    """Evaluates the elementwise operations with constant inputs (e.g. the
+    scale and shift of batch normalization computed from its statistics).
+    Args:
+        graph_def: A GraphDef.
+    Returns:
+        A new GraphDef.
+    """
+    folded = tf.GraphDef()
+    folded.CopyFrom(graph_def)
+    nodes = {node.name: node for node in folded.node}
+    for node in _sorted_nodes(folded):
+        if (node.op not in _FOLDABLE_OPS) or any(inp.startswith("^") for inp in node.input):
+            continue
+        values = [_const_value(nodes, inp) for inp in node.input]
+        if any(value is None for value in values):
+            continue
+        _set_const(node, _FOLDABLE_OPS[node.op](*values))
+    return folded
+
+
+def _fold_scale_shift(nodes, counts, bias_add, scale, shift):
+    """Folds a per-channel scale and shift into the weights and biases of a
+    convolutional or dense layer, given by its BiasAdd node.
+    Returns:
+        True if folded, False otherwise.
+    """
+    if (bias_add is None) or (bias_add.op != "BiasAdd") or (counts.get(bias_add.name, 0) != 1):
+        return False
+    linear = nodes.get(_parse_input(bias_add.input[0])[0])
+    if (linear is None) or (linear.op not in _LINEAR_OPS) or (counts.get(linear.name, 0) != 1):
+        return False
+    weight_node = nodes.get(_parse_input(linear.input[1])[0])
+    bias_node = nodes.get(_parse_input(bias_add.input[1])[0])
+    for node in (weight_node, bias_node):
+        if (node is None) or (node.op != "Const") or (counts.get(node.name, 0) != 1):
+            return False
+    weights = tf.make_ndarray(weight_node.attr["value"].tensor)
+    biases = tf.make_ndarray(bias_node.attr["value"].tensor)
+    n_out = biases.shape[0]
+    scale = np.broadcast_to(scale, [n_out]).astype(np.float64)
+    shift = np.broadcast_to(shift, [n_out]).astype(np.float64)
+    if linear.op == "DepthwiseConv2dNative":
+        # the output channels are the flattened input channels and multipliers
+        factor = scale.reshape(weights.shape[2], weights.shape[3])
+    elif (linear.op == "MatMul") and linear.attr["transpose_b"].b:
+        factor = scale.reshape(-1, 1)
+    else:
+        factor = scale
+    _set_const(weight_node, weights * factor)
+    _set_const(bias_node, biases * scale + shift)
+    return True
+
+
+def _shuffle_permutation(nodes, counts, node, channel_axis):
+    """Checks whether a node is the last reshape of a channel shuffle
+    (reshape, transpose, reshape), and returns its input and its channel
+    permutation, i.e. channel c of the output is channel permutation[c] of the
+    input. Returns None for other nodes.
+    """
+    if node.op != "Reshape":
+        return None
+    transpose = nodes.get(_parse_input(node.input[0])[0])
+    if (transpose is None) or (transpose.op != "Transpose") or (counts.get(transpose.name, 0) != 1):
+        return None
+    reshape = nodes.get(_parse_input(transpose.input[0])[0])
+    if (reshape is None) or (reshape.op != "Reshape") or (counts.get(reshape.name, 0) != 1):
+        return None
+    shape_in = _const_value(nodes, reshape.input[1])
+    perm = _const_value(nodes, transpose.input[1])
+    shape_out = _const_value(nodes, node.input[1])
+    if (shape_in is None) or (perm is None) or (shape_out is None) or (len(shape_out) != 4):
+        return None
+    if (shape_in[0] != -1) or (shape_out[0] != -1) or \
+       (np.any(shape_in[1:] < 0)) or (np.any(shape_out[1:] < 0)):
+        return None
+    # the index of each input item, moved as the items of a single example
+    shape = [1] + list(shape_out[1:])
+    index = np.arange(np.prod(shape)).reshape(shape)
+    moved = index.reshape([1] + list(shape_in[1:])).transpose(perm).reshape(shape)
+    channels = np.unravel_index(moved[0], shape[1:])[channel_axis-1]
+    if channel_axis == 3:
+        permutation = channels[0, 0, :]
+    else:
+        permutation = channels[:, 0, 0]
+    if not np.array_equal(moved, np.take(index, permutation, axis = channel_axis)):
+        return None
+    return reshape.input[0], permutation
+
+
+def _permute_inputs(nodes, consumers, counts, node, inverse):
+    """Returns the constant weight nodes and their permuted values, which make
+    a Conv2D or a DepthwiseConv2dNative (followed by pointwise Conv2Ds) give
+    the same outputs for inputs with the inverse permutation of channels, or
+    None if the weights are not constant or are shared.
+    """
+    if node.op not in _PERMUTABLE_OPS:
+        return None
+    weight_node = nodes.get(_parse_input(node.input[1])[0])
+    if (weight_node is None) or (weight_node.op != "Const") or (counts.get(weight_node.name, 0) != 1):
+        return None
+    weights = tf.make_ndarray(weight_node.attr["value"].tensor)
+    updates = [(weight_node, np.take(weights, inverse, axis = 2))]
+    if node.op == "Conv2D":
+        return updates
+    # the depthwise outputs are permuted too, in blocks of the multiplier
+    multiplier = weights.shape[3]
+    for consumer in consumers.get(node.name, []):
+        if (consumer.op != "Conv2D") or (_parse_input(consumer.input[0])[0] != node.name):
+            return None
+        point_node = nodes.get(_parse_input(consumer.input[1])[0])
+        if (point_node is None) or (point_node.op != "Const") or (counts.get(point_node.name, 0) != 1):
+            return None
+        points = tf.make_ndarray(point_node.attr["value"].tensor)
+        if points.shape[:2] != (1, 1):
+            return None
+        blocks = points.reshape(1, 1, -1, multiplier, points.shape[3])
+        updates.append((point_node, np.take(blocks, inverse, axis = 2).reshape(points.shape)))
+    return updates
+
+
+def fold_channel_shuffles(graph_def):
+    """Removes the channel shuffles (e.g. of ShuffleNet) followed only by
+    convolutions with constant weights, by permuting the input channels of
+    the weights instead. Depthwise convolutions are handled together with the
+    pointwise convolutions of their outputs, as in separable convolutions.
+    Args:
+        graph_def: A GraphDef, the weights folded by fold_constants.
+    Returns:
+        A tuple of the new GraphDef and the number of removed shuffles.
+    """
+    folded = tf.GraphDef()
+    folded.CopyFrom(graph_def)
+    nodes = {node.name: node for node in folded.node}
+    counts = _consumers(folded)
+    consumers = dict()
+    for node in folded.node:
+        for inp in node.input:
+            node_name, _, control = _parse_input(inp)
+            if not control:
+                consumers.setdefault(node_name, []).append(node)
+    n_folded = 0
+    for node in _sorted_nodes(folded):
+        users = consumers.get(node.name, [])
+        if (not users) or any(user.op not in _PERMUTABLE_OPS for user in users):
+            continue
+        formats = set(user.attr["data_format"].s for user in users)
+        if len(formats) != 1:
+            continue
+        channel_axis = 1 if formats.pop() == b"NCHW" else 3
+        shuffle = _shuffle_permutation(nodes, counts, node, channel_axis)
+        if shuffle is None:
+            continue
+        inp, permutation = shuffle
+        inverse = np.argsort(permutation)
+        updates = []
+        for user in users:
+            user_updates = None
+            if _parse_input(user.input[0])[0] == node.name:
+                user_updates = _permute_inputs(nodes, consumers, counts, user, inverse)
+            if user_updates is None:
+                updates = None
+                break
+            updates.extend(user_updates)
+        if updates is None:
+            continue
+        for weight_node, value in updates:
+            _set_const(weight_node, value)
+        _set_identity(node, inp, node.attr["T"].type)
+        n_folded = n_folded + 1
+    return folded, n_folded
+
+
+def fold_batch_norms(graph_def):
+    """Folds batch normalizations in inference mode into the weights and
+    biases of the preceding convolutional (conv2d, separable, depthwise) or
+    dense layers. Both the fused batch normalization of the convolutional
+    layers, and the scale and shift form of the non-fused version (after
+    fold_constants) are handled. The other batch normalizations (e.g. after
+    activations or concatenations) are left unchanged.
+    Args:
+        graph_def: A GraphDef, pruned by prune_training_branches.
+    Returns:
+        A tuple of the new GraphDef and the number of folded layers.
+    """
+    folded = tf.GraphDef()
+    folded.CopyFrom(graph_def)
+    nodes = {node.name: node for node in folded.node}
+    counts = _consumers(folded)
+    n_folded = 0
+    for node in _sorted_nodes(folded):
+        if (node.op in _BATCH_NORM_OPS) and not node.attr["is_training"].b:
+            # only the normalized output may be used
+            if any(counts.get(node.name + ":" + str(i), 0) > 0 for i in range(1, 6)):
+                continue
+            values = [_const_value(nodes, inp) for inp in node.input[1:5]]
+            if any(value is None for value in values):
+                continue
+            gamma, beta, mean, variance = [v.astype(np.float64) for v in values]
+            scale = gamma / np.sqrt(variance + node.attr["epsilon"].f)
+            shift = beta - mean*scale
+            inp = node.input[0]
+        elif node.op in ("Add", "AddV2"):
+            # x*scale + shift
+            mul = None
+            for i in range(2):
+                mul = nodes.get(_parse_input(node.input[i])[0])
+                shift = _const_value(nodes, node.input[1-i])
+                if (mul is not None) and (mul.op == "Mul") and (shift is not None):
+                    break
+                mul = None
+            if (mul is None) or (counts.get(mul.name, 0) != 1):
+                continue
+            scale = _const_value(nodes, mul.input[1])
+            inp = mul.input[0]
+            if scale is None:
+                scale = _const_value(nodes, mul.input[0])
+                inp = mul.input[1]
+            if (scale is None) or (scale.ndim > 1) or (shift.ndim > 1):
+                continue
+        else:
+            continue
+        bias_add = nodes.get(_parse_input(inp)[0])
+        if _fold_scale_shift(nodes, counts, bias_add, scale, shift):
+            _set_identity(node, bias_add.name, bias_add.attr["T"].type)
+            n_folded = n_folded + 1
+    return folded, n_folded
+
+
+def optimize_for_inference(session, output_names, training_name = "training"):
+    """Creates a frozen inference graph: the variables are converted into
+    constants, the training branches (e.g. of dropout and batch normalization)
+    are removed, the constants are folded, the channel shuffles are folded
+    into the following convolutions, and the batch normalizations are folded
+    into the preceding layers.
+    Args:
+        session: A TensorFlow session holding the trained variables.
+        output_names: A list of the names of the output operations.
+        training_name: The name of the boolean training placeholder.
+    Returns:
+        A tuple of the optimized GraphDef and the number of folded layers.
+    """
+    graph_def = freeze_graph(session, output_names, training_name)
+    graph_def = prune_training_branches(graph_def)
+    graph_def = fold_constants(graph_def)
+    graph_def, _ = fold_channel_shuffles(graph_def)
+    graph_def, n_folded = fold_batch_norms(graph_def)
+    graph_def = tf.graph_util.extract_sub_graph(graph_def, list(output_names))
+    return graph_def, n_folded
+
+
+def export_inference_graph(
+        net_func, weights_path, input_shape, path,
+        output_names = ("logit", "prob"),
+        data_format = "channels_last",
+        seed = 42):
+    """Builds a network, restores its weights saved by arch.io, and writes the
+    optimized inference graph. The weights file has to contain the batch
+    normalization statistics (e.g. saved by a Checkpoint).
+    Args:
+        net_func: A function building the network, e.g. a builder of the
+            *_graph modules.
+        weights_path: A string representing the path of the weights file.
+        input_shape: A list representing the shape of the input images.
+        path: A string representing the path of the output .pb file.
+        output_names: A list of the names of the output layers.
+        data_format: A string, the data format of the exported network,
+            "channels_last" or "channels_first". The input stays NHWC, and
+            the weights can be trained in either data format.
+        seed: An integer representing the random seed of the builder.
+    Returns:
+        A tuple of the names of the input and output operations of the
+        exported graph.
+    """
+    graph = tf.Graph()
+    with graph.as_default():
+        x = tf.placeholder(tf.float32, [None] + list(input_shape), name = "input")
+        layers, variables = with_data_format(net_func, data_format)(x, seed = seed)
+        training = tuple_list_find(variables, "training")[1]
+        outputs = [tuple_list_find(layers, name)[1].op.name for name in output_names]
+        checkpoint = Checkpoint(var_list = tf.global_variables())
+        with tf.Session() as session:
+            checkpoint.restore(session, weights_path)
+            graph_def, _ = optimize_for_inference(
+                    session, outputs, training_name = training.op.name)
+    with tf.gfile.GFile(path, "wb") as f:
+        f.write(graph_def.SerializeToString())
+    return x.op.name, outputs
+
+
+def load_inference_graph(path, name = ""):
+    """Imports an exported inference graph into the default graph.
+    Args:
+        path: A string representing the path of the .pb file.
+        name: A prefix of the imported names.
+    """
+    graph_def = tf.GraphDef()
+    with tf.gfile.GFile(path, "rb") as f:
+        graph_def.ParseFromString(f.read())
+    tf.import_graph_def(graph_def, name = name)
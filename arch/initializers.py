@@ -162,3 +162,75 @@ def He_normal_multibranch(C = [1, 1], seed = 42):
     """     
     return Kumar_normal_multibranch(
             activation = "relu", mode = "FAN_AVG", C = C, seed = seed)
+
+
+# stateless counterparts of the random ops used by the initializers
+_STATELESS_RANDOM_OPS = {
+        'RandomUniform': 'stateless_random_uniform',
+        'RandomStandardNormal': 'stateless_random_normal',
+        'TruncatedNormal': 'stateless_truncated_normal'}
+
+
+def _random_ops(tensor):
+    """Finds the random ops in the subgraph computing a tensor."""
+    found = []
+    visited = set()
+    stack = [tensor.op]
+    while stack:
+        op = stack.pop()
+        if op.name in visited:
+            continue
+        visited.add(op.name)
+        if op.type in _STATELESS_RANDOM_OPS:
+            found.append(op)
+        stack.extend(t.op for t in op.inputs)
+    return sorted(found, key = lambda op: op.name)
+
+
+class SeededInitializer(object):
+    """Class to re-initialize variables of a built graph with a new random
+    seed, without rebuilding the graph.
+
+    The random ops computing the initial values of the variables are replaced
+    by their stateless counterparts, seeded with the fed seed and the index of
+    the op. Variables with deterministic initial values (e.g. optimizer slots,
+    global step, batch normalization statistics) are simply re-initialized.
+    The initial values are drawn from the same distributions, but not the same
+    values the original initializers produce for the same seed.
+
+    Attributes:
+        seed: An int64 placeholder representing the random seed.
+        init_op: An operation to re-initialize the variables.
+
+    """
+    def __init__(self, var_list = None, name = "seeded_init"):
+        if var_list is None:
+            var_list = tf.global_variables()
+        assign_ops = []
+        n_random = 0
+        with tf.name_scope(name):
+            self.seed = tf.placeholder(tf.int64, shape = [], name = "seed")
+            for var in var_list:
+                ops = _random_ops(var.initial_value)
+                if not ops:
+                    assign_ops.append(var.initializer)
+                    continue
+                replacement = dict()
+                for op in ops:
+                    stateless = getattr(tf.contrib.stateless, _STATELESS_RANDOM_OPS[op.type])
+                    replacement[op.outputs[0]] = stateless(
+                            op.inputs[0],
+                            seed = tf.stack([self.seed, tf.constant(n_random, tf.int64)]),
+                            dtype = op.get_attr("dtype"))
+                    n_random = n_random + 1
+                value = tf.contrib.graph_editor.graph_replace(var.initial_value, replacement)
+                assign_ops.append(tf.assign(var, value))
+            self.init_op = tf.group(*assign_ops)
+
+    def run(self, session, seed):
+        """Re-initializes the variables.
+        Args:
+            session: A TensorFlow session.
+            seed: An integer representing the random seed.
+        """
+        session.run(self.init_op, feed_dict = {self.seed: seed})
@@ -1,35 +1,168 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import os
+import threading
+import weakref
 import h5py
 import tensorflow as tf
 
 
-def save_variables(session, path):
+class Checkpoint(object):
+    """Class to save and restore variables with HDF5 files.
+
+    All variables are fetched in a single session call. Restoring is done by
+    assign operations fed from placeholders, which are built only once, so the
+    graph does not grow on each restore. The file can be written in a
+    background thread, so the training can continue meanwhile.
+
+    Attributes:
+        var_list: A list of the saved variables.
+
+    """
+    def __init__(self, var_list = None, include_state = True, name = "checkpoint"):
+        """
+        Args:
+            var_list: An optional list of variables. If None, all global
+                variables (including batch normalization statistics, optimizer
+                slots and the global step) are used if include_state is True,
+                and only the trainable variables otherwise.
+            include_state: A boolean to include the non-trainable variables.
+            name: Name of the operations.
+        """
+        if var_list is None:
+            if include_state:
+                var_list = tf.global_variables()
+            else:
+                var_list = tf.trainable_variables()
+        self.var_list = list(var_list)
+        self._placeholders = []
+        self._assign_ops = []
+        with tf.name_scope(name):
+            for v in self.var_list:
+                ph = tf.placeholder(v.dtype.base_dtype, v.get_shape())
+                self._placeholders.append(ph)
+                self._assign_ops.append(tf.assign(v, ph))
+            self._restore_op = tf.group(*self._assign_ops)
+        self._thread = None
+        self._error = None
+
+    def save(self, session, path, background = False, attrs = None):
+        """Saves the variables. A pending background write is finished
+        first.
+        Args:
+            session: A TensorFlow session to retrieve the variables from.
+            path: A string representing the path of the file.
+            background: A boolean to write the file in a background thread.
+            attrs: An optional dictionary of additional values stored as
+                attributes of the file.
+        """
+        values = session.run(self.var_list)
+        self.wait()
+        items = [(v.name, val) for v, val in zip(self.var_list, values)]
+        if background:
+            self._thread = threading.Thread(
+                    target = self._write_background, args = (path, items, attrs))
+            self._thread.daemon = True
+            self._thread.start()
+        else:
+            _write(path, items, attrs)
+
+    def _write_background(self, path, items, attrs):
+        try:
+            _write(path, items, attrs)
+        except Exception as e:
+            self._error = e
+
+    def wait(self):
+        """Waits for a pending background write. Errors of the write are
+        raised here.
+        """
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error = self._error
+            self._error = None
+            raise error
+
+    def restore(self, session, path, strict = True):
+        """Restores the variables.
+        Args:
+            session: A TensorFlow session to assign the variables in.
+            path: A string representing the path of the file.
+            strict: A boolean, if True all variables have to be found in the
+                file, otherwise the missing ones are left unchanged.
+        Returns:
+            A dictionary of the attributes of the file.
+        """
+        self.wait()
+        feed_dict = dict()
+        ops = []
+        with h5py.File(path, "r") as f:
+            for v, ph, op in zip(self.var_list, self._placeholders, self._assign_ops):
+                if v.name not in f:
+                    if strict:
+                        raise KeyError("Variable not found in " + path + ": " + v.name)
+                    continue
+                feed_dict[ph] = f[v.name][()]
+                ops.append(op)
+            attrs = dict(f.attrs)
+        if len(ops) == len(self._assign_ops):
+            session.run(self._restore_op, feed_dict = feed_dict)
+        elif ops:
+            session.run(ops, feed_dict = feed_dict)
+        return attrs
+
+
+def _write(path, items, attrs = None):
+    """Writes variable values into a temporary file, which replaces the file
+    when complete, so an interrupted write does not corrupt the previous one.
+    """
+    tmp_path = path + ".tmp"
+    with h5py.File(tmp_path, "w") as f:
+        for name, val in items:
+            f[name] = val
+        if attrs is not None:
+            for key, val in attrs.items():
+                f.attrs[key] = val
+    os.replace(tmp_path, path)
+
+
+# checkpoints of the default functions, per graph
+_checkpoints = weakref.WeakKeyDictionary()
+
+
+def _get_checkpoint(include_state):
+    graph = tf.get_default_graph()
+    graph_checkpoints = _checkpoints.setdefault(graph, dict())
+    # the cached checkpoint is rebuilt if new variables were created
+    var_list = tf.global_variables() if include_state else tf.trainable_variables()
+    checkpoint = graph_checkpoints.get(include_state)
+    if (checkpoint is None) or \
+       ([v.name for v in checkpoint.var_list] != [v.name for v in var_list]):
+        checkpoint = Checkpoint(var_list = var_list)
+        graph_checkpoints[include_state] = checkpoint
+    return checkpoint
+
+
+def save_variables(session, path, include_state = False):
     """Saves tensorflow variables to file.
     Args:
         session: A TensorFlow session to retrieve the variables from.
         path: A string representing the path of the file.
-    """    
-    f = h5py.File(path, "w")
-    for v in tf.trainable_variables():
-        var_name = v.name
-        with session.as_default():
-            var_val = session.run(v)
-        f[var_name] = var_val
-    f.close()
+        include_state: A boolean to save the non-trainable variables (e.g.
+            batch normalization statistics, optimizer slots) too.
+    """
+    _get_checkpoint(include_state).save(session, path)
 
 
-def load_variables(session, path):
+def load_variables(session, path, include_state = False):
     """Loads tensorflow variables from file.
     Args:
         session: A TensorFlow session to retrieve the variables from.
         path: A string representing the path of the file.
-    """    
-    f = h5py.File(path, "r")
-    for v in tf.trainable_variables():
-        var_name = v.name
-        var_val = f[var_name].value
-        with session.as_default():
-            session.run(v.assign(var_val))
-    f.close()
+        include_state: A boolean to load the non-trainable variables (e.g.
+            batch normalization statistics, optimizer slots) too.
+    """
+    _get_checkpoint(include_state).restore(session, path)
@@ -2,11 +2,101 @@
 # -*- coding: utf-8 -*-
 
 from functools import partial
+from contextlib import contextmanager
 import numpy as np
 import tensorflow as tf
 from arch.initializers import He_normal
 from arch import selu
 
+# data format of the layers, "channels_last" (NHWC) or "channels_first" (NCHW)
+_data_format = ["channels_last"]
+
+
+def get_data_format():
+    """Returns the current data format of the layers."""
+    return _data_format[-1]
+
+
+@contextmanager
+def data_format_scope(data_format):
+    """Context manager to build the layers in a data format. The weights have
+    the same shapes in both data formats, so the variables are interchangeable.
+    Args:
+        data_format: A string, "channels_last" or "channels_first".
+    """
+    if data_format not in ("channels_last", "channels_first"):
+        raise ValueError("Unknown data format: " + str(data_format))
+    _data_format.append(data_format)
+    try:
+        yield
+    finally:
+        _data_format.pop()
+
+
+def channel_axis():
+    """Returns the channel axis of the current data format, which is valid
+    for both 4D and 2D tensors.
+    """
+    return 1 if get_data_format() == "channels_first" else -1
+
+
+def spatial_axes():
+    """Returns the spatial axes of 4D tensors of the current data format."""
+    return [2, 3] if get_data_format() == "channels_first" else [1, 2]
+
+
+def n_channels(inputs):
+    """Returns the number of channels of a tensor."""
+    return inputs.get_shape()[channel_axis()].value
+
+
+def slice_channels(inputs, begin, size, name = "slice_channels"):
+    """Slices channels of a 4D tensor."""
+    if get_data_format() == "channels_first":
+        return tf.identity(inputs[:,begin:begin+size,:,:], name = name)
+    return tf.identity(inputs[:,:,:,begin:begin+size], name = name)
+
+
+def to_data_format(inputs, data_format, from_format = "channels_last", name = "to_data_format"):
+    """Transposes a 4D tensor between data formats."""
+    if data_format == from_format:
+        return inputs
+    if data_format == "channels_first":
+        return tf.transpose(inputs, [0, 3, 1, 2], name = name)
+    return tf.transpose(inputs, [0, 2, 3, 1], name = name)
+
+
+def with_data_format(net_func, data_format, input_format = "channels_last"):
+    """Wraps a network builder to build the network in a data format. The
+    inputs are transposed inside the graph if their format differs, and the
+    variables have the same names and shapes in both data formats, so weights
+    trained in one can be loaded into the other.
+    Args:
+        net_func: A function building the network, e.g. a builder of the
+            *_graph modules.
+        data_format: A string, "channels_last" or "channels_first".
+        input_format: A string representing the data format of the inputs.
+    Returns:
+        A function with the arguments of net_func.
+    """
+    def build(x, *args, **kwargs):
+        with data_format_scope(data_format):
+            x = to_data_format(x, data_format, from_format = input_format)
+            return net_func(x, *args, **kwargs)
+    return build
+
+
+def _nn_format():
+    return "NCHW" if get_data_format() == "channels_first" else "NHWC"
+
+
+def _spatial(values):
+    """Creates the strides or kernel size of a 4D op from a spatial pair."""
+    if get_data_format() == "channels_first":
+        return [1, 1, values[0], values[1]]
+    return [1, values[0], values[1], 1]
+
+
 def conv2d(
         inputs, size, n_filters,
         stride = 1,
@@ -28,7 +118,7 @@ def conv2d(
     Returns:
         4D tensor.
     """    
-    in_filt = inputs.shape[3].value
+    in_filt = n_channels(inputs)
     if not isinstance(size, (tuple, list)):
         size = [size, size]
     if not isinstance(stride, (tuple, list)):
@@ -45,10 +135,11 @@ def conv2d(
                 name = "bias")
         conv = tf.nn.conv2d(
                 inputs, weights,
-                strides = [1, stride[0], stride[1], 1],
+                strides = _spatial(stride),
+                data_format = _nn_format(),
                 padding = padding,
                 name = "conv")
-        outputs = tf.nn.bias_add(conv, biases, name = "bias_add")
+        outputs = tf.nn.bias_add(conv, biases, data_format = _nn_format(), name = "bias_add")
     return outputs
 
 
@@ -72,7 +163,7 @@ def conv2d_bn(
                 bias_init = bias_init,
                 name = "conv2d")
         x = tf.layers.batch_normalization(
-                x, training = is_training, name = "batch_norm")
+                x, axis = channel_axis(), training = is_training, name = "batch_norm")
     return x
 
 
@@ -123,7 +214,7 @@ def conv2d_bn_act(
                 bias_init = bias_init,
                 name = "conv2d")
         x = tf.layers.batch_normalization(
-                x, training = is_training, name = "batch_norm")
+                x, axis = channel_axis(), training = is_training, name = "batch_norm")
         if activation is not None:
             x = activation(x, name = "activation")
     return x
@@ -153,7 +244,7 @@ def conv2d_act_bn(
         if activation is not None:
             x = activation(x, name = "activation")
         x = tf.layers.batch_normalization(
-                x, training = is_training, name = "batch_norm")
+                x, axis = channel_axis(), training = is_training, name = "batch_norm")
     return x
 
 conv2d_relu_bn = partial(conv2d_act_bn, activation = tf.nn.relu)
@@ -171,7 +262,7 @@ def bn_act_conv2d(
         ):
     with tf.variable_scope(name):
         x = tf.layers.batch_normalization(
-                inputs, training = is_training, name = "batch_norm")
+                inputs, axis = channel_axis(), training = is_training, name = "batch_norm")
         if activation is not None:
             x = activation(x, name = "activation")
         x = conv2d(
@@ -191,6 +282,7 @@ def separable_conv2d(
         stride = 1,
         depth_multiplier = 1,
         padding = "SAME",
+        input_permutation = None,
         regularizer = None,
         depth_init = He_normal(),
         pointwise_init = He_normal(),
@@ -205,6 +297,10 @@ def separable_conv2d(
         depth_multiplier: Number of depthwise convolution output channels for 
             each input channel.
         padding: Padding algorithm "SAME" or "VALID".
+        input_permutation: An optional list of channel indices. If given, the
+            layer computes its output for the input channels permuted as
+            inputs[..., input_permutation] (e.g. a channel shuffle) without
+            moving the inputs, by reordering the weights of the channels.
         depth_init: Depthwise initialization function.
         pointwise_init: Pointwise initialization function.
         bias_init: Bias initialization function.
@@ -212,7 +308,7 @@ def separable_conv2d(
     Returns:
         4D tensor.
     """    
-    in_filt = inputs.shape[3].value    
+    in_filt = n_channels(inputs)    
     if not isinstance(size, (tuple, list)):
         size = [size, size]
     if not isinstance(stride, (tuple, list)):
@@ -230,12 +326,25 @@ def separable_conv2d(
                 name = "pointwise_weight")
         biases = tf.get_variable(
                 shape = [n_filters], initializer = bias_init, name = "bias")
+        if input_permutation is not None:
+            # the weights of input channel k are the ones of position c of
+            # the permuted inputs, where input_permutation[c] = k
+            inverse = np.argsort(input_permutation)
+            depth_weights = tf.gather(
+                    depth_weights, inverse, axis = 2, name = "permuted_depth_weight")
+            pointwise_weights = tf.reshape(
+                    pointwise_weights, [1, 1, in_filt, depth_multiplier, n_filters])
+            pointwise_weights = tf.gather(pointwise_weights, inverse, axis = 2)
+            pointwise_weights = tf.reshape(
+                    pointwise_weights, [1, 1, depth_multiplier*in_filt, n_filters],
+                    name = "permuted_pointwise_weight")
         conv = tf.nn.separable_conv2d(
                 inputs, depth_weights, pointwise_weights,
-                strides = [1, stride[0], stride[1], 1],
+                strides = _spatial(stride),
+                data_format = _nn_format(),
                 padding = padding,
                 name = "separable_conv")
-        outputs = tf.nn.bias_add(conv, biases, name="bias_add")
+        outputs = tf.nn.bias_add(conv, biases, data_format = _nn_format(), name = "bias_add")
     return outputs
 
 
@@ -273,7 +382,7 @@ def factorized_conv2d(
             curr_filters = n_filters[r]
             if not isinstance(curr_filters, (tuple, list)):
                 curr_filters = (curr_filters, curr_filters)
-            in_filt = x.shape[3].value             
+            in_filt = n_channels(x)             
             weights1 = tf.get_variable(
                     shape = [1, size, in_filt, curr_filters[0]],
                     regularizer = regularizer,
@@ -285,10 +394,11 @@ def factorized_conv2d(
                     name="bias_"+str(r)+"_1")
             conv1 = tf.nn.conv2d(
                     x, weights1,
-                    strides = [1, stride[0], stride[1], 1],
+                    strides = _spatial(stride),
+                    data_format = _nn_format(),
                     padding = padding,
                     name = "conv_"+str(r)+"_1")
-            x = tf.nn.bias_add(conv1, biases1, name = "bias_add_"+str(r)+"_1")
+            x = tf.nn.bias_add(conv1, biases1, data_format = _nn_format(), name = "bias_add_"+str(r)+"_1")
             
             weights2 = tf.get_variable(
                     shape = [size, 1, curr_filters[0], curr_filters[1]],
@@ -301,10 +411,11 @@ def factorized_conv2d(
                     name="bias_"+str(r)+"_2")
             conv2 = tf.nn.conv2d(
                     x, weights2,
-                    strides = [1, stride[0], stride[1], 1],
+                    strides = _spatial(stride),
+                    data_format = _nn_format(),
                     padding = padding,
                     name = "conv_"+str(r)+"_2")
-            x = tf.nn.bias_add(conv2, biases2, name = "bias_add_"+str(r)+"_2")
+            x = tf.nn.bias_add(conv2, biases2, data_format = _nn_format(), name = "bias_add_"+str(r)+"_2")
     return x
 
 
@@ -342,7 +453,7 @@ def factorized_conv2d_act(
             curr_filters = n_filters[r]
             if not isinstance(curr_filters, (tuple, list)):
                 curr_filters = (curr_filters, curr_filters)
-            in_filt = x.shape[3].value             
+            in_filt = n_channels(x)             
             weights1 = tf.get_variable(
                     shape = [1, size, in_filt, curr_filters[0]],
                     regularizer = regularizer,
@@ -354,10 +465,11 @@ def factorized_conv2d_act(
                     name="bias_"+str(r)+"_1")
             conv1 = tf.nn.conv2d(
                     x, weights1,
-                    strides = [1, stride[0], stride[1], 1],
+                    strides = _spatial(stride),
+                    data_format = _nn_format(),
                     padding = padding,
                     name = "conv_"+str(r)+"_1")
-            x = tf.nn.bias_add(conv1, biases1, name = "bias_add_"+str(r)+"_1")
+            x = tf.nn.bias_add(conv1, biases1, data_format = _nn_format(), name = "bias_add_"+str(r)+"_1")
             if activation is not None:
                 x = activation(x, name = "activation")
             
@@ -372,10 +484,11 @@ def factorized_conv2d_act(
                     name="bias_"+str(r)+"_2")
             conv2 = tf.nn.conv2d(
                     x, weights2,
-                    strides = [1, stride[0], stride[1], 1],
+                    strides = _spatial(stride),
+                    data_format = _nn_format(),
                     padding = padding,
                     name = "conv_"+str(r)+"_2")
-            x = tf.nn.bias_add(conv2, biases2, name = "bias_add_"+str(r)+"_2")
+            x = tf.nn.bias_add(conv2, biases2, data_format = _nn_format(), name = "bias_add_"+str(r)+"_2")
             if activation is not None:
                 x = activation(x, name = "activation")
     return x
@@ -418,7 +531,7 @@ def factorized_conv2d_bn(
             curr_filters = n_filters[r]
             if not isinstance(curr_filters, (tuple, list)):
                 curr_filters = (curr_filters, curr_filters)
-            in_filt = x.shape[3].value             
+            in_filt = n_channels(x)             
             weights1 = tf.get_variable(
                     shape = [1, size, in_filt, curr_filters[0]],
                     regularizer = regularizer,
@@ -430,12 +543,13 @@ def factorized_conv2d_bn(
                     name="bias_"+str(r)+"_1")
             conv1 = tf.nn.conv2d(
                     x, weights1,
-                    strides = [1, stride[0], stride[1], 1],
+                    strides = _spatial(stride),
+                    data_format = _nn_format(),
                     padding = padding,
                     name = "conv_"+str(r)+"_1")
-            x = tf.nn.bias_add(conv1, biases1, name = "bias_add_"+str(r)+"_1")
+            x = tf.nn.bias_add(conv1, biases1, data_format = _nn_format(), name = "bias_add_"+str(r)+"_1")
             x = tf.layers.batch_normalization(
-                    x, training = is_training, name = "batch_norm_"+str(r)+"_1")
+                    x, axis = channel_axis(), training = is_training, name = "batch_norm_"+str(r)+"_1")
             
             weights2 = tf.get_variable(
                     shape = [size, 1, curr_filters[0], curr_filters[1]],
@@ -448,12 +562,13 @@ def factorized_conv2d_bn(
                     name="bias_"+str(r)+"_2")
             conv2 = tf.nn.conv2d(
                     x, weights2,
-                    strides = [1, stride[0], stride[1], 1],
+                    strides = _spatial(stride),
+                    data_format = _nn_format(),
                     padding = padding,
                     name = "conv_"+str(r)+"_2")
-            x = tf.nn.bias_add(conv2, biases2, name = "bias_add_"+str(r)+"_2")
+            x = tf.nn.bias_add(conv2, biases2, data_format = _nn_format(), name = "bias_add_"+str(r)+"_2")
             x = tf.layers.batch_normalization(
-                    x, training = is_training, name = "batch_norm_"+str(r)+"_2")
+                    x, axis = channel_axis(), training = is_training, name = "batch_norm_"+str(r)+"_2")
     return x
 
 
@@ -492,7 +607,7 @@ def factorized_conv2d_bn_act(
             curr_filters = n_filters[r]
             if not isinstance(curr_filters, (tuple, list)):
                 curr_filters = (curr_filters, curr_filters)
-            in_filt = x.shape[3].value             
+            in_filt = n_channels(x)             
             weights1 = tf.get_variable(
                     shape = [1, size, in_filt, curr_filters[0]],
                     regularizer = regularizer,
@@ -504,12 +619,13 @@ def factorized_conv2d_bn_act(
                     name="bias_"+str(r)+"_1")
             conv1 = tf.nn.conv2d(
                     x, weights1,
-                    strides = [1, stride[0], stride[1], 1],
+                    strides = _spatial(stride),
+                    data_format = _nn_format(),
                     padding = padding,
                     name = "conv_"+str(r)+"_1")
-            x = tf.nn.bias_add(conv1, biases1, name = "bias_add_"+str(r)+"_1")
+            x = tf.nn.bias_add(conv1, biases1, data_format = _nn_format(), name = "bias_add_"+str(r)+"_1")
             x = tf.layers.batch_normalization(
-                    x, training = is_training, name = "batch_norm_"+str(r)+"_1")
+                    x, axis = channel_axis(), training = is_training, name = "batch_norm_"+str(r)+"_1")
             if activation is not None:
                 x = activation(x, name = "activation")
             
@@ -524,12 +640,13 @@ def factorized_conv2d_bn_act(
                     name="bias_"+str(r)+"_2")
             conv2 = tf.nn.conv2d(
                     x, weights2,
-                    strides = [1, stride[0], stride[1], 1],
+                    strides = _spatial(stride),
+                    data_format = _nn_format(),
                     padding = padding,
                     name = "conv_"+str(r)+"_2")
-            x = tf.nn.bias_add(conv2, biases2, name = "bias_add_"+str(r)+"_2")
+            x = tf.nn.bias_add(conv2, biases2, data_format = _nn_format(), name = "bias_add_"+str(r)+"_2")
             x = tf.layers.batch_normalization(
-                    x, training = is_training, name = "batch_norm_"+str(r)+"_2")
+                    x, axis = channel_axis(), training = is_training, name = "batch_norm_"+str(r)+"_2")
             if activation is not None:
                 x = activation(x, name = "activation")
     return x
@@ -542,11 +659,15 @@ factorized_conv2d_bn_relu = partial(factorized_conv2d_bn_act, activation = tf.nn
 def group_conv2d_fixdepth(
         inputs, size, cardinality, group_width,
         stride = 1,
+        fused = False,
         regularizer = None,
         kernel_init = He_normal(seed = 42),
         bias_init = tf.zeros_initializer(),
         name = "group_conv2d"):
     
+    # a single group is a plain conv2d with the variables name/weight and
+    # name/bias, fused or not, so it is handled before the fused layer, which
+    # would create them in name/conv2d
     if cardinality == 1:
         return conv2d(
                 inputs, size = size, n_filters = group_width,
@@ -555,11 +676,23 @@ def group_conv2d_fixdepth(
                 kernel_init = kernel_init,
                 bias_init = bias_init,
                 name = name)
-        
+
+    # fused is a boolean (True for "depthwise"), or the implementation of
+    # fused_group_conv2d
+    if fused:
+        return fused_group_conv2d(
+                inputs, size = size, cardinality = cardinality,
+                n_filters = cardinality*group_width,
+                stride = stride,
+                implementation = fused if isinstance(fused, str) else "depthwise",
+                regularizer = regularizer,
+                kernel_init = kernel_init,
+                bias_init = bias_init,
+                name = name)
             
     with tf.variable_scope(name):
         size_splits = [group_width]*cardinality
-        groups = tf.split(inputs, size_splits, axis = 3, name = "split")
+        groups = tf.split(inputs, size_splits, axis = channel_axis(), name = "split")
         conv_groups = []
         for i, group in enumerate(groups):
             conv = conv2d(
@@ -571,7 +704,7 @@ def group_conv2d_fixdepth(
                     name = "conv2d_"+str(i))
             conv_groups.append(conv)
             
-        outputs = tf.concat(conv_groups, axis = 3, name = "concat")    
+        outputs = tf.concat(conv_groups, axis = channel_axis(), name = "concat")    
         
     return outputs
 
@@ -579,11 +712,25 @@ def group_conv2d_fixdepth(
 def group_conv2d(
         inputs, size, cardinality, n_filters,
         stride = 1,
+        fused = False,
         regularizer = None,
         kernel_init = He_normal(seed = 42),
         bias_init = tf.zeros_initializer(),
         name = "group_conv2d"):
     
+    # fused is a boolean (True for "depthwise"), or the implementation of
+    # fused_group_conv2d
+    if fused:
+        return fused_group_conv2d(
+                inputs, size = size, cardinality = cardinality,
+                n_filters = n_filters,
+                stride = stride,
+                implementation = fused if isinstance(fused, str) else "depthwise",
+                regularizer = regularizer,
+                kernel_init = kernel_init,
+                bias_init = bias_init,
+                name = name)
+
     with tf.variable_scope(name):
         if cardinality == 1:
             return conv2d(
@@ -594,10 +741,10 @@ def group_conv2d(
                     bias_init = bias_init,
                     name = "conv2d")
             
-        in_split = inputs.get_shape()[3].value // cardinality
+        in_split = n_channels(inputs) // cardinality
         out_depth = n_filters // cardinality
         conv_groups = [
-            conv2d(inputs[:,:,:,i*in_split:i*in_split+in_split],
+            conv2d(slice_channels(inputs, i*in_split, in_split, name = "slice_"+str(i)),
                    size = size,
                    n_filters = out_depth,
                    stride = stride,
@@ -606,10 +753,210 @@ def group_conv2d(
                    bias_init = bias_init,
                    name = "conv2d_"+str(i)
                    ) for i in range(cardinality)]
-        outputs = tf.concat(conv_groups, axis = 3, name = "concat")
+        outputs = tf.concat(conv_groups, axis = channel_axis(), name = "concat")
+    return outputs
+
+
+def _group_weights(
+        in_split, out_depth, size, cardinality,
+        regularizer = None,
+        kernel_init = He_normal(seed = 42),
+        bias_init = tf.zeros_initializer()):
+    """Creates the weights and biases of a group convolution in the variable
+    layout of group_conv2d, i.e. a conv2d scope per group.
+    Returns:
+        A tuple of the lists of the weights and the biases of the groups.
+    """
+    weights = []
+    biases = []
+    for i in range(cardinality):
+        with tf.variable_scope("conv2d_"+str(i)):
+            weights.append(tf.get_variable(
+                    shape = [size[0], size[1], in_split, out_depth],
+                    regularizer = regularizer,
+                    initializer = kernel_init,
+                    name = "weight"))
+            biases.append(tf.get_variable(
+                    shape = [out_depth],
+                    initializer = bias_init,
+                    name = "bias"))
+    return weights, biases
+
+
+def fused_group_conv2d(
+        inputs, size, cardinality, n_filters,
+        stride = 1,
+        implementation = "depthwise",
+        regularizer = None,
+        kernel_init = He_normal(seed = 42),
+        bias_init = tf.zeros_initializer(),
+        name = "group_conv2d"):
+    """Creates a group convolution computed by a single convolution op,
+    instead of a convolution per group and a concatenation. The variables
+    have the same names, shapes and initial values as in group_conv2d, so
+    the two layers can load each others weights.
+    Args:
+        inputs: 4D input tensor.
+        size: Kernel size, int or list of two ints.
+        cardinality: Number of groups.
+        n_filters: Number of filters.
+        stride: Stride size, int or list of two ints.
+        implementation: A string, the formulation of the group convolution:
+            "native": a conv2d with the kernels of the groups concatenated
+                along the output channels, requires grouped convolution
+                support of TensorFlow on the device of the session (e.g.
+                cuDNN on GPU, TensorFlow 1.14+), the CPU kernel rejects it.
+            "depthwise": a depthwise convolution with a channel multiplier of
+                the group output depth, summed over the group inputs. Needs
+                a temporary tensor of input depth per group times the output.
+                Runs on any device, the default.
+            "block_diagonal": a conv2d with a block diagonal kernel. Computes
+                cardinality times the multiply-adds of the groups.
+        kernel_init: Kernel initialization function.
+        bias_init: Bias initialization function.
+        name: Name of the layer.
+    Returns:
+        4D tensor.
+    """
+    with tf.variable_scope(name):
+        if cardinality == 1:
+            return conv2d(
+                    inputs, size = size, n_filters = n_filters,
+                    stride = stride,
+                    regularizer = regularizer,
+                    kernel_init = kernel_init,
+                    bias_init = bias_init,
+                    name = "conv2d")
+
+        if not isinstance(size, (tuple, list)):
+            size = [size, size]
+        if not isinstance(stride, (tuple, list)):
+            stride = [stride, stride]
+        in_split = n_channels(inputs) // cardinality
+        out_depth = n_filters // cardinality
+
+        weights, biases = _group_weights(
+                in_split, out_depth, size, cardinality,
+                regularizer = regularizer,
+                kernel_init = kernel_init,
+                bias_init = bias_init)
+        biases = tf.concat(biases, axis = 0, name = "bias")
+
+        if implementation == "native":
+            kernel = tf.concat(weights, axis = 3, name = "kernel")
+            conv = tf.nn.conv2d(
+                    inputs, kernel,
+                    strides = _spatial(stride),
+                    data_format = _nn_format(),
+                    padding = "SAME",
+                    name = "conv")
+        elif implementation == "depthwise":
+            # output channel c*out_depth+o of the depthwise convolution is
+            # the contribution of input channel c to output o of its group
+            kernel = tf.concat(weights, axis = 2, name = "kernel")
+            conv = tf.nn.depthwise_conv2d(
+                    inputs, kernel,
+                    strides = _spatial(stride),
+                    data_format = _nn_format(),
+                    padding = "SAME",
+                    name = "depthwise_conv")
+            if get_data_format() == "channels_first":
+                h, w = conv.get_shape().as_list()[2:]
+                conv = tf.reshape(conv, [-1, cardinality, in_split, out_depth, h, w])
+                conv = tf.reduce_sum(conv, axis = 2)
+                conv = tf.reshape(conv, [-1, n_filters, h, w], name = "conv")
+            else:
+                h, w = conv.get_shape().as_list()[1:3]
+                conv = tf.reshape(conv, [-1, h, w, cardinality, in_split, out_depth])
+                conv = tf.reduce_sum(conv, axis = 4)
+                conv = tf.reshape(conv, [-1, h, w, n_filters], name = "conv")
+        elif implementation == "block_diagonal":
+            blocks = [tf.pad(weight, [[0, 0], [0, 0], [0, 0],
+                                      [i*out_depth, (cardinality-1-i)*out_depth]])
+                      for i, weight in enumerate(weights)]
+            kernel = tf.concat(blocks, axis = 2, name = "kernel")
+            conv = tf.nn.conv2d(
+                    inputs, kernel,
+                    strides = _spatial(stride),
+                    data_format = _nn_format(),
+                    padding = "SAME",
+                    name = "conv")
+        else:
+            raise ValueError("Unknown implementation: " + str(implementation))
+        outputs = tf.nn.bias_add(conv, biases, data_format = _nn_format(), name = "bias_add")
     return outputs
 
 
+def fused_conv2d_1x1(
+        inputs, n_filters, names,
+        activation = tf.nn.relu,
+        batch_norm = False,
+        is_training = False,
+        regularizer = None,
+        kernel_init = He_normal(),
+        bias_init = tf.zeros_initializer(),
+        name = "fused_conv2d_1x1"):
+    """Creates parallel 1x1 convolutions of the same input computed by a
+    single convolution with the concatenated kernels, followed by a split.
+    The variables are created in the scopes of the branch names, in the
+    layout of conv2d_act (conv2d_bn_act if batch_norm), so the fused and the
+    separate layers can load each others weights. The batch normalizations
+    are applied per branch after the split.
+    Args:
+        inputs: 4D input tensor.
+        n_filters: List of the number of filters of the branches.
+        names: List of the names of the branches.
+        activation: Activation function, or None.
+        batch_norm: Whether to batch normalize the branches.
+        is_training: Whether in training mode, for the batch normalization.
+        kernel_init: Kernel initialization function, or a list of them per
+            branch.
+        bias_init: Bias initialization function.
+        name: Name of the fused operations.
+    Returns:
+        A list of the 4D output tensors of the branches.
+    """
+    if not isinstance(kernel_init, (tuple, list)):
+        kernel_init = [kernel_init] * len(names)
+    in_filt = n_channels(inputs)
+    weights = []
+    biases = []
+    for branch, n, init in zip(names, n_filters, kernel_init):
+        with tf.variable_scope(branch):
+            with tf.variable_scope("conv2d"):
+                weights.append(tf.get_variable(
+                        shape = [1, 1, in_filt, n],
+                        regularizer = regularizer,
+                        initializer = init,
+                        name = "weight"))
+                biases.append(tf.get_variable(
+                        shape = [n],
+                        initializer = bias_init,
+                        name = "bias"))
+    with tf.name_scope(name):
+        kernel = tf.concat(weights, axis = 3, name = "kernel")
+        bias = tf.concat(biases, axis = 0, name = "bias")
+        conv = tf.nn.conv2d(
+                inputs, kernel,
+                strides = _spatial([1, 1]),
+                data_format = _nn_format(),
+                padding = "SAME",
+                name = "conv")
+        x = tf.nn.bias_add(conv, bias, data_format = _nn_format(), name = "bias_add")
+        if (not batch_norm) and (activation is not None):
+            x = activation(x, name = "activation")
+        outputs = tf.split(x, n_filters, axis = channel_axis(), name = "split")
+    if batch_norm:
+        for i, branch in enumerate(names):
+            with tf.variable_scope(branch):
+                x = tf.layers.batch_normalization(
+                        outputs[i], axis = channel_axis(), training = is_training,
+                        name = "batch_norm")
+                if activation is not None:
+                    x = activation(x, name = "activation")
+            outputs[i] = x
+    return outputs
+
 
 def max_pool2d(
         inputs,
@@ -623,9 +970,10 @@ def max_pool2d(
         stride = [stride, stride]
     return tf.nn.max_pool(
             inputs,
-            ksize = [1, size[0], size[1], 1],
-            strides = [1,stride[0], stride[1], 1],
+            ksize = _spatial(size),
+            strides = _spatial(stride),
             padding = padding,
+            data_format = _nn_format(),
             name = name)
 
 
@@ -641,16 +989,37 @@ def avg_pool2d(
         stride = [stride, stride]
     return tf.nn.avg_pool(
             inputs,
-            ksize = [1, size[0], size[1], 1],
-            strides = [1,stride[0], stride[1], 1],
+            ksize = _spatial(size),
+            strides = _spatial(stride),
             padding = padding,
+            data_format = _nn_format(),
             name = name)
 
 
+def lrn(
+        inputs,
+        depth_radius = 5,
+        bias = 1.0,
+        alpha = 1.0,
+        beta = 0.5,
+        name = "lrn"):
+    """Creates a local response normalization layer, which is only
+    implemented for NHWC.
+    """
+    if get_data_format() == "channels_first":
+        with tf.variable_scope(name):
+            x = tf.transpose(inputs, [0, 2, 3, 1], name = "to_nhwc")
+            x = tf.nn.lrn(x, depth_radius = depth_radius, bias = bias,
+                          alpha = alpha, beta = beta, name = "lrn")
+            return tf.transpose(x, [0, 3, 1, 2], name = "to_nchw")
+    return tf.nn.lrn(inputs, depth_radius = depth_radius, bias = bias,
+                     alpha = alpha, beta = beta, name = name)
+
+
 def global_avg_pool2d(
         inputs,
         name = "global_avg_pool2d"):
-    return tf.reduce_mean(inputs, axis = [1, 2], name = name)
+    return tf.reduce_mean(inputs, axis = spatial_axes(), name = name)
 
 
 def flatten(inputs, name = "flatten"):
@@ -661,6 +1030,10 @@ def flatten(inputs, name = "flatten"):
     Returns:
         1D Tensor.
     """    
+    if (inputs.get_shape().ndims == 4) and (get_data_format() == "channels_first"):
+        # same order of the features as in NHWC, so the dense weights do not
+        # depend on the data format
+        inputs = tf.transpose(inputs, [0, 2, 3, 1], name = name + "_transpose")
     return tf.reshape(
             inputs,
             shape = [-1, np.prod(inputs.get_shape()[1:].as_list())],
@@ -828,6 +1201,8 @@ def zero_pad2d(x, pad = 1, name = "zero_pad2d"):
             paddings = [[0,0],[pad[0],pad[0]],[pad[1],pad[1]],[0,0]]
     else:
         paddings = [[0,0],[pad,pad],[pad,pad],[0,0]]
+    if get_data_format() == "channels_first":
+        paddings = [paddings[0], paddings[3], paddings[1], paddings[2]]
     x = tf.pad(x, paddings = paddings, mode = 'CONSTANT', constant_values = 0, name = name)
     return x
     
@@ -840,26 +1215,12 @@ def crop2d(x, crop = 1, name = "crop2d"):
             cropping = crop
     else:
         cropping = [[crop,crop],[crop,crop]]
-    if (cropping[0][1] == 0) and (cropping[1][1] == 0):
-        x = x[:,
-              cropping[0][0]:,
-              cropping[1][0]:,
-              :]
-    elif cropping[0][1] == 0:
-        x = x[:,
-              cropping[0][0]:,
-              cropping[1][0]:-cropping[1][1],
-              :]
-    elif cropping[1][1] == 0:
-        x = x[:,
-              cropping[0][0]:-cropping[0][1],
-              cropping[1][0]:,
-              :]
+    h = slice(cropping[0][0], -cropping[0][1] if cropping[0][1] > 0 else None)
+    w = slice(cropping[1][0], -cropping[1][1] if cropping[1][1] > 0 else None)
+    if get_data_format() == "channels_first":
+        x = x[:, :, h, w]
     else:
-        x = x[:,
-              cropping[0][0]:-cropping[0][1],
-              cropping[1][0]:-cropping[1][1],
-              :]
+        x = x[:, h, w, :]
     x = tf.identity(x, name = name)
     return x
     
@@ -3,6 +3,7 @@
 
 import tensorflow as tf
 from arch.layers import conv2d, separable_conv2d
+from arch.layers import channel_axis, n_channels
 from arch.initializers import He_normal
 
 
@@ -23,7 +24,7 @@ def mobilenet_block(
         name = "mobilenet_block"
         ):
     
-    in_filt = inputs.shape[3].value
+    in_filt = n_channels(inputs)
     n_filters_sep = int(in_filt*alpha)
     n_filters_conv = int(n_filters*alpha)
     with tf.variable_scope(name):
@@ -36,7 +37,7 @@ def mobilenet_block(
                 bias_init = bias_init,
                 name = "separable_conv")
         x = tf.layers.batch_normalization(
-                x, training = is_training, name = "batch_norm_1")
+                x, axis = channel_axis(), training = is_training, name = "batch_norm_1")
         if activation is not None:
             x = activation(x, name = "activation_1")
         x = conv2d(
@@ -46,7 +47,7 @@ def mobilenet_block(
                 bias_init = bias_init,
                 name = "conv")
         x = tf.layers.batch_normalization(
-                x, training = is_training, name = "batch_norm_2")
+                x, axis = channel_axis(), training = is_training, name = "batch_norm_2")
         if activation is not None:
             x = activation(x, name = "activation_2")
     return x
@@ -3,6 +3,7 @@
 import tensorflow as tf
 
 from arch.layers import conv2d_bn_act, separable_conv2d, conv2d_bn
+from arch.layers import channel_axis, n_channels
 from arch.initializers import He_normal
 
 #Sandler et al., Inverted Residuals and Linear Bottlenecks: Mobile Networks for
@@ -26,7 +27,7 @@ def inverted_residual(
     n_filters_expand = int(n_filters * expand_ratio)
     with tf.variable_scope(name):
         if stride == 1:
-            if inputs.shape[3] != n_filters:
+            if n_channels(inputs) != n_filters:
                 shortcut = conv2d_bn(
                         inputs, size = 1, n_filters = n_filters, stride = 1,
                         is_training = is_training,
@@ -59,7 +60,7 @@ def inverted_residual(
                 bias_init = bias_init,
                 name = "separable_conv")            
         x = tf.layers.batch_normalization(
-            x, training = is_training, name = "batch_norm_1")
+            x, axis = channel_axis(), training = is_training, name = "batch_norm_1")
         if activation is not None:
             x = activation(x, name = "activation")
 
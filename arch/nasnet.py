@@ -4,6 +4,7 @@
 
 import tensorflow as tf
 from arch.layers import conv2d, conv2d_bn, separable_conv2d, avg_pool2d, max_pool2d, zero_pad2d, crop2d, global_avg_pool2d, dense
+from arch.layers import channel_axis, spatial_axes
 from arch.initializers import He_normal, Kumar_normal
 
 #Learning Transferable Architectures for Scalable Image Recognition
@@ -24,9 +25,8 @@ def adjust(
     bias_init = tf.zeros_initializer(),
     name = "adjust"):
     
-    #NHWC
-    channel_dim = 3 
-    img_dim = 1
+    channel_dim = channel_axis()
+    img_dim = spatial_axes()[0]
 
     with tf.variable_scope(name):
         if p is None:
@@ -58,9 +58,9 @@ def adjust(
                     bias_init = bias_init,
                     name = "conv_2")
 
-                p = tf.concat([p1, p2], axis = 3, name = "concat")
+                p = tf.concat([p1, p2], axis = channel_axis(), name = "concat")
                 p = tf.layers.batch_normalization(
-                    p, training = is_training, name = "batch_norm")                
+                    p, axis = channel_axis(), training = is_training, name = "batch_norm")                
 
         elif p.get_shape()[channel_dim].value != n_filters:
             with tf.variable_scope("projection"):
@@ -179,7 +179,7 @@ def Normal_A(
                 name = "separable_conv_5_3x3")
             x5 = tf.add(x5_1, x5_2, name = "add_5")
 
-        outputs = tf.concat([p, x1, x2, x3, x4, x5], axis = 3, name = "concat")
+        outputs = tf.concat([p, x1, x2, x3, x4, x5], axis = channel_axis(), name = "concat")
     return outputs, inputs
     
     
@@ -262,7 +262,7 @@ def Reduction_A(
             x5 = avg_pool2d(x1, size = 3, stride = 1, name = "avg_pool_5")
             x5 = tf.add(x2, x5, name = "add_5")
 
-        outputs = tf.concat([x2, x3, x4, x5], axis = 3, name = "concat")
+        outputs = tf.concat([x2, x3, x4, x5], axis = channel_axis(), name = "concat")
     return outputs, inputs
 
 
@@ -294,7 +294,7 @@ def auxiliary_classifier(
             x = activation(x, name = "activation_2")
         
         x = conv2d_bn(
-            x, n_filters = 768, size = [x.get_shape()[1].value, x.get_shape()[2].value],
+            x, n_filters = 768, size = [x.get_shape()[a].value for a in spatial_axes()],
             padding = "VALID",
             is_training = is_training,
             regularizer = regularizer,
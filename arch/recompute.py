@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import re
+import tensorflow as tf
+
+# collection of the tensors kept for the backpropagation, the activations
+# between them are recomputed
+CHECKPOINTS = "recompute_checkpoints"
+
+# ops never recomputed, their outputs are used by the recomputed ops
+_INPUT_OPS = ("Placeholder", "PlaceholderV2", "PlaceholderWithDefault")
+
+# name scopes of the blocks of the builders: residual blocks, the layers of
+# the dense blocks, transition layers, Inception modules and NASNet cells
+BLOCK_SCOPES = (r"(.*/)?(residual_block_\d+|(reduction_)?bn_act_conv_\d+|transition_layer_\d+"
+                r"|inception_(grid|filterbank)\w*|reduction_\d+|nasnet_(normal|reduction)_\d+)")
+
+# name scopes of the layers of the builders: residual layers, dense blocks
+# (the bottleneck ones are named dense_bootleneck_block_<i> by the builders),
+# transition layers, Inception modules and NASNet cells
+LAYER_SCOPES = (r"(.*/)?(residual_\d+|dense_block_\d+|dense_(bootleneck|bottleneck)_block(_\d+)?"
+                r"|transition_layer_\d+"
+                r"|inception_(grid|filterbank)\w*|reduction_\d+|nasnet_(normal|reduction)_\d+)")
+
+
+def add_checkpoint(tensor):
+    """Marks a tensor to be kept for the backpropagation."""
+    tf.add_to_collection(CHECKPOINTS, tensor)
+    return tensor
+
+
+def checkpoint_scopes(pattern, every = 1, graph = None):
+    """Marks the outputs of name scopes to be kept for the backpropagation,
+    i.e. the floating point tensors (except scalars) of the ops in a scope
+    used by ops outside of it. Fewer scopes save more memory for more
+    recomputation.
+    Args:
+        pattern: A regex matching the full names of the scopes, e.g.
+            BLOCK_SCOPES or LAYER_SCOPES.
+        every: Only the outputs of every n-th matching scope (in the order
+            of creation) are kept.
+        graph: The graph, if None the default graph.
+    Returns:
+        A list of the marked tensors.
+    """
+    if graph is None:
+        graph = tf.get_default_graph()
+    regex = re.compile(pattern)
+    ops = graph.get_operations()
+
+    # matching scopes in the order of their first ops
+    seen = set()
+    scopes = []
+    for op in ops:
+        parts = op.name.split("/")[:-1]
+        for k in range(1, len(parts)+1):
+            scope = "/".join(parts[:k])
+            if scope in seen:
+                continue
+            seen.add(scope)
+            if regex.fullmatch(scope):
+                scopes.append(scope)
+    scopes = set(scopes[every-1::every])
+
+    outputs = []
+    for op in ops:
+        if not _is_recomputable(op):
+            continue
+        parts = op.name.split("/")[:-1]
+        prefixes = ["/".join(parts[:k]) + "/" for k in range(1, len(parts)+1)
+                    if "/".join(parts[:k]) in scopes]
+        for t in op.outputs:
+            if (not t.dtype.is_floating) or (t.get_shape().ndims == 0):
+                continue
+            if any(not c.name.startswith(prefix) for prefix in prefixes for c in t.consumers()):
+                outputs.append(add_checkpoint(t))
+    return outputs
+
+
+def _is_recomputable(op):
+    # stateful ops (variables, random ops, iterators) must not run twice
+    return (op.type not in _INPUT_OPS) and not op.op_def.is_stateful
+
+
+def _backward_ops(outputs, stop_ts):
+    """Returns the recomputable ops the outputs depend on, without going
+    beyond the stop tensors.
+    """
+    found = set()
+    stack = [t.op for t in outputs]
+    while stack:
+        op = stack.pop()
+        if (op in found) or not _is_recomputable(op):
+            continue
+        found.add(op)
+        stack.extend(t.op for t in op.inputs if t not in stop_ts)
+    return found
+
+
+def _sum(grads):
+    grads = [g for g in grads if g is not None]
+    if not grads:
+        return None
+    if len(grads) == 1:
+        return grads[0]
+    return tf.add_n([tf.convert_to_tensor(g) for g in grads])
+
+
+def gradients(ys, xs, checkpoints, grad_ys = None):
+    """Computes the gradients as tf.gradients, but keeps only the checkpoint
+    tensors of the forward pass: the backpropagation of each segment between
+    the checkpoints runs on a copy of the segment, recomputed when the
+    gradients of its outputs are available. The memory of the activations is
+    about the checkpoints plus the largest segment, for one more forward pass.
+    Random ops (e.g. dropout masks) are not recomputed, their outputs are
+    kept.
+    Args:
+        ys: A tensor or a list of tensors to be differentiated.
+        xs: A list of tensors or variables.
+        checkpoints: A list of tensors to be kept, e.g. the outputs of the
+            blocks of a network.
+        grad_ys: An optional list of the gradients of ys.
+    Returns:
+        A list of the gradients of xs, None for the unconnected ones.
+    """
+    if not isinstance(ys, (list, tuple)):
+        ys = [ys]
+    if grad_ys is None:
+        grad_ys = [tf.ones_like(y) for y in ys]
+    graph = ys[0].graph
+    order = {op: i for i, op in enumerate(graph.get_operations())}
+
+    # checkpoints needed for ys, in reverse topological order
+    needed = _backward_ops(ys, set())
+    checkpoints = sorted(set(t for t in checkpoints if (t.op in needed) and (t not in ys)),
+                         key = lambda t: order[t.op], reverse = True)
+    with tf.name_scope("recompute"):
+        stopped = {t: tf.stop_gradient(t) for t in checkpoints}
+
+    checkpoint_grads = {t: [] for t in checkpoints}
+    x_grads = [[] for _ in xs]
+    segments = [(list(ys), list(grad_ys))] + [([t], checkpoint_grads[t]) for t in checkpoints]
+    for boundary, boundary_grads in segments:
+        if len(boundary) == 1:
+            boundary_grads = [_sum(boundary_grads)]
+            if boundary_grads[0] is None:
+                continue
+        stop_ts = set(checkpoints) - set(boundary)
+        ops = _backward_ops(boundary, stop_ts)
+        inputs = [t for t in set(t for op in ops for t in op.inputs) if t in stop_ts]
+        if ops:
+            replacements = {t: stopped[t] for t in inputs}
+            _, info = tf.contrib.graph_editor.copy_with_input_replacements(
+                    tf.contrib.graph_editor.sgv(list(ops)), replacements)
+            # delays the recomputation until the backpropagation reaches it
+            copied_ops = [info.transformed(op) for op in ops]
+            tf.contrib.graph_editor.add_control_inputs(
+                    copied_ops, [g.op for g in boundary_grads])
+            boundary = [info.transformed(t) if t.op in ops else t for t in boundary]
+        targets = [stopped[t] for t in inputs] + list(xs)
+        grads = tf.gradients(boundary, targets, grad_ys = boundary_grads)
+        for t, g in zip(inputs, grads[:len(inputs)]):
+            checkpoint_grads[t].append(g)
+        for i, g in enumerate(grads[len(inputs):]):
+            x_grads[i].append(g)
+    return [_sum(grads) for grads in x_grads]
+
+
+def minimize(optimizer, loss, checkpoints = None, var_list = None, global_step = None):
+    """Creates the training op of an optimizer as optimizer.minimize, with
+    the gradients recomputed between the checkpoints.
+    Args:
+        optimizer: A tf.train.Optimizer.
+        loss: A scalar tensor.
+        checkpoints: A list of tensors to be kept, if None the ones of the
+            CHECKPOINTS collection.
+        var_list: A list of the variables to be optimized, if None the
+            trainable variables.
+        global_step: An optional variable incremented by the training op.
+    Returns:
+        The training op.
+    """
+    if checkpoints is None:
+        checkpoints = tf.get_collection(CHECKPOINTS)
+    if var_list is None:
+        var_list = tf.trainable_variables()
+    grads = gradients(loss, var_list, checkpoints)
+    grads_and_vars = [(g, v) for g, v in zip(grads, var_list) if g is not None]
+    return optimizer.apply_gradients(grads_and_vars, global_step = global_step)
@@ -3,6 +3,7 @@
 
 import tensorflow as tf
 from arch.layers import conv2d, conv2d_bn_act, conv2d_bn
+from arch.layers import n_channels
 from arch.initializers import He_normal
 
 # He et al. Deep Residual Learning for Image Recognition, 2015
@@ -21,7 +22,7 @@ def residual_block(
         is_training = False,
         name = "residual_block"):   
     with tf.variable_scope(name):        
-        if (inputs.shape[3] != n_filters) or (stride != 1):
+        if (n_channels(inputs) != n_filters) or (stride != 1):
             shortcut = conv2d_bn(
                     inputs, size = 1, n_filters = n_filters, stride = stride,
                     is_training = is_training,
@@ -63,7 +64,7 @@ def bottleneck_block(
         is_training = False,
         name = "bottleneck_block"):
     with tf.variable_scope(name):        
-        if (inputs.shape[3] != n_filters) or (stride != 1):
+        if (n_channels(inputs) != n_filters) or (stride != 1):
             shortcut = conv2d_bn(
                     inputs, size = 1, n_filters = n_filters, stride = stride,
                     is_training = is_training,
@@ -5,6 +5,7 @@
 import tensorflow as tf
 from arch.initializers import He_normal
 from arch.layers import conv2d, bn_act_conv2d
+from arch.layers import n_channels
 
 #He et al., Identity Mappings in Deep Residual Networks
 #https://arxiv.org/abs/1603.05027
@@ -21,7 +22,7 @@ def identity_mapping_block(
         skip_first_bn_act = False,
         name = "residual_block"):   
     with tf.variable_scope(name):        
-        if (inputs.shape[3] != n_filters) or (stride != 1):
+        if (n_channels(inputs) != n_filters) or (stride != 1):
             shortcut = conv2d(
                     inputs, size = 1, n_filters = n_filters, stride = stride,
                     regularizer = regularizer,
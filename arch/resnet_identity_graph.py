@@ -4,6 +4,7 @@
 from functools import partial
 import tensorflow as tf
 from arch.layers import conv2d_bn_act, global_avg_pool2d, dense
+from arch.layers import channel_axis
 from arch.initializers import He_normal, Kumar_normal
 from arch import resnet
 from arch import resnet_identity
@@ -53,7 +54,7 @@ def cifar10_resnet_identity(x, n_blocks = 3, seed = 42):
     layers.append(("residual_3", res3))
     
     bn = tf.layers.batch_normalization(
-            res3, training = training, name = "batch_norm")
+            res3, axis = channel_axis(), training = training, name = "batch_norm")
     layers.append(("batch_norm", bn))
     bn_relu = tf.nn.relu(bn, name = "relu")
     layers.append(("batch_norm_relu", bn_relu))
@@ -126,7 +127,7 @@ def cifar10_resnet_identity_wd(x, n_blocks = 3, weight_decay = 0.0001, seed = 42
     layers.append(("residual_3", res3))
     
     bn = tf.layers.batch_normalization(
-            res3, training = training, name = "batch_norm")
+            res3, axis = channel_axis(), training = training, name = "batch_norm")
     layers.append(("batch_norm", bn))
     bn_relu = tf.nn.relu(bn, name = "relu")
     layers.append(("batch_norm_relu", bn_relu))
@@ -3,6 +3,7 @@
 
 import tensorflow as tf
 from arch.layers import conv2d_bn_act, conv2d_bn, group_conv2d
+from arch.layers import channel_axis, n_channels
 from arch.initializers import He_normal
 
 #Xie et al. Aggregated Residual Transformations for Deep Neural Networks, 2017
@@ -16,6 +17,7 @@ def bottleneck_block(
         size = 3,
         stride = 1,
         activation = tf.nn.relu,
+        fused = False,
         is_training = False,
         regularizer = None,
         kernel_init = He_normal(seed = 42),
@@ -23,7 +25,7 @@ def bottleneck_block(
     n_filters_reduce = cardinality*group_width
     n_filters = n_filters_reduce*2
     with tf.variable_scope(name):        
-        if (inputs.shape[3] != n_filters) or (stride != 1):
+        if (n_channels(inputs) != n_filters) or (stride != 1):
             shortcut = conv2d_bn(
                     inputs, size = 1, n_filters = n_filters, stride = stride,
                     is_training = is_training,
@@ -45,12 +47,13 @@ def bottleneck_block(
                 x, size = size, stride = stride,
                 cardinality = cardinality,
                 n_filters = n_filters_reduce,
+                fused = fused,
                 regularizer = regularizer,
                 kernel_init = kernel_init,
                 name = "group_conv_2"
                 )
         x = tf.layers.batch_normalization(
-                x, training = is_training, name = "batch_norm_2")
+                x, axis = channel_axis(), training = is_training, name = "batch_norm_2")
         x = activation(x, name = "activation_2")
 
         x = conv2d_bn(
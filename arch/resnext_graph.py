@@ -8,7 +8,7 @@ from arch.initializers import He_normal, Kumar_normal
 from arch import resnext
 from functools import partial
 
-def cifar10_resnext(x, n_blocks, cardinality = 8, group_width = 16, seed = 42):
+def cifar10_resnext(x, n_blocks, cardinality = 8, group_width = 16, fused = False, seed = 42):
     layers = []
     variables = []
 
@@ -27,7 +27,7 @@ def cifar10_resnext(x, n_blocks, cardinality = 8, group_width = 16, seed = 42):
             conv, n_blocks = n_blocks, stride = 1,
             cardinality = cardinality,
             group_width = group_width,
-            block_function = resnext.bottleneck_block,
+            block_function = partial(resnext.bottleneck_block, fused = fused),
             is_training = training,
             kernel_init = He_normal(seed = seed+2),
             name = "residual_1")
@@ -37,7 +37,7 @@ def cifar10_resnext(x, n_blocks, cardinality = 8, group_width = 16, seed = 42):
             res1, n_blocks = n_blocks, stride = 2,
             cardinality = cardinality,
             group_width = group_width*2,
-            block_function = resnext.bottleneck_block,
+            block_function = partial(resnext.bottleneck_block, fused = fused),
             is_training = training,
             kernel_init = He_normal(seed = seed+3),            
             name="residual_2")
@@ -47,7 +47,7 @@ def cifar10_resnext(x, n_blocks, cardinality = 8, group_width = 16, seed = 42):
             res2, n_blocks = n_blocks, stride = 2,
             cardinality = cardinality,
             group_width = group_width*4,
-            block_function = resnext.bottleneck_block,
+            block_function = partial(resnext.bottleneck_block, fused = fused),
             is_training = training,
             kernel_init = He_normal(seed = seed+4),
             name = "residual_3")
@@ -68,9 +68,11 @@ def cifar10_resnext(x, n_blocks, cardinality = 8, group_width = 16, seed = 42):
     return layers, variables
 
 cifar10_resnext_29 = partial(cifar10_resnext, n_blocks = 3)
+# the same network with fused group convolutions, and the same variables
+cifar10_resnext_29_fused = partial(cifar10_resnext, n_blocks = 3, fused = True)
 
 
-def cifar10_resnext_wd(x, n_blocks, cardinality = 8, group_width = 16, weight_decay = 0.0001, seed = 42):
+def cifar10_resnext_wd(x, n_blocks, cardinality = 8, group_width = 16, fused = False, weight_decay = 0.0001, seed = 42):
     layers = []
     variables = []
 
@@ -93,6 +95,7 @@ def cifar10_resnext_wd(x, n_blocks, cardinality = 8, group_width = 16, weight_de
             block_function = partial(
                     resnext.bottleneck_block,
                     regularizer = tf.contrib.layers.l2_regularizer(weight_decay),
+                    fused = fused,
                     ),
             is_training = training,
             kernel_init = He_normal(seed = seed+2),
@@ -106,6 +109,7 @@ def cifar10_resnext_wd(x, n_blocks, cardinality = 8, group_width = 16, weight_de
             block_function = partial(
                     resnext.bottleneck_block,
                     regularizer = tf.contrib.layers.l2_regularizer(weight_decay),
+                    fused = fused,
                     ),
             is_training = training,
             kernel_init = He_normal(seed = seed+3),            
@@ -119,6 +123,7 @@ def cifar10_resnext_wd(x, n_blocks, cardinality = 8, group_width = 16, weight_de
             block_function = partial(
                     resnext.bottleneck_block,
                     regularizer = tf.contrib.layers.l2_regularizer(weight_decay),
+                    fused = fused,
                     ),
             is_training = training,
             kernel_init = He_normal(seed = seed+4),
@@ -141,3 +146,4 @@ def cifar10_resnext_wd(x, n_blocks, cardinality = 8, group_width = 16, weight_de
     return layers, variables
 
 cifar10_resnext_29_wd = partial(cifar10_resnext_wd, n_blocks = 3)
+cifar10_resnext_29_wd_fused = partial(cifar10_resnext_wd, n_blocks = 3, fused = True)
@@ -3,6 +3,7 @@
 
 import tensorflow as tf
 from arch.layers import conv2d, conv2d_bn_act, conv2d_bn, group_conv2d_fixdepth
+from arch.layers import channel_axis, n_channels, get_data_format
 from arch.layers import dense_relu, dense_sigmoid, global_avg_pool2d
 from arch.initializers import He_normal, Kumar_normal
 
@@ -19,7 +20,7 @@ def squeeze_and_excite(
         kernel_init_1 = He_normal(seed = 42),
         kernel_init_2 = Kumar_normal(activation = "sigmoid", mode = "FAN_AVG", seed = 42),
         name = "squeeze_excite"):
-    in_filt = inputs.shape[3].value
+    in_filt = n_channels(inputs)
     with tf.variable_scope(name):
         x = global_avg_pool2d(inputs)
         x = dense_relu(
@@ -32,7 +33,10 @@ def squeeze_and_excite(
                 regularizer = regularizer,
                 kernel_init = kernel_init_2,
                 name = "dense_2")
-        x = tf.reshape(x, [-1, 1, 1, in_filt])
+        if get_data_format() == "channels_first":
+            x = tf.reshape(x, [-1, in_filt, 1, 1])
+        else:
+            x = tf.reshape(x, [-1, 1, 1, in_filt])
         outputs = tf.multiply(inputs, x)
     return outputs
 
@@ -51,7 +55,7 @@ def se_resnet_residual_block(
         is_training = False,
         name = "se_resnet_residual_block"):   
     with tf.variable_scope(name):
-        if (inputs.shape[3] != n_filters) or (stride != 1):
+        if (n_channels(inputs) != n_filters) or (stride != 1):
             shortcut = conv2d_bn(
                     inputs, size = 1, n_filters = n_filters, stride = stride,
                     is_training = is_training,
@@ -103,7 +107,7 @@ def se_resnet_bottleneck_block(
         is_training = False,
         name = "se_resnet_residual_block"):   
     with tf.variable_scope(name):
-        if (inputs.shape[3] != n_filters) or (stride != 1):
+        if (n_channels(inputs) != n_filters) or (stride != 1):
             shortcut = conv2d_bn(
                     inputs, size = 1, n_filters = n_filters, stride = stride,
                     is_training = is_training,
@@ -156,6 +160,7 @@ def se_resnext_bottleneck_block(
         stride = 1,
         ratio = 16,
         activation = tf.nn.relu,
+        fused = False,
         is_training = False,
         regularizer = None,
         kernel_init = He_normal(seed = 42),
@@ -165,7 +170,7 @@ def se_resnext_bottleneck_block(
     n_filters_reduce = cardinality*group_width
     n_filters = n_filters_reduce*2
     with tf.variable_scope(name):        
-        if (inputs.shape[3] != n_filters) or (stride != 1):
+        if (n_channels(inputs) != n_filters) or (stride != 1):
             shortcut = conv2d_bn(
                     inputs, size = 1, n_filters = n_filters, stride = stride,
                     is_training = is_training,
@@ -186,12 +191,13 @@ def se_resnext_bottleneck_block(
                 x, size = size, stride = stride,
                 cardinality = cardinality,
                 group_width = group_width,
+                fused = fused,
                 regularizer = regularizer,
                 kernel_init = kernel_init,
                 name = "group_conv_2"
                 )
         x = tf.layers.batch_normalization(
-                x, training = is_training, name = "batch_norm_2")
+                x, axis = channel_axis(), training = is_training, name = "batch_norm_2")
         x = activation(x, name = "activation_2")
 
         x = conv2d_bn(
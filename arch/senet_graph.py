@@ -157,7 +157,7 @@ def cifar10_se_resnet_wd(x, n_blocks = 3, ratio = 8, weight_decay = 0.0001, seed
 cifar10_se_resnet_20_wd = partial(cifar10_se_resnet_wd, n_blocks = 3)
 
 
-def cifar10_se_resnext(x, n_blocks, cardinality = 8, group_width = 16, ratio = 16, seed = 42):
+def cifar10_se_resnext(x, n_blocks, cardinality = 8, group_width = 16, ratio = 16, fused = False, seed = 42):
 
     layers = []
     variables = []
@@ -180,6 +180,7 @@ def cifar10_se_resnext(x, n_blocks, cardinality = 8, group_width = 16, ratio = 1
             block_function = partial(
                     senet.se_resnext_bottleneck_block,
                     ratio = ratio,
+                    fused = fused,
                     se_kernel_init_1 = He_normal(seed = seed+2),
                     se_kernel_init_2 = Kumar_normal(activation = "sigmoid", mode = "FAN_AVG", seed = seed+2),
                     ),
@@ -195,6 +196,7 @@ def cifar10_se_resnext(x, n_blocks, cardinality = 8, group_width = 16, ratio = 1
             block_function = partial(
                     senet.se_resnext_bottleneck_block,
                     ratio = ratio,
+                    fused = fused,
                     se_kernel_init_1 = He_normal(seed = seed+3),
                     se_kernel_init_2 = Kumar_normal(activation = "sigmoid", mode = "FAN_AVG", seed = seed+3),
                     ),
@@ -210,6 +212,7 @@ def cifar10_se_resnext(x, n_blocks, cardinality = 8, group_width = 16, ratio = 1
             block_function = partial(
                     senet.se_resnext_bottleneck_block,
                     ratio = ratio,
+                    fused = fused,
                     se_kernel_init_1 = He_normal(seed = seed+4),
                     se_kernel_init_2 = Kumar_normal(activation = "sigmoid", mode = "FAN_AVG", seed = seed+4),
                     ),
@@ -233,9 +236,10 @@ def cifar10_se_resnext(x, n_blocks, cardinality = 8, group_width = 16, ratio = 1
     return layers, variables
 
 cifar10_se_resnext_29 = partial(cifar10_se_resnext, n_blocks = 3)
+cifar10_se_resnext_29_fused = partial(cifar10_se_resnext, n_blocks = 3, fused = True)
 
 
-def cifar10_se_resnext_wd(x, n_blocks, cardinality = 8, group_width = 16, ratio = 16, weight_decay = 0.0001, seed = 42):
+def cifar10_se_resnext_wd(x, n_blocks, cardinality = 8, group_width = 16, ratio = 16, fused = False, weight_decay = 0.0001, seed = 42):
 
     layers = []
     variables = []
@@ -259,6 +263,7 @@ def cifar10_se_resnext_wd(x, n_blocks, cardinality = 8, group_width = 16, ratio
             block_function = partial(
                     senet.se_resnext_bottleneck_block,
                     ratio = ratio,
+                    fused = fused,
                     regularizer = tf.contrib.layers.l2_regularizer(weight_decay),
                     se_kernel_init_1 = He_normal(seed = seed+2),
                     se_kernel_init_2 = Kumar_normal(activation = "sigmoid", mode = "FAN_AVG", seed = seed+2),
@@ -275,6 +280,7 @@ def cifar10_se_resnext_wd(x, n_blocks, cardinality = 8, group_width = 16, ratio
             block_function = partial(
                     senet.se_resnext_bottleneck_block,
                     ratio = ratio,
+                    fused = fused,
                     regularizer = tf.contrib.layers.l2_regularizer(weight_decay),
                     se_kernel_init_1 = He_normal(seed = seed+3),
                     se_kernel_init_2 = Kumar_normal(activation = "sigmoid", mode = "FAN_AVG", seed = seed+3),
@@ -291,6 +297,7 @@ def cifar10_se_resnext_wd(x, n_blocks, cardinality = 8, group_width = 16, ratio
             block_function = partial(
                     senet.se_resnext_bottleneck_block,
                     ratio = ratio,
+                    fused = fused,
                     regularizer = tf.contrib.layers.l2_regularizer(weight_decay),
                     se_kernel_init_1 = He_normal(seed = seed+4),
                     se_kernel_init_2 = Kumar_normal(activation = "sigmoid", mode = "FAN_AVG", seed = seed+4),
@@ -316,4 +323,5 @@ def cifar10_se_resnext_wd(x, n_blocks, cardinality = 8, group_width = 16, ratio
     return layers, variables
 
 cifar10_se_resnext_29_wd = partial(cifar10_se_resnext_wd, n_blocks = 3)
+cifar10_se_resnext_29_wd_fused = partial(cifar10_se_resnext_wd, n_blocks = 3, fused = True)
 
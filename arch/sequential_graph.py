@@ -3,7 +3,7 @@
 
 import tensorflow as tf
 from arch.layers import conv2d_relu, conv2d_selu, conv2d_relu_bn, conv2d_bn_relu
-from arch.layers import dense, dense_selu, dense_relu, max_pool2d, global_avg_pool2d, flatten
+from arch.layers import dense, dense_selu, dense_relu, max_pool2d, global_avg_pool2d, flatten, lrn
 from arch.initializers import He_normal, Kumar_normal
 from arch.selu import dropout_selu, conv_selu_safe_initializer, dense_selu_safe_initializer
 
@@ -26,7 +26,7 @@ def cifar10_sequential_clrn3d(
             kernel_init = tf.truncated_normal_initializer(stddev = 5e-2, seed = seed+1),
             name = "conv_1")
     layers.append(("conv_1", conv1))
-    norm1 = tf.nn.lrn(
+    norm1 = lrn(
             conv1,
             depth_radius = 4, bias = 1.0, alpha = 0.001/9.0, beta = 0.75,
             name = "norm_1")
@@ -44,7 +44,7 @@ def cifar10_sequential_clrn3d(
             kernel_init = tf.truncated_normal_initializer(stddev = 5e-2, seed = seed+2),
             name = "conv_2")
     layers.append(("conv_2", conv2))            
-    norm2 = tf.nn.lrn(
+    norm2 = lrn(
             conv2,
             depth_radius = 4, bias = 1.0, alpha = 0.001/9.0, beta = 0.75,
             name = "norm_2")
@@ -62,7 +62,7 @@ def cifar10_sequential_clrn3d(
             kernel_init = tf.truncated_normal_initializer(stddev = 5e-2, seed = seed+3),
             name = "conv_3")
     layers.append(("conv_3", conv3))
-    norm3 = tf.nn.lrn(
+    norm3 = lrn(
             conv3,
             depth_radius = 4, bias = 1.0, alpha = 0.001/9.0, beta = 0.75,
             name = "norm_3")
@@ -468,7 +468,7 @@ def cifar10_sequential_clrn5d3_wd(
             kernel_init = He_normal(seed = seed+1),
             name = "conv_1")
     layers.append(("conv_1", conv1))    
-    norm1 = tf.nn.lrn(
+    norm1 = lrn(
             conv1,
             depth_radius = 4, bias = 1.0, alpha = 0.001/9.0, beta = 0.75,
             name = "norm_1")
@@ -483,7 +483,7 @@ def cifar10_sequential_clrn5d3_wd(
             kernel_init = He_normal(seed = seed+2),
             name = "conv_2")
     layers.append(("conv_2", conv2))
-    norm2 = tf.nn.lrn(
+    norm2 = lrn(
             conv2,
             depth_radius = 4, bias = 1.0, alpha = 0.001/9.0, beta = 0.75,
             name = "norm_2")
@@ -498,7 +498,7 @@ def cifar10_sequential_clrn5d3_wd(
             kernel_init = He_normal(seed = seed+3),
             name = "conv_3")
     layers.append(("conv_3", conv3))
-    norm3 = tf.nn.lrn(
+    norm3 = lrn(
             conv3,
             depth_radius = 4, bias = 1.0, alpha = 0.001/9.0, beta = 0.75,
             name = "norm_3")
@@ -509,7 +509,7 @@ def cifar10_sequential_clrn5d3_wd(
             kernel_init = He_normal(seed = seed+4),
             name = "conv_4")
     layers.append(("conv_4", conv4))
-    norm4 = tf.nn.lrn(
+    norm4 = lrn(
             conv4,
             depth_radius = 4, bias = 1.0, alpha = 0.001/9.0, beta = 0.75,
             name = "norm_1")
@@ -520,7 +520,7 @@ def cifar10_sequential_clrn5d3_wd(
             kernel_init = He_normal(seed = seed+5),
             name = "conv_5")
     layers.append(("conv_5", conv5))
-    norm5 = tf.nn.lrn(
+    norm5 = lrn(
             conv5,
             depth_radius = 4, bias = 1.0, alpha = 0.001/9.0, beta = 0.75,
             name = "norm_5")
@@ -2,8 +2,10 @@
 # -*- coding: utf-8 -*-
 
 
+import numpy as np
 import tensorflow as tf
 from arch.layers import separable_conv2d, group_conv2d, avg_pool2d
+from arch.layers import channel_axis, n_channels, get_data_format
 from arch.initializers import He_normal
 
 #Zhang et al., ShuffleNet: An Extremely Efficient Convolutional Neural Network for Mobile Devices
@@ -17,14 +19,28 @@ def shuffle_channels(
         n_groups,
         name = "shuffle"):
     with tf.variable_scope(name):
-        h, w, n_chans = inputs.get_shape().as_list()[1:]
-        chans_per_group = n_chans // n_groups
-        x = tf.reshape(inputs, [-1, h, w, n_groups, chans_per_group])
-        x = tf.transpose(x, perm=[0,1,2,4,3])
-        x = tf.reshape(x, [-1, h, w, n_chans])
+        if get_data_format() == "channels_first":
+            n_chans, h, w = inputs.get_shape().as_list()[1:]
+            chans_per_group = n_chans // n_groups
+            x = tf.reshape(inputs, [-1, n_groups, chans_per_group, h, w])
+            x = tf.transpose(x, perm=[0,2,1,3,4])
+            x = tf.reshape(x, [-1, n_chans, h, w])
+        else:
+            h, w, n_chans = inputs.get_shape().as_list()[1:]
+            chans_per_group = n_chans // n_groups
+            x = tf.reshape(inputs, [-1, h, w, n_groups, chans_per_group])
+            x = tf.transpose(x, perm=[0,1,2,4,3])
+            x = tf.reshape(x, [-1, h, w, n_chans])
     return x
         
 
+def shuffle_permutation(n_chans, n_groups):
+    """Returns the channel order of shuffle_channels, i.e. channel c of the
+    shuffled tensor is channel permutation[c] of the input.
+    """
+    return np.arange(n_chans).reshape(n_groups, n_chans // n_groups).T.reshape(-1)
+
+
 def shuffle_unit(
         inputs,
         n_filters,
@@ -33,11 +49,17 @@ def shuffle_unit(
         activation = tf.nn.relu,
         reduction_ratio = 0.25,
         n_groups = 8,
+        fused = False,
+        fold_shuffle = False,
         is_training = False,
         regularizer = None,
         kernel_init = He_normal(seed = 42),
         bias_init = tf.zeros_initializer(),
         name = "shuffle_unit"):
+    """Creates a ShuffleNet unit. If fold_shuffle is True, the channels are not
+    shuffled, the separable convolution reorders its weights instead. The
+    outputs and the variables are the same as with the shuffle.
+    """
     with tf.variable_scope(name):
         n_filters_reduction = int(n_filters*reduction_ratio)
         
@@ -51,42 +73,49 @@ def shuffle_unit(
                 inputs, size = 1, cardinality = n_groups,
                 n_filters = n_filters_reduction,
                 stride = 1,
+                fused = fused,
                 regularizer = regularizer,
                 kernel_init = kernel_init,
                 bias_init = bias_init,
                 name = "group_conv2d_1")
         x = tf.layers.batch_normalization(
-            x, training = is_training, name = "batch_norm_1")
+            x, axis = channel_axis(), training = is_training, name = "batch_norm_1")
         x = activation(x, name="activation_1")
         
-        x = shuffle_channels(x, n_groups = n_groups, name = "shuffle")
+        if fold_shuffle:
+            permutation = shuffle_permutation(n_channels(x), n_groups)
+        else:
+            permutation = None
+            x = shuffle_channels(x, n_groups = n_groups, name = "shuffle")
     
         x = separable_conv2d(
                 x, size = size, n_filters = n_filters,
                 stride = stride,
+                input_permutation = permutation,
                 regularizer = regularizer,
                 depth_init = kernel_init,
                 pointwise_init = kernel_init,
                 bias_init = bias_init,
                 name = "separable_conv")    
         x = tf.layers.batch_normalization(
-            x, training = is_training, name = "batch_norm_2")
+            x, axis = channel_axis(), training = is_training, name = "batch_norm_2")
 
         x = group_conv2d(
                 x, size = 1, cardinality = n_groups,
-                n_filters = n_filters if stride == 1 else n_filters-inputs.shape[3].value,
+                n_filters = n_filters if stride == 1 else n_filters-n_channels(inputs),
                 stride = 1,
+                fused = fused,
                 regularizer = regularizer,
                 kernel_init = kernel_init,
                 bias_init = bias_init,
                 name = "group_conv2d_2")
         x = tf.layers.batch_normalization(
-            x, training = is_training, name="batch_norm_3")
+            x, axis = channel_axis(), training = is_training, name="batch_norm_3")
     
         if stride == 1:
             x = tf.add(x, shortcut, name = "add")
         else:
-            x = tf.concat([x, shortcut], axis = 3, name = "concat")
+            x = tf.concat([x, shortcut], axis = channel_axis(), name = "concat")
         x = activation(x, name = "activation_2")
         
     return x
@@ -99,6 +128,8 @@ def shufflenet_layer(
         size = 3,
         reduction_ratio = 0.25,
         n_groups = 8,
+        fused = False,
+        fold_shuffle = False,
         is_training = False,
         regularizer = None,
         kernel_init = He_normal(seed = 42),
@@ -114,6 +145,8 @@ def shufflenet_layer(
                 activation = tf.nn.relu,
                 reduction_ratio = reduction_ratio,
                 n_groups = n_groups,
+                fused = fused,
+                fold_shuffle = fold_shuffle,
                 regularizer = regularizer,
                 kernel_init = kernel_init,
                 bias_init = bias_init,
@@ -129,6 +162,8 @@ def shufflenet_layer(
                     activation = tf.nn.relu,
                     reduction_ratio = reduction_ratio,
                     n_groups = n_groups,
+                    fused = fused,
+                    fold_shuffle = fold_shuffle,
                     regularizer = regularizer,
                     kernel_init = kernel_init,
                     bias_init = bias_init,
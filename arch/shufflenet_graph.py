@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+from functools import partial
 import tensorflow as tf
 from arch.layers import conv2d_bn_relu, global_avg_pool2d, dense
 from arch.initializers import He_normal, Kumar_normal
@@ -7,7 +8,7 @@ from arch import shufflenet
 
 #Zhang et al., ShuffleNet: An Extremely Efficient Convolutional Neural Network for Mobile Devices
 #https://arxiv.org/pdf/1707.01083.pdf
-def cifar10_shufflenet(x, n_groups = 2, n_filters = 200, ratio = 1.0, seed = 42):    
+def cifar10_shufflenet(x, n_groups = 2, n_filters = 200, ratio = 1.0, fused = False, fold_shuffle = False, seed = 42):    
     layers = []
     variables = []
 
@@ -24,6 +25,8 @@ def cifar10_shufflenet(x, n_groups = 2, n_filters = 200, ratio = 1.0, seed = 42)
     slayer1 = shufflenet.shufflenet_layer(
             conv, n_filters = n_filters,
             n_repeat = 3, n_groups = n_groups,
+            fused = fused,
+            fold_shuffle = fold_shuffle,
             reduction_ratio = ratio,
             is_training = training,
             kernel_init = He_normal(seed = seed+2),
@@ -33,6 +36,8 @@ def cifar10_shufflenet(x, n_groups = 2, n_filters = 200, ratio = 1.0, seed = 42)
     slayer2 = shufflenet.shufflenet_layer(
             slayer1, n_filters = n_filters*2,
             n_repeat = 7, n_groups = n_groups,
+            fused = fused,
+            fold_shuffle = fold_shuffle,
             reduction_ratio = ratio,
             is_training = training,
             kernel_init = He_normal(seed = seed+3),
@@ -42,6 +47,8 @@ def cifar10_shufflenet(x, n_groups = 2, n_filters = 200, ratio = 1.0, seed = 42)
     slayer3 = shufflenet.shufflenet_layer(
             slayer2, n_filters = n_filters*4,
             n_repeat = 3, n_groups = n_groups,
+            fused = fused,
+            fold_shuffle = fold_shuffle,
             reduction_ratio = ratio,
             is_training = training,
             kernel_init = He_normal(seed = seed+4),
@@ -63,7 +70,7 @@ def cifar10_shufflenet(x, n_groups = 2, n_filters = 200, ratio = 1.0, seed = 42)
     return layers, variables
 
 
-def cifar10_shufflenet_wd(x, n_groups = 2, n_filters = 200, ratio = 1.0,  weight_decay = 4e-5, seed = 42):    
+def cifar10_shufflenet_wd(x, n_groups = 2, n_filters = 200, ratio = 1.0, fused = False, fold_shuffle = False, weight_decay = 4e-5, seed = 42):    
     layers = []
     variables = []
 
@@ -81,6 +88,8 @@ def cifar10_shufflenet_wd(x, n_groups = 2, n_filters = 200, ratio = 1.0,  weight
     slayer1 = shufflenet.shufflenet_layer(
             conv, n_filters = n_filters,
             n_repeat = 3, n_groups = n_groups,
+            fused = fused,
+            fold_shuffle = fold_shuffle,
             reduction_ratio = ratio,
             is_training = training,
             regularizer = tf.contrib.layers.l2_regularizer(weight_decay),
@@ -91,6 +100,8 @@ def cifar10_shufflenet_wd(x, n_groups = 2, n_filters = 200, ratio = 1.0,  weight
     slayer2 = shufflenet.shufflenet_layer(
             slayer1, n_filters = n_filters*2,
             n_repeat = 7, n_groups = n_groups,
+            fused = fused,
+            fold_shuffle = fold_shuffle,
             reduction_ratio = ratio,
             is_training = training,
             regularizer = tf.contrib.layers.l2_regularizer(weight_decay),
@@ -101,6 +112,8 @@ def cifar10_shufflenet_wd(x, n_groups = 2, n_filters = 200, ratio = 1.0,  weight
     slayer3 = shufflenet.shufflenet_layer(
             slayer2, n_filters = n_filters*4,
             n_repeat = 3, n_groups = n_groups,
+            fused = fused,
+            fold_shuffle = fold_shuffle,
             reduction_ratio = ratio,
             is_training = training,
             regularizer = tf.contrib.layers.l2_regularizer(weight_decay),
@@ -121,4 +134,12 @@ def cifar10_shufflenet_wd(x, n_groups = 2, n_filters = 200, ratio = 1.0,  weight
     prob = tf.nn.softmax(dense1, name = "prob")
     layers.append(("prob", prob))
     
-    return layers, variables
\ No newline at end of file
+    return layers, variables
+
+
+cifar10_shufflenet_fused = partial(cifar10_shufflenet, fused = True)
+cifar10_shufflenet_wd_fused = partial(cifar10_shufflenet_wd, fused = True)
+
+# the same network without the channel shuffle copies, and the same variables
+cifar10_shufflenet_folded = partial(cifar10_shufflenet, fold_shuffle = True)
+cifar10_shufflenet_wd_folded = partial(cifar10_shufflenet_wd, fold_shuffle = True)
@@ -3,6 +3,7 @@
 
 import tensorflow as tf
 from arch.layers import conv2d_bn, separable_conv2d, max_pool2d
+from arch.layers import channel_axis
 from arch.initializers import He_normal
 
 # F. Chollet, Xception: Deep Learning with Depthwise Separable Convolutions
@@ -46,7 +47,7 @@ def entry_block(
                     bias_init = bias_init,
                     name = "separable_conv_"+str(r))
             x = tf.layers.batch_normalization(
-                    x, training = is_training, name = "bn_"+str(r))
+                    x, axis = channel_axis(), training = is_training, name = "bn_"+str(r))
         x = max_pool2d(x, size = pool_size, stride = 2, name = "max_pool")
         outputs = tf.add(x, shortcut, name = "add")
     return outputs
@@ -108,7 +109,7 @@ def middle_module(
                         bias_init = bias_init,
                         name="separable_conv_"+str(r)+"_"+str(s))
                 x = tf.layers.batch_normalization(
-                        x, training = is_training, name = "bn_"+str(r)+"_"+str(s))
+                        x, axis = channel_axis(), training = is_training, name = "bn_"+str(r)+"_"+str(s))
             x = tf.add(x, shortcut, name = "add_"+str(r))
     return x
 
@@ -145,7 +146,7 @@ def exit_module(
                     bias_init = bias_init,
                     name = "separable_conv_1_"+str(r))
             x = tf.layers.batch_normalization(
-                    x, training = is_training, name = "bn_1_"+str(r))
+                    x, axis = channel_axis(), training = is_training, name = "bn_1_"+str(r))
         x = max_pool2d(x, size = pool_size, stride = 2, name = "max_pool")
         x = tf.add(x, shortcut, name = "add_1")
             
@@ -159,6 +160,6 @@ def exit_module(
                     bias_init = bias_init,
                     name = "separable_conv_2_"+str(r))
             x = tf.layers.batch_normalization(
-                    x, training = is_training, name = "bn_2_"+str(r))
+                    x, axis = channel_axis(), training = is_training, name = "bn_2_"+str(r))
             x = tf.nn.relu(x, name = "relu_2_"+str(r))
     return x
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+import json
+import time
+import inspect
+import platform
+import argparse
+import importlib
+import numpy as np
+import tensorflow as tf
+from util.misc import tuple_list_find
+
+# the default builders, a regex of --filter selects others of the *_graph modules
+DEFAULT_BUILDERS = [
+        "cifar10_resnet_20",
+        "cifar10_densenet_40",
+        "cifar10_inception_v3",
+        "cifar10_mobilenet",
+        "cifar10_shufflenet",
+        "cifar10_nasnet"]
+
+REPORT_VERSION = 1
+
+
+def find_builders(pattern = None):
+    """Collects the network builders of the arch/*_graph.py modules, which
+    can be called with the input tensor only.
+    Args:
+        pattern: An optional regex, the builders with matching names are
+            returned. If None, the default builders are returned.
+    Returns:
+        A list of tuples of the builder names and functions.
+    """
+    arch_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "arch")
+    builders = dict()
+    for file_name in sorted(os.listdir(arch_folder)):
+        if not file_name.endswith("_graph.py"):
+            continue
+        module = importlib.import_module("arch." + file_name[:-3])
+        for name, func in vars(module).items():
+            if not name.startswith(("cifar10_", "mnist_")) or not callable(func):
+                continue
+            params = inspect.signature(func).parameters.values()
+            required = [p for p in params if p.default is inspect.Parameter.empty]
+            if len(required) == 1:
+                builders[name] = func
+    if pattern is None:
+        names = [name for name in DEFAULT_BUILDERS if name in builders]
+    else:
+        names = sorted(name for name in builders if re.search(pattern, name))
+    return [(name, builders[name]) for name in names]
+
+
+def time_runs(session, fetches, feed_dict, n_runs, n_warmup):
+    """Returns the median and the interquartile range of the run times."""
+    for _ in range(n_warmup):
+        session.run(fetches, feed_dict = feed_dict)
+    times = []
+    for _ in range(n_runs):
+        start = time.time()
+        session.run(fetches, feed_dict = feed_dict)
+        times.append(time.time() - start)
+    q25, q50, q75 = np.percentile(times, [25, 50, 75])
+    return q50, q75 - q25
+
+
+def bench_builder(net_func, config, input_shape, n_classes,
+                  infer_batch_size, train_batch_size, n_runs, n_warmup):
+    """Measures the forward latency at batch size 1, the inference
+    throughput at a large batch size, and the training steps per second.
+    """
+    rng = np.random.RandomState(42)
+    tf.reset_default_graph()
+    tf.set_random_seed(42)
+    x = tf.placeholder(tf.float32, [None] + list(input_shape), name = "input")
+    gt = tf.placeholder(tf.float32, [None, n_classes], name = "label")
+    layers, variables = net_func(x, seed = 42)
+    training = tuple_list_find(variables, "training")[1]
+    logit = tuple_list_find(layers, "logit")[1]
+    loss_fn = tf.reduce_mean(tf.nn.softmax_cross_entropy_with_logits(labels = gt, logits = logit))
+    update_ops = tf.get_collection(tf.GraphKeys.UPDATE_OPS)
+    with tf.control_dependencies(update_ops):
+        train_step = tf.train.MomentumOptimizer(0.01, 0.9).minimize(loss_fn)
+    n_params = int(sum(np.prod(v.get_shape().as_list()) for v in tf.trainable_variables()))
+
+    x1 = rng.rand(1, *input_shape).astype(np.float32)
+    xb = rng.rand(infer_batch_size, *input_shape).astype(np.float32)
+    xt = rng.rand(train_batch_size, *input_shape).astype(np.float32)
+    yt = np.eye(n_classes, dtype = np.float32)[rng.randint(0, n_classes, train_batch_size)]
+    with tf.Session(config = config) as session:
+        session.run(tf.global_variables_initializer())
+        latency, latency_iqr = time_runs(
+                session, logit, {x: x1, training: False}, n_runs, n_warmup)
+        infer_time, infer_iqr = time_runs(
+                session, logit, {x: xb, training: False}, n_runs, n_warmup)
+        train_time, train_iqr = time_runs(
+                session, train_step, {x: xt, gt: yt, training: True}, n_runs, n_warmup)
+    return {'n_params': n_params,
+            'latency_ms': 1000.0*latency,
+            'latency_iqr_ms': 1000.0*latency_iqr,
+            'throughput_images_per_sec': infer_batch_size / infer_time,
+            'throughput_iqr_ms': 1000.0*infer_iqr,
+            'train_steps_per_sec': 1.0 / train_time,
+            'train_iqr_ms': 1000.0*train_iqr}
+
+
+def environment(n_threads, n_inter_threads):
+    return {'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'tensorflow': tf.__version__,
+            'intra_op_threads': n_threads,
+            'inter_op_threads': n_inter_threads}
+
+
+def run(pattern = None,
+        n_threads = 4,
+        n_inter_threads = 1,
+        infer_batch_size = 256,
+        train_batch_size = 128,
+        n_runs = 20,
+        n_warmup = 3,
+        input_shape = (32, 32, 3),
+        n_classes = 10):
+    """Benchmarks the builders on CPU.
+    Returns:
+        A dictionary representing the report.
+    """
+    config = tf.ConfigProto(
+            intra_op_parallelism_threads = n_threads,
+            inter_op_parallelism_threads = n_inter_threads,
+            device_count = {'GPU': 0})
+    report = {'version': REPORT_VERSION,
+              'environment': environment(n_threads, n_inter_threads),
+              'settings': {'infer_batch_size': infer_batch_size,
+                           'train_batch_size': train_batch_size,
+                           'n_runs': n_runs,
+                           'n_warmup': n_warmup,
+                           'input_shape': list(input_shape)},
+              'results': dict()}
+    for name, net_func in find_builders(pattern):
+        try:
+            result = bench_builder(
+                    net_func, config, input_shape, n_classes,
+                    infer_batch_size, train_batch_size, n_runs, n_warmup)
+        except Exception as e:
+            result = {'error': repr(e)}
+        report['results'][name] = result
+        print(name, json.dumps(result))
+    return report
+
+
+def compare(report, baseline, tolerance = 0.1):
+    """Compares a report with a baseline report. The latency is lower, the
+    throughput and the training speed are higher for better results.
+    Args:
+        report: A dictionary of the current report.
+        baseline: A dictionary of the baseline report.
+        tolerance: A number representing the allowed relative slowdown.
+    Returns:
+        A list of tuples of the builder name, the metric, the baseline and the
+        current value, for the regressions.
+    """
+    if report['settings'] != baseline['settings']:
+        print("Warning: the benchmark settings differ from the baseline")
+    if report['environment'] != baseline['environment']:
+        print("Warning: the environment differs from the baseline")
+    metrics = [('latency_ms', -1.0),
+               ('throughput_images_per_sec', 1.0),
+               ('train_steps_per_sec', 1.0)]
+    regressions = []
+    for name, result in sorted(report['results'].items()):
+        base = baseline['results'].get(name)
+        if (base is None) or ('error' in base) or ('error' in result):
+            continue
+        for metric, direction in metrics:
+            ratio = (result[metric] / base[metric]) ** direction
+            print(name, metric, base[metric], "->", result[metric], "speed ratio: ", ratio)
+            if ratio < 1.0 - tolerance:
+                regressions.append((name, metric, base[metric], result[metric]))
+    return regressions
+
+
+# benchmarks the network builders on CPU, writes a JSON report, and compares
+# it to a baseline report if given
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filter", default = None,
+                        help = "regex of the builder names, default: the main builders")
+    parser.add_argument("--threads", type = int, default = 4)
+    parser.add_argument("--inter-threads", type = int, default = 1)
+    parser.add_argument("--infer-batch-size", type = int, default = 256)
+    parser.add_argument("--train-batch-size", type = int, default = 128)
+    parser.add_argument("--runs", type = int, default = 20)
+    parser.add_argument("--warmup", type = int, default = 3)
+    parser.add_argument("--output", default = "benchmark_report.json")
+    parser.add_argument("--baseline", default = None)
+    parser.add_argument("--tolerance", type = float, default = 0.1)
+    args = parser.parse_args()
+
+    os.environ["OMP_NUM_THREADS"] = str(args.threads)
+    report = run(pattern = args.filter,
+                 n_threads = args.threads,
+                 n_inter_threads = args.inter_threads,
+                 infer_batch_size = args.infer_batch_size,
+                 train_batch_size = args.train_batch_size,
+                 n_runs = args.runs,
+                 n_warmup = args.warmup)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent = 2, sort_keys = True)
+
+    if args.baseline is not None:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, tolerance = args.tolerance)
+        for name, metric, base, current in regressions:
+            print("Regression: ", name, metric, base, "->", current)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
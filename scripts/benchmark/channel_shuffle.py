@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import tempfile
+import numpy as np
+import tensorflow as tf
+from arch.shufflenet_graph import cifar10_shufflenet, cifar10_shufflenet_folded
+from arch.inference import optimize_for_inference
+from util.misc import tuple_list_find
+from scripts.benchmark.architectures import bench_builder
+from scripts.benchmark.group_conv import predict
+
+
+def count_shuffles(config):
+    """Returns the number of transposes in the training graph and in the
+    optimized inference graph of the ShuffleNet with explicit shuffles.
+    """
+    tf.reset_default_graph()
+    x = tf.placeholder(tf.float32, [None, 32, 32, 3], name = "input")
+    layers, variables = cifar10_shufflenet(x, seed = 42)
+    training = tuple_list_find(variables, "training")[1]
+    prob = tuple_list_find(layers, "prob")[1]
+    with tf.Session(config = config) as session:
+        session.run(tf.global_variables_initializer())
+        n_before = len([op for op in session.graph.get_operations() if op.type == "Transpose"])
+        graph_def, _ = optimize_for_inference(
+                session, [prob.op.name], training_name = training.op.name)
+    n_after = len([node for node in graph_def.node if node.op == "Transpose"])
+    return n_before, n_after
+
+
+# compares ShuffleNet with the explicit channel shuffle and with the shuffle
+# folded into the weights on CPU, checks that the folded network gives the
+# same outputs with the weights of the original one, and that the inference
+# graph optimization removes the shuffles
+def main(infer_batch_size = 128, train_batch_size = 64, n_runs = 10, n_warmup = 3,
+         n_threads = 4):
+    config = tf.ConfigProto(
+            intra_op_parallelism_threads = n_threads,
+            inter_op_parallelism_threads = 1,
+            device_count = {'GPU': 0})
+    input_shape = (32, 32, 3)
+    for name, net_func in [("shuffle", cifar10_shufflenet),
+                           ("folded", cifar10_shufflenet_folded)]:
+        result = bench_builder(
+                net_func, config, input_shape, 10,
+                infer_batch_size, train_batch_size, n_runs, n_warmup)
+        print(name, json.dumps(result))
+
+    x_value = np.random.RandomState(42).rand(8, *input_shape).astype(np.float32)
+    path = os.path.join(tempfile.mkdtemp(), "weights.h5")
+    try:
+        ref = predict(cifar10_shufflenet, x_value, config, path, save = True)
+        out = predict(cifar10_shufflenet_folded, x_value, config, path, save = False)
+    finally:
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+    print("max abs error: ", np.abs(out - ref).max())
+    n_before, n_after = count_shuffles(config)
+    print("transposes in the inference graph: ", n_before, "->", n_after)
+
+
+if __name__ == "__main__":
+    os.environ["OMP_NUM_THREADS"]= str(4)
+    main()
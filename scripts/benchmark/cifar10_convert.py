@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import numpy as np
+from tools.cifar10_dump import convert, one_hot
+
+
+# the former per-image implementation, kept as a reference
+def convert_loop(imgs, img_size=32, n_chans=3, data_format="channels_first"):
+    imgs = imgs.astype(float) / 255.0
+    if data_format == "channels_last":
+        conv_imgs = np.zeros(shape=(len(imgs), 32, 32, 3), dtype=float)
+    else:
+        conv_imgs = np.zeros(shape=(len(imgs), 3, 32, 32), dtype=float)
+    for n in range(len(imgs)):
+        data = imgs[n]
+        r = data[0:1024].reshape(32, 32)
+        g = data[1024:2048].reshape(32, 32)
+        b = data[2048:].reshape(32, 32)
+        if data_format == "channels_last":
+            conv_imgs[n,:,:,0] = r
+            conv_imgs[n,:,:,1] = g
+            conv_imgs[n,:,:,2] = b
+        else:
+            conv_imgs[n,0,:,:] = r
+            conv_imgs[n,1,:,:] = g
+            conv_imgs[n,2,:,:] = b
+    return conv_imgs
+
+
+def one_hot_loop(arr, size, dtype=np.float32):
+    arr_out = np.zeros([len(arr), size], dtype=dtype)
+    for i in range(len(arr)):
+        arr_out[i, arr[i]] = 1
+    return arr_out
+
+
+def timeit(func, n_repeat=3):
+    best = None
+    for _ in range(n_repeat):
+        start = time.time()
+        out = func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, out
+
+
+# compares the vectorized conversion of a CIFAR-10 batch file with the
+# former per-image loop, using random pixels
+def main(n_data = 10000):
+    rng = np.random.RandomState(42)
+    imgs = rng.randint(0, 256, size=(n_data, 3072)).astype(np.uint8)
+    labels = rng.randint(0, 10, size=n_data)
+
+    t_loop, ref = timeit(lambda: convert_loop(imgs, data_format="channels_last"))
+    print("convert, loop, float64: ", t_loop)
+    for dtype in [float, np.float32, np.float16, np.uint8]:
+        t, out = timeit(lambda: convert(imgs, data_format="channels_last", dtype=dtype))
+        if np.issubdtype(out.dtype, np.integer):
+            err = np.abs(out / 255.0 - ref).max()
+        else:
+            err = np.abs(out.astype(float) - ref).max()
+        print("convert, vectorized, " + np.dtype(dtype).name + ": ", t,
+              "speedup: ", t_loop / t, "max abs error: ", err)
+
+    t_loop, ref = timeit(lambda: one_hot_loop(labels, 10))
+    t, out = timeit(lambda: one_hot(labels, 10))
+    print("one_hot, loop: ", t_loop)
+    print("one_hot, vectorized: ", t, "speedup: ", t_loop / t,
+          "equal: ", np.array_equal(out, ref))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import argparse
+import tensorflow as tf
+from arch.complexity import analyze, max_batch_size, print_report
+from scripts.benchmark.architectures import find_builders
+
+
+# prints the multiply-adds, parameters and activation memory per layer of the
+# network builders, and the largest training batch size fitting a budget
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filter", default = None,
+                        help = "regex of the builder names, default: the main builders")
+    parser.add_argument("--depth", type = int, default = 1,
+                        help = "depth of the scopes the ops are grouped by")
+    parser.add_argument("--budget-gb", type = float, default = 8.0)
+    parser.add_argument("--param-copies", type = float, default = 4)
+    parser.add_argument("--output", default = None, help = "JSON report")
+    args = parser.parse_args()
+
+    report = dict()
+    for name, net_func in find_builders(args.filter):
+        tf.reset_default_graph()
+        x = tf.placeholder(tf.float32, [None, 32, 32, 3], name = "input")
+        layers, _ = net_func(x, seed = 42)
+        result = analyze(layers, depth = args.depth)
+        result['max_batch_size'] = max_batch_size(
+                result, args.budget_gb*1024**3, param_copies = args.param_copies)
+        report[name] = result
+        print(name)
+        print_report(result)
+        print("Max batch size for", args.budget_gb, "GB: ", result['max_batch_size'])
+        print()
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent = 2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import argparse
+import tempfile
+import numpy as np
+import tensorflow as tf
+from arch.layers import with_data_format
+from arch.io import save_variables, load_variables
+from util.misc import tuple_list_find
+from scripts.benchmark.architectures import find_builders, bench_builder
+
+DATA_FORMATS = ("channels_last", "channels_first")
+
+
+def predict(net_func, data_format, x_value, config, weights_path, save):
+    """Builds a network in a data format and computes its logits in
+    inference mode. The weights are saved to or loaded from weights_path.
+    """
+    tf.reset_default_graph()
+    x = tf.placeholder(tf.float32, [None] + list(x_value.shape[1:]), name = "input")
+    layers, variables = with_data_format(net_func, data_format)(x, seed = 42)
+    training = tuple_list_find(variables, "training")[1]
+    logit = tuple_list_find(layers, "logit")[1]
+    with tf.Session(config = config) as session:
+        session.run(tf.global_variables_initializer())
+        if save:
+            save_variables(session, weights_path, include_state = True)
+        else:
+            load_variables(session, weights_path, include_state = True)
+        return session.run(logit, feed_dict = {x: x_value, training: False})
+
+
+def check_weights(net_func, config, input_shape):
+    """Runs the weights of a network saved in NHWC in NCHW, and returns the
+    maximal absolute difference of the logits.
+    """
+    x_value = np.random.RandomState(42).rand(8, *input_shape).astype(np.float32)
+    path = os.path.join(tempfile.mkdtemp(), "weights.h5")
+    try:
+        ref = predict(net_func, "channels_last", x_value, config, path, save = True)
+        out = predict(net_func, "channels_first", x_value, config, path, save = False)
+    finally:
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+    return float(np.abs(out - ref).max())
+
+
+def run(pattern = None,
+        n_threads = 4,
+        infer_batch_size = 256,
+        train_batch_size = 128,
+        n_runs = 20,
+        n_warmup = 3,
+        input_shape = (32, 32, 3),
+        n_classes = 10):
+    """Benchmarks the builders in both data formats. The inputs are NHWC, so
+    the channels_first results include the transposition of the inputs.
+    Returns:
+        A dictionary of the builder names and the results per data format.
+    """
+    config = tf.ConfigProto(
+            intra_op_parallelism_threads = n_threads,
+            inter_op_parallelism_threads = 1,
+            device_count = {'GPU': 0})
+    report = dict()
+    for name, net_func in find_builders(pattern):
+        result = dict()
+        for data_format in DATA_FORMATS:
+            try:
+                result[data_format] = bench_builder(
+                        with_data_format(net_func, data_format), config,
+                        input_shape, n_classes,
+                        infer_batch_size, train_batch_size, n_runs, n_warmup)
+            except Exception as e:
+                # e.g. the CPU kernels of NCHW convolutions and pooling
+                # require a TensorFlow build with MKL
+                result[data_format] = {'error': repr(e)}
+        try:
+            result['max_abs_error'] = check_weights(net_func, config, input_shape)
+        except Exception as e:
+            result['max_abs_error'] = repr(e)
+        report[name] = result
+        print(name, json.dumps(result))
+    return report
+
+
+# benchmarks the network builders in the NHWC and NCHW data formats, and
+# checks that the weights of a network give the same outputs in both
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filter", default = None,
+                        help = "regex of the builder names, default: the main builders")
+    parser.add_argument("--threads", type = int, default = 4)
+    parser.add_argument("--infer-batch-size", type = int, default = 256)
+    parser.add_argument("--train-batch-size", type = int, default = 128)
+    parser.add_argument("--runs", type = int, default = 20)
+    parser.add_argument("--warmup", type = int, default = 3)
+    parser.add_argument("--output", default = "data_format_report.json")
+    args = parser.parse_args()
+
+    os.environ["OMP_NUM_THREADS"] = str(args.threads)
+    report = run(pattern = args.filter,
+                 n_threads = args.threads,
+                 infer_batch_size = args.infer_batch_size,
+                 train_batch_size = args.train_batch_size,
+                 n_runs = args.runs,
+                 n_warmup = args.warmup)
+    for name, result in sorted(report.items()):
+        nhwc, nchw = result["channels_last"], result["channels_first"]
+        if ("error" in nhwc) or ("error" in nchw):
+            continue
+        print(name,
+              "latency speedup: ", nhwc['latency_ms'] / nchw['latency_ms'],
+              "throughput speedup: ", nchw['throughput_images_per_sec'] / nhwc['throughput_images_per_sec'],
+              "training speedup: ", nchw['train_steps_per_sec'] / nhwc['train_steps_per_sec'])
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent = 2, sort_keys = True)
+
+
+if __name__ == "__main__":
+    main()
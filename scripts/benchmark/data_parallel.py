@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import argparse
+import multiprocessing
+import numpy as np
+import tensorflow as tf
+from util.misc import tuple_list_find
+from util.parallel import with_towers, tower_config
+from scripts.benchmark.architectures import find_builders, time_runs
+
+
+def bench_towers(net_func, n_towers, threads_per_tower, batch_size,
+                 n_runs, n_warmup, input_shape = (32, 32, 3), n_classes = 10):
+    """Measures the training throughput of n_towers towers with batch_size
+    images each.
+    """
+    rng = np.random.RandomState(42)
+    tf.reset_default_graph()
+    tf.set_random_seed(42)
+    x = tf.placeholder(tf.float32, [None] + list(input_shape), name = "input")
+    gt = tf.placeholder(tf.float32, [None, n_classes], name = "label")
+    layers, variables = with_towers(net_func, n_towers)(x, seed = 42)
+    training = tuple_list_find(variables, "training")[1]
+    logit = tuple_list_find(layers, "logit")[1]
+    loss_fn = tf.reduce_mean(tf.nn.softmax_cross_entropy_with_logits(labels = gt, logits = logit))
+    update_ops = tf.get_collection(tf.GraphKeys.UPDATE_OPS)
+    with tf.control_dependencies(update_ops):
+        train_step = tf.train.MomentumOptimizer(0.01, 0.9).minimize(
+                loss_fn, colocate_gradients_with_ops = True)
+
+    n = n_towers * batch_size
+    xt = rng.rand(n, *input_shape).astype(np.float32)
+    yt = np.eye(n_classes, dtype = np.float32)[rng.randint(0, n_classes, n)]
+    with tf.Session(config = tower_config(n_towers, threads_per_tower)) as session:
+        session.run(tf.global_variables_initializer())
+        train_time, train_iqr = time_runs(
+                session, train_step, {x: xt, gt: yt, training: True}, n_runs, n_warmup)
+    return {'images_per_sec': n / train_time,
+            'train_iqr_ms': 1000.0*train_iqr}
+
+
+def _bench(name, n_towers, threads_per_tower, batch_size, n_runs, n_warmup, queue):
+    try:
+        net_func = dict(find_builders("^" + name + "$"))[name]
+        queue.put(bench_towers(net_func, n_towers, threads_per_tower, batch_size,
+                               n_runs, n_warmup))
+    except Exception as e:
+        queue.put({'error': repr(e)})
+
+
+def measure(name, n_towers, threads_per_tower, batch_size, n_runs, n_warmup):
+    # a process per measurement, as tower_config pins it to the cores of the
+    # towers
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(
+            target = _bench,
+            args = (name, n_towers, threads_per_tower, batch_size, n_runs, n_warmup, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+# measures the training throughput of synchronous data-parallel towers on
+# one multicore host, and the scaling efficiency against a single tower with
+# the same cores per tower and batch size per tower
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--builders", nargs = "+",
+                        default = ["cifar10_resnet_20", "cifar10_densenet_40", "cifar10_inception_v3"])
+    parser.add_argument("--towers", type = int, nargs = "+", default = [1, 2, 4, 8, 16])
+    parser.add_argument("--threads-per-tower", type = int, default = 4)
+    parser.add_argument("--batch-size", type = int, default = 64,
+                        help = "batch size per tower")
+    parser.add_argument("--runs", type = int, default = 10)
+    parser.add_argument("--warmup", type = int, default = 3)
+    parser.add_argument("--output", default = "data_parallel_report.json")
+    args = parser.parse_args()
+
+    os.environ["OMP_NUM_THREADS"] = str(args.threads_per_tower)
+    n_cores = len(os.sched_getaffinity(0))
+    report = dict()
+    for name in args.builders:
+        results = dict()
+        for n_towers in args.towers:
+            if n_towers * args.threads_per_tower > n_cores:
+                continue
+            result = measure(name, n_towers, args.threads_per_tower,
+                             args.batch_size, args.runs, args.warmup)
+            if ("error" not in result) and (1 in results) and ("error" not in results[1]):
+                result['scaling_efficiency'] = (result['images_per_sec']
+                        / (n_towers * results[1]['images_per_sec']))
+            results[n_towers] = result
+            print(name, "towers: ", n_towers, json.dumps(result))
+        report[name] = results
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent = 2, sort_keys = True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import resource
+import importlib
+import multiprocessing
+import numpy as np
+import tensorflow as tf
+from arch import densenet_graph
+from arch import recompute
+from util.misc import tuple_list_find
+
+
+def build(net_func, batch_size, seed = 42):
+    x = tf.placeholder(tf.float32, [batch_size, 32, 32, 3], name = "input")
+    gt = tf.placeholder(tf.float32, [batch_size, 10], name = "label")
+    layers, variables = net_func(x, seed = seed)
+    training = tuple_list_find(variables, "training")[1]
+    logit = tuple_list_find(layers, "logit")[1]
+    loss = tf.reduce_mean(tf.nn.softmax_cross_entropy_with_logits(labels = gt, logits = logit))
+    return x, gt, training, loss
+
+
+def feed(x, gt, training, batch_size, seed = 42):
+    rng = np.random.RandomState(seed)
+    return {x: rng.rand(batch_size, 32, 32, 3).astype(np.float32),
+            gt: np.eye(10, dtype = np.float32)[rng.randint(0, 10, batch_size)],
+            training: True}
+
+
+def _measure(name, batch_size, n_steps, n_threads, queue,
+             module = "densenet_graph", scopes = None, every = 1):
+    """Trains a builder of an arch module for some steps in a fresh process,
+    and reports the peak resident memory and the median step time. If
+    scopes is given, the outputs of the matching scopes are checkpointed.
+    """
+    config = tf.ConfigProto(
+            intra_op_parallelism_threads = n_threads,
+            inter_op_parallelism_threads = 1,
+            device_count = {'GPU': 0})
+    try:
+        net_func = getattr(importlib.import_module("arch." + module), name)
+        x, gt, training, loss = build(net_func, batch_size)
+        if scopes is not None:
+            recompute.checkpoint_scopes(scopes, every = every)
+        checkpoints = tf.get_collection(recompute.CHECKPOINTS)
+        update_ops = tf.get_collection(tf.GraphKeys.UPDATE_OPS)
+        with tf.control_dependencies(update_ops):
+            if checkpoints:
+                train_step = recompute.minimize(
+                        tf.train.MomentumOptimizer(0.01, 0.9), loss, checkpoints)
+            else:
+                train_step = tf.train.MomentumOptimizer(0.01, 0.9).minimize(loss)
+        feed_dict = feed(x, gt, training, batch_size)
+        with tf.Session(config = config) as session:
+            session.run(tf.global_variables_initializer())
+            base_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            times = []
+            for _ in range(n_steps):
+                start = time.time()
+                session.run(train_step, feed_dict = feed_dict)
+                times.append(time.time() - start)
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        queue.put({'peak_mb': peak_kb / 1024.0,
+                   'training_peak_mb': (peak_kb - base_kb) / 1024.0,
+                   'step_time_s': float(np.median(times[1:])),
+                   'images_per_sec': batch_size / float(np.median(times[1:]))})
+    except Exception as e:
+        queue.put({'error': repr(e)})
+
+
+def measure(name, batch_size, n_steps = 6, n_threads = 4,
+            module = "densenet_graph", scopes = None, every = 1):
+    # spawned, as TensorFlow is not fork safe after creating sessions
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(
+            target = _measure,
+            args = (name, batch_size, n_steps, n_threads, queue, module, scopes, every))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def check_gradients(net_func, batch_size = 16):
+    """Computes the gradients of the efficient network with and without the
+    recomputation in the same graph (so with the same dropout masks), and
+    returns the maximal absolute difference.
+    """
+    tf.reset_default_graph()
+    x, gt, training, loss = build(net_func, batch_size)
+    var_list = tf.trainable_variables()
+    grads = tf.gradients(loss, var_list)
+    grads_recomputed = recompute.gradients(loss, var_list, tf.get_collection(recompute.CHECKPOINTS))
+    with tf.Session() as session:
+        session.run(tf.global_variables_initializer())
+        values = session.run(grads + grads_recomputed, feed_dict = feed(x, gt, training, batch_size))
+    n = len(grads)
+    return max(float(np.abs(a - b).max()) for a, b in zip(values[:n], values[n:]))
+
+
+# compares the peak memory and the training throughput of the DenseNets with
+# and without the efficient (recomputing) dense blocks on CPU, and checks
+# that the recomputed gradients are the same
+def main(batch_sizes = [32, 64, 128]):
+    nets = [("cifar10_densenet_40", "cifar10_densenet_40_efficient"),
+            ("cifar10_bottleneck_densenet_100", "cifar10_bottleneck_densenet_100_efficient")]
+    for name, name_efficient in nets:
+        print(name, "max abs gradient error: ",
+              check_gradients(getattr(densenet_graph, name_efficient)))
+        for batch_size in batch_sizes:
+            for net_name in (name, name_efficient):
+                print(net_name, "batch size: ", batch_size,
+                      json.dumps(measure(net_name, batch_size)))
+
+
+if __name__ == "__main__":
+    os.environ["OMP_NUM_THREADS"]= str(4)
+    main()
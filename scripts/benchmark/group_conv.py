@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import tempfile
+from functools import partial
+import numpy as np
+import tensorflow as tf
+from arch.resnext_graph import cifar10_resnext
+from arch.senet_graph import cifar10_se_resnext
+from arch.shufflenet_graph import cifar10_shufflenet
+from arch.io import save_variables, load_variables
+from util.misc import tuple_list_find
+from scripts.benchmark.architectures import bench_builder
+
+IMPLEMENTATIONS = (False, "depthwise", "block_diagonal", "native")
+
+
+def predict(net_func, x_value, config, weights_path, save):
+    """Builds a network and computes its logits in inference mode. The weights
+    are saved to or loaded from weights_path.
+    """
+    tf.reset_default_graph()
+    x = tf.placeholder(tf.float32, [None] + list(x_value.shape[1:]), name = "input")
+    layers, variables = net_func(x, seed = 42)
+    training = tuple_list_find(variables, "training")[1]
+    logit = tuple_list_find(layers, "logit")[1]
+    with tf.Session(config = config) as session:
+        session.run(tf.global_variables_initializer())
+        if save:
+            save_variables(session, weights_path, include_state = True)
+        else:
+            load_variables(session, weights_path, include_state = True)
+        return session.run(logit, feed_dict = {x: x_value, training: False})
+
+
+def check_weights(net_func, fused, config, input_shape):
+    """Loads the weights of the per-group network into the fused one, and
+    returns the maximal absolute difference of the logits.
+    """
+    x_value = np.random.RandomState(42).rand(8, *input_shape).astype(np.float32)
+    path = os.path.join(tempfile.mkdtemp(), "weights.h5")
+    try:
+        ref = predict(partial(net_func, fused = False), x_value, config, path, save = True)
+        out = predict(partial(net_func, fused = fused), x_value, config, path, save = False)
+    finally:
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+    return float(np.abs(out - ref).max())
+
+
+# compares the per-group and the fused group convolutions of ResNeXt-29,
+# SE-ResNeXt-29 and ShuffleNet on CPU, and checks that the fused networks
+# give the same outputs with the weights of the per-group ones
+def main(infer_batch_size = 128, train_batch_size = 64, n_runs = 10, n_warmup = 3,
+         n_threads = 4):
+    config = tf.ConfigProto(
+            intra_op_parallelism_threads = n_threads,
+            inter_op_parallelism_threads = 1,
+            device_count = {'GPU': 0})
+    nets = [("ResNeXt-29", partial(cifar10_resnext, n_blocks = 3)),
+            ("SE-ResNeXt-29", partial(cifar10_se_resnext, n_blocks = 3)),
+            ("ShuffleNet", cifar10_shufflenet)]
+    input_shape = (32, 32, 3)
+    for name, net_func in nets:
+        for fused in IMPLEMENTATIONS:
+            try:
+                result = bench_builder(
+                        partial(net_func, fused = fused), config, input_shape, 10,
+                        infer_batch_size, train_batch_size, n_runs, n_warmup)
+                if fused:
+                    result['max_abs_error'] = check_weights(
+                            net_func, fused, config, input_shape)
+            except Exception as e:
+                # e.g. the native grouped convolution is not supported on CPU
+                result = {'error': repr(e)}
+            print(name, "fused: ", fused, json.dumps(result))
+
+
+if __name__ == "__main__":
+    os.environ["OMP_NUM_THREADS"]= str(4)
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+from functools import partial
+import tensorflow as tf
+from arch import inception_graph
+from scripts.benchmark.architectures import bench_builder
+from scripts.benchmark.group_conv import check_weights
+
+NETS = ("cifar10_inception_v1", "cifar10_bn_inception_v1", "cifar10_inception_v2",
+        "cifar10_inception_v3", "cifar10_inception_v4")
+
+
+def count_convs(net_func, input_shape):
+    """Returns the number of convolution ops of a network."""
+    tf.reset_default_graph()
+    x = tf.placeholder(tf.float32, [None] + list(input_shape), name = "input")
+    net_func(x, seed = 42)
+    return len([op for op in tf.get_default_graph().get_operations() if op.type == "Conv2D"])
+
+
+# compares the Inception networks with separate and fused parallel 1x1
+# convolutions on CPU, and checks that the fused networks give the same
+# outputs with the weights of the separate ones
+def main(infer_batch_size = 128, train_batch_size = 64, n_runs = 10, n_warmup = 3,
+         n_threads = 4):
+    config = tf.ConfigProto(
+            intra_op_parallelism_threads = n_threads,
+            inter_op_parallelism_threads = 1,
+            device_count = {'GPU': 0})
+    input_shape = (32, 32, 3)
+    for name in NETS:
+        net_func = getattr(inception_graph, name)
+        for fused in (False, True):
+            result = bench_builder(
+                    partial(net_func, fused = fused), config, input_shape, 10,
+                    infer_batch_size, train_batch_size, n_runs, n_warmup)
+            result['n_convs'] = count_convs(partial(net_func, fused = fused), input_shape)
+            if fused:
+                result['max_abs_error'] = check_weights(
+                        net_func, fused, config, input_shape)
+            print(name, "fused: ", fused, json.dumps(result))
+
+
+if __name__ == "__main__":
+    os.environ["OMP_NUM_THREADS"]= str(4)
+    main()
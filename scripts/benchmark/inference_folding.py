@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import numpy as np
+import tensorflow as tf
+from arch.resnet_graph import cifar10_resnet_20
+from arch.densenet_graph import cifar10_densenet_40
+from arch.inception_graph import cifar10_inception_v3
+from arch.inference import optimize_for_inference
+from util.misc import tuple_list_find
+
+
+def randomize_batch_norms(session, rng):
+    """Sets random batch normalization parameters and statistics, so the
+    folding is not trivial as with freshly initialized ones.
+    """
+    for v in tf.global_variables():
+        if "batch_norm" not in v.name:
+            continue
+        shape = v.get_shape().as_list()
+        if ("gamma" in v.name) or ("moving_variance" in v.name):
+            value = rng.uniform(0.5, 1.5, shape)
+        else:
+            value = rng.uniform(-0.5, 0.5, shape)
+        v.load(value.astype(np.float32), session)
+
+
+def latency(session, output, feed_dict, n_runs, n_warmup = 5):
+    for _ in range(n_warmup):
+        session.run(output, feed_dict = feed_dict)
+    start = time.time()
+    for _ in range(n_runs):
+        session.run(output, feed_dict = feed_dict)
+    return (time.time() - start) / n_runs
+
+
+def bench_net(net_func, batch_sizes, n_runs, config):
+    rng = np.random.RandomState(42)
+    tf.reset_default_graph()
+    x = tf.placeholder(tf.float32, [None, 32, 32, 3], name = "input")
+    layers, variables = net_func(x, seed = 42)
+    training = tuple_list_find(variables, "training")[1]
+    prob = tuple_list_find(layers, "prob")[1]
+    results = []
+    with tf.Session(config = config) as session:
+        session.run(tf.global_variables_initializer())
+        randomize_batch_norms(session, rng)
+        graph_def, n_folded = optimize_for_inference(
+                session, [prob.op.name], training_name = training.op.name)
+        n_nodes = len(session.graph.as_graph_def().node)
+        xs = {n: rng.rand(n, 32, 32, 3).astype(np.float32) for n in batch_sizes}
+        ref = {n: session.run(prob, feed_dict = {x: xs[n], training: False})
+               for n in batch_sizes}
+        t_ref = {n: latency(session, prob, {x: xs[n], training: False}, n_runs)
+                 for n in batch_sizes}
+
+    graph = tf.Graph()
+    with graph.as_default():
+        tf.import_graph_def(graph_def, name = "")
+        x_opt = graph.get_tensor_by_name(x.name)
+        prob_opt = graph.get_tensor_by_name(prob.name)
+        with tf.Session(graph = graph, config = config) as session:
+            for n in batch_sizes:
+                out = session.run(prob_opt, feed_dict = {x_opt: xs[n]})
+                t = latency(session, prob_opt, {x_opt: xs[n]}, n_runs)
+                results.append((n, t_ref[n], t, np.abs(out - ref[n]).max()))
+    return n_nodes, len(graph_def.node), n_folded, results
+
+
+# compares the latency of the training graph (fed with training=False) and
+# the frozen inference graph with folded batch normalizations on CPU, using
+# random weights and batch normalization statistics
+def main(batch_sizes = [1, 128], n_runs = 50, n_threads = 4):
+    config = tf.ConfigProto(
+            intra_op_parallelism_threads = n_threads,
+            inter_op_parallelism_threads = 2,
+            device_count = {'GPU': 0})
+    nets = [("ResNet-20", cifar10_resnet_20),
+            ("DenseNet-40", cifar10_densenet_40),
+            ("Inception-v3", cifar10_inception_v3)]
+    for name, net_func in nets:
+        n_nodes, n_nodes_opt, n_folded, results = bench_net(
+                net_func, batch_sizes, n_runs, config)
+        print(name, "nodes: ", n_nodes, "->", n_nodes_opt, "folded layers: ", n_folded)
+        for n, t_ref, t, err in results:
+            print("  batch size: ", n,
+                  "latency (ms): ", 1000.0*t_ref, "->", 1000.0*t,
+                  "speedup: ", t_ref / t,
+                  "max abs error: ", err)
+
+
+if __name__ == "__main__":
+    os.environ["OMP_NUM_THREADS"]= str(4)
+    main()
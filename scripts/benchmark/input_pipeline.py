@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import numpy as np
+import tensorflow as tf
+from functools import partial
+from arch.resnet_graph import cifar10_resnet_20
+from util.misc import tuple_list_find
+from util.batch import random_batch_generator
+from util.transform import RandomizedBatchTransformer, BatchAffine
+from util.dataset import DatasetInput, random_affine
+
+
+def build_train_step(x, gt, seed = 42):
+    layers, variables = cifar10_resnet_20(x, seed = seed)
+    training = tuple_list_find(variables, "training")[1]
+    logit = tuple_list_find(layers, "logit")[1]
+    loss_fn = tf.reduce_mean(tf.nn.softmax_cross_entropy_with_logits(labels=gt, logits=logit))
+    update_ops = tf.get_collection(tf.GraphKeys.UPDATE_OPS)
+    with tf.control_dependencies(update_ops):
+        train_step = tf.train.MomentumOptimizer(0.01, 0.9).minimize(loss_fn)
+    return train_step, training
+
+
+def bench_feed(tr_x, tr_y, batch_size, n_steps, n_warmup, config):
+    tf.reset_default_graph()
+    tf.set_random_seed(42)
+    x = tf.placeholder(tf.float32, [None]+list(tr_x.shape[1:]), name="input")
+    gt = tf.placeholder(tf.float32, [None, tr_y.shape[1]], name="label")
+    train_step, training = build_train_step(x, gt)
+    transformer = RandomizedBatchTransformer(
+            transformer_class = BatchAffine,
+            params = [('shape', tr_x.shape[1:]), ('scale', 1.0)],
+            rand_params = [('r', [-3.0, 3.0]),
+                           ('tx', [-3.0, 3.0]),
+                           ('ty', [-3.0, 3.0]),
+                           ('reflect_y', [False, True])],
+            random_seed = 42)
+    with tf.Session(config = config) as session:
+        session.run(tf.global_variables_initializer())
+        batches = random_batch_generator(batch_size, tr_x, tr_y, seed = 42)
+        for n in range(n_warmup + n_steps):
+            if n == n_warmup:
+                start = time.time()
+            xb, yb = next(batches)
+            session.run(train_step, feed_dict = {x: transformer.transform(xb),
+                                                 gt: yb,
+                                                 training: True})
+        return n_steps / (time.time() - start)
+
+
+def bench_dataset(tr_x, tr_y, batch_size, n_steps, n_warmup, config):
+    tf.reset_default_graph()
+    tf.set_random_seed(42)
+    pipeline = DatasetInput(
+            tr_x, tr_y, tr_x[:1], tr_y[:1], batch_size,
+            augment = partial(random_affine, seed = 42))
+    train_step, training = build_train_step(pipeline.x, pipeline.gt)
+    with tf.Session(config = config) as session:
+        session.run(tf.global_variables_initializer())
+        pipeline.initialize(session)
+        session.run(pipeline.train_init, feed_dict = {pipeline.epoch_seed: 42})
+        for n in range(n_warmup + n_steps):
+            if n == n_warmup:
+                start = time.time()
+            session.run(train_step, feed_dict = {training: True})
+        return n_steps / (time.time() - start)
+
+
+# compares the training steps/sec of the feed_dict and tf.data input paths
+# for ResNet-20 on CPU, using random CIFAR-10 sized data
+def main(n_data = 10000, batch_size = 128, n_steps = 50, n_warmup = 5, n_threads = 4):
+    rng = np.random.RandomState(42)
+    tr_x = rng.rand(n_data, 32, 32, 3).astype(np.float32)
+    tr_y = np.eye(10, dtype=np.float32)[rng.randint(0, 10, n_data)]
+    config = tf.ConfigProto(
+            intra_op_parallelism_threads = n_threads,
+            inter_op_parallelism_threads = 2,
+            device_count = {'GPU': 0})
+    feed_sps = bench_feed(tr_x, tr_y, batch_size, n_steps, n_warmup, config)
+    dataset_sps = bench_dataset(tr_x, tr_y, batch_size, n_steps, n_warmup, config)
+    print("feed_dict steps/sec: ", feed_sps)
+    print("tf.data steps/sec: ", dataset_sps)
+    print("Speedup: ", dataset_sps / feed_sps)
+
+
+if __name__ == "__main__":
+    os.environ["OMP_NUM_THREADS"]= str(4)
+    main()
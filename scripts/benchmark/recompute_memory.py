@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import importlib
+import numpy as np
+import tensorflow as tf
+from arch import recompute
+from scripts.benchmark.densenet_memory import build, feed, measure
+
+NETS = (("inception_graph", "cifar10_inception_v4"),
+        ("nasnet_graph", "cifar10_nasnet"),
+        ("densenet_graph", "cifar10_bottleneck_densenet_100"),
+        ("resnext_graph", "cifar10_resnext_29"))
+
+# the recomputation settings: no recomputation, the outputs of every block,
+# of every second block, and of every layer are kept
+SETTINGS = (("off", None, 1),
+            ("blocks", recompute.BLOCK_SCOPES, 1),
+            ("blocks/2", recompute.BLOCK_SCOPES, 2),
+            ("layers", recompute.LAYER_SCOPES, 1))
+
+
+def check_gradients(net_func, scopes, every, batch_size = 8):
+    """Computes the gradients with and without the recomputation between the
+    outputs of the matching scopes, and returns the number of checkpoints and
+    the maximal absolute difference of the gradients.
+    """
+    tf.reset_default_graph()
+    x, gt, training, loss = build(net_func, batch_size)
+    checkpoints = recompute.checkpoint_scopes(scopes, every = every)
+    var_list = tf.trainable_variables()
+    grads = tf.gradients(loss, var_list)
+    grads_recomputed = recompute.gradients(loss, var_list, checkpoints)
+    with tf.Session() as session:
+        session.run(tf.global_variables_initializer())
+        values = session.run(grads + grads_recomputed, feed_dict = feed(x, gt, training, batch_size))
+    n = len(grads)
+    error = max(float(np.abs(a - b).max()) for a, b in zip(values[:n], values[n:]))
+    return len(checkpoints), error
+
+
+# compares the peak memory and the training throughput of deep networks with
+# the activations recomputed between the outputs of their blocks or layers
+# on CPU, and checks that the recomputed gradients are the same
+def main(batch_sizes = [32, 64]):
+    for module, name in NETS:
+        net_func = getattr(importlib.import_module("arch." + module), name)
+        for setting, scopes, every in SETTINGS:
+            if scopes is not None:
+                n_checkpoints, error = check_gradients(net_func, scopes, every)
+                print(name, setting, "checkpoints: ", n_checkpoints,
+                      "max abs gradient error: ", error)
+            for batch_size in batch_sizes:
+                result = measure(name, batch_size, module = module,
+                                 scopes = scopes, every = every)
+                print(name, setting, "batch size: ", batch_size, json.dumps(result))
+
+
+if __name__ == "__main__":
+    os.environ["OMP_NUM_THREADS"]= str(4)
+    main()
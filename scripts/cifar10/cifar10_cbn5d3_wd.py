@@ -4,14 +4,16 @@
 
 from arch.sequential_graph import cifar10_sequential_cbn5d3_wd
 from util.eval import load_cifar10_data, eval_net_custom
-from util.normalization import global_mean_std
+from util.normalization import Normalizer
+from config import cifar10_data_folder
 from arch.misc import FixValue
 import tensorflow as tf
 
 
 def main():
-    tr_x, tr_y, te_x, te_y = load_cifar10_data()
-    tr_x, te_x = global_mean_std(tr_x, te_x)
+    tr_x, tr_y, te_x, te_y = load_cifar10_data(lazy = True)
+    normalizer = Normalizer(mode = "global", cache_folder = cifar10_data_folder)
+    tr_x, te_x = normalizer.fit_transform(tr_x, te_x, in_place = True)
     mean_acc, max_acc, min_acc = eval_net_custom(
             tr_x, tr_y, te_x, te_y,
             net_func = cifar10_sequential_cbn5d3_wd,
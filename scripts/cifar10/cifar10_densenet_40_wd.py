@@ -4,15 +4,17 @@
 
 from arch.densenet_graph import cifar10_densenet_40_wd
 from util.eval import load_cifar10_data, eval_net_custom
-from util.normalization import channel_mean_std
+from util.normalization import Normalizer
+from config import cifar10_data_folder
 from arch.misc import DivideAtRates
 import tensorflow as tf
 from functools import partial
 
 #https://arxiv.org/abs/1608.06993
 def main():
-    tr_x, tr_y, te_x, te_y = load_cifar10_data()
-    tr_x, te_x = channel_mean_std(tr_x, te_x)
+    tr_x, tr_y, te_x, te_y = load_cifar10_data(lazy = True)
+    normalizer = Normalizer(mode = "channel", cache_folder = cifar10_data_folder)
+    tr_x, te_x = normalizer.fit_transform(tr_x, te_x, in_place = True)
     mean_acc, max_acc, min_acc = eval_net_custom(
             tr_x, tr_y, te_x, te_y,
             net_func = partial(cifar10_densenet_40_wd, drop_rate = 0.0),
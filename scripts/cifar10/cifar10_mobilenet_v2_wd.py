@@ -4,15 +4,17 @@
 
 from arch.mobilenet_v2_graph import cifar10_mobilenet_v2_wd
 from util.eval import load_cifar10_data, eval_net_custom
-from util.normalization import pixel_mean_std
+from util.normalization import Normalizer
+from config import cifar10_data_folder
 from arch.misc import DecayValue
 import tensorflow as tf
 
 
 #https://arxiv.org/abs/1801.04381v2
 def main():
-    tr_x, tr_y, te_x, te_y = load_cifar10_data()
-    tr_x, te_x = pixel_mean_std(tr_x, te_x)
+    tr_x, tr_y, te_x, te_y = load_cifar10_data(lazy = True)
+    normalizer = Normalizer(mode = "pixel", cache_folder = cifar10_data_folder)
+    tr_x, te_x = normalizer.fit_transform(tr_x, te_x, in_place = True)
     mean_acc, max_acc, min_acc = eval_net_custom(
             tr_x, tr_y, te_x, te_y,
             net_func = cifar10_mobilenet_v2_wd,
@@ -2,7 +2,6 @@
 # -*- coding: utf-8 -*-
 
 import os
-import pickle
 import numpy as np
 import tensorflow as tf
 from arch.nasnet_graph import cifar10_nasnet_wd
@@ -10,20 +9,14 @@ from arch.io import save_variables
 from util.misc import tuple_list_find
 from util.batch import random_batch_generator, batch_generator
 from util.normalization import channel_mean_std
-from config import cifar10_data_folder, cifar10_net_folder
+from config import cifar10_net_folder
 from util.transform import RandomizedTransformer, Affine
+from util.eval import load_cifar10_data
 
 
 def main():
     # input data is in NHWC format
-    data_path = os.path.join(cifar10_data_folder, "data_nhwc.pkl")
-    data = pickle.load(open(data_path, "rb"))
-    tr = data['train']
-    tr_x = tr[0]
-    tr_y = tr[1]
-    te = data['test']
-    te_x = te[0]
-    te_y = te[1]
+    tr_x, tr_y, te_x, te_y = load_cifar10_data()
 
     height = tr_x.shape[1]
     width = tr_x.shape[2]
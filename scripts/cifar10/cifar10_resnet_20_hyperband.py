@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+from arch.resnet_graph import cifar10_resnet_20_wd
+from util.eval import load_cifar10_data
+from util.normalization import Normalizer
+from util.hpo import hyperband, EvalNetObjective
+from config import cifar10_data_folder, cifar10_net_folder
+from arch.misc import DivideAtRates
+import tensorflow as tf
+
+MAX_EPOCHS = 162
+
+
+def load_data():
+    tr_x, tr_y, te_x, te_y = load_cifar10_data(lazy = True)
+    normalizer = Normalizer(mode = "pixel", cache_folder = cifar10_data_folder)
+    tr_x, te_x = normalizer.fit_transform(tr_x, te_x, in_place = True)
+    return tr_x, tr_y, te_x, te_y
+
+
+# the learning rate schedule is the one of the full training, so the short
+# runs are resumed from their checkpoints
+def make_args(params):
+    return {'net_func': cifar10_resnet_20_wd,
+            'optimizer': tf.train.MomentumOptimizer,
+            'optimizer_args': {'momentum': 0.9},
+            'n_epochs': MAX_EPOCHS,
+            'batch_size': 128,
+            'lr_decay_func': DivideAtRates(
+                    start = params['learning_rate'],
+                    divide_by = 10,
+                    at = [0.5, 0.75],
+                    max_steps = MAX_EPOCHS),
+            'weight_decay': params['weight_decay'],
+            'eval_train': False,
+            'checkpoint_every': 6}
+
+
+# searches the learning rate and the weight decay of ResNet-20 by Hyperband,
+# the configurations are trained for 6, 18, 54 and 162 epochs
+def main():
+    params, results = hyperband(
+            EvalNetObjective(load_data, make_args),
+            [('learning_rate', 0.01, 0.5, "log"), ('weight_decay', 1e-5, 1e-3, "log")],
+            run_dir = os.path.join(cifar10_net_folder, "resnet_20_hyperband"),
+            max_epochs = MAX_EPOCHS,
+            min_epochs = 6,
+            eta = 3,
+            n_workers = 4,
+            threads_per_worker = 4)
+    print("Best parameters: ", params)
+
+
+if __name__ == "__main__":
+    main()
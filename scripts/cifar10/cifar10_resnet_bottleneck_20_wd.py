@@ -4,15 +4,17 @@
 
 from arch.resnet_graph import cifar10_resnet_bottleneck_20_wd
 from util.eval import load_cifar10_data, eval_net_custom
-from util.normalization import pixel_mean_std
+from util.normalization import Normalizer
+from config import cifar10_data_folder
 from arch.misc import DivideAtRates
 import tensorflow as tf
 
 
 #https://arxiv.org/pdf/1512.03385.pdf
 def main():
-    tr_x, tr_y, te_x, te_y = load_cifar10_data()
-    tr_x, te_x = pixel_mean_std(tr_x, te_x)
+    tr_x, tr_y, te_x, te_y = load_cifar10_data(lazy = True)
+    normalizer = Normalizer(mode = "pixel", cache_folder = cifar10_data_folder)
+    tr_x, te_x = normalizer.fit_transform(tr_x, te_x, in_place = True)
     mean_acc, max_acc, min_acc = eval_net_custom(
             tr_x, tr_y, te_x, te_y,
             net_func = cifar10_resnet_bottleneck_20_wd,
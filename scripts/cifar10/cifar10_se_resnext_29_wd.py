@@ -3,7 +3,8 @@
 
 from arch.senet_graph import cifar10_se_resnext_29_wd
 from util.eval import load_cifar10_data, eval_net_custom
-from util.normalization import pixel_mean_std
+from util.normalization import Normalizer
+from config import cifar10_data_folder
 from arch.misc import DivideAtRates
 import tensorflow as tf
 from functools import partial
@@ -13,8 +14,9 @@ from functools import partial
 # so the original resnext-29 settings is applied here
 # https://arxiv.org/pdf/1611.05431.pdf
 def main():
-    tr_x, tr_y, te_x, te_y = load_cifar10_data()
-    tr_x, te_x = pixel_mean_std(tr_x, te_x)
+    tr_x, tr_y, te_x, te_y = load_cifar10_data(lazy = True)
+    normalizer = Normalizer(mode = "pixel", cache_folder = cifar10_data_folder)
+    tr_x, te_x = normalizer.fit_transform(tr_x, te_x, in_place = True)
     mean_acc, max_acc, min_acc = eval_net_custom(
             tr_x, tr_y, te_x, te_y,
             net_func = partial(cifar10_se_resnext_29_wd, cardinality = 8, group_width = 16),
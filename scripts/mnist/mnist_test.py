@@ -2,21 +2,18 @@
 # -*- coding: utf-8 -*-
 
 import os
-import pickle
 import numpy as np
 import tensorflow as tf
 from arch.graph import mnist_sequential
 from arch.io import load_variables
 from util.misc import tuple_list_find
 from util.batch import batch_generator
+from util.eval import load_mnist_data
 
 
 def main():
     # input data is in NHWC format
-    data = pickle.load(open("/home/ucu/Work/git/mnist/data/data_nhwc.pkl", "rb"))
-    te = data['test']
-    te_x = te[0]
-    te_y = te[1]
+    _, _, te_x, te_y, _, _ = load_mnist_data()
 
     height = te_x.shape[1]
     width = te_x.shape[2]
@@ -2,7 +2,6 @@
 # -*- coding: utf-8 -*-
 
 import os
-import pickle
 import numpy as np
 import tensorflow as tf
 from functools import partial
@@ -10,20 +9,27 @@ from arch.graph import mnist_sequential_dbn2d1
 from util.misc import tuple_list_find
 from util.batch import random_batch_generator, batch_generator
 from arch.io import save_variables
-from config import mnist_data_folder, mnist_net_folder
-from gp import bayesian_optimisation
+from util.eval import load_mnist_data
+from config import mnist_net_folder
+from util.hpo import bayesian_search
+
+# the dataset loaded in the process
+_data = None
+
+
+def load_data():
+    global _data
+    if _data is None:
+        _data = load_mnist_data()
+    return _data
+
 
 # trains MNIST sequential network using bayesian optimization
 def eval_network(params, data, save=False):
-    learning_rate = 10.0**params[0]
-    dropout_rate = params[1]
+    learning_rate = params['learning_rate']
+    dropout_rate = params['drop_rate']
 
-    tr = data['train']
-    tr_x = tr[0]
-    tr_y = tr[1]
-    te = data['test']
-    te_x = te[0]
-    te_y = te[1]
+    tr_x, tr_y, te_x, te_y, _, _ = data
     
     height = tr_x.shape[1]
     width = tr_x.shape[2]
@@ -100,22 +106,24 @@ def eval_network(params, data, save=False):
     return mean_acc
 
 
+def search_objective(params):
+    return eval_network(params, load_data(), save=False)
+
+
+# the searches run in 4 worker processes with 4 cores each, an interrupted
+# search is resumed from the results file
 def main():
-    data_path = os.path.join(mnist_data_folder, "data_nhwc.pkl")
-    data = pickle.load(open(data_path, "rb"))
-        
-    bounds = np.array([[-5, -2], [0.1, 0.7]])
-    np.random.seed(42)
-    xp, yp = bayesian_optimisation(n_iters=30,
-                                   sample_loss=partial(eval_network, data=data, save=False),
-                                   bounds=bounds,
-                                   n_pre_samples=5,
-                                   random_search=100000)
-    
-    idx = yp.argmax()
-    params = xp[idx]
+    params, results = bayesian_search(
+            search_objective,
+            [('learning_rate', 1e-5, 1e-2, "log"), ('drop_rate', 0.1, 0.7)],
+            n_iters = 30,
+            n_workers = 4,
+            threads_per_worker = 4,
+            results_path = os.path.join(mnist_net_folder, "mnist_dbn2d1_bayesopt.jsonl"),
+            n_init = 5,
+            n_candidates = 100000)
     
-    train = partial(eval_network, data=data, save=True)
+    train = partial(eval_network, data=load_data(), save=True)
     train(params)
 #Epoch:  39
 #Learning rate:  0.00458747955171
@@ -2,7 +2,6 @@
 # -*- coding: utf-8 -*-
 
 import os
-import pickle
 import numpy as np
 import tensorflow as tf
 from arch.graph import mnist_resnet_cbn1r3d1
@@ -10,20 +9,14 @@ from arch.misc import ExponentialDecay
 from arch.io import save_variables
 from util.misc import tuple_list_find
 from util.batch import random_batch_generator, batch_generator
-from config import mnist_data_folder, mnist_net_folder
+from util.eval import load_mnist_data
+from config import mnist_net_folder
 
 
 # trains MNIST residual network using learning rate of exponential decay
 def main():
     # input data is in NHWC format
-    data_path = os.path.join(mnist_data_folder, "data_nhwc.pkl")
-    data = pickle.load(open(data_path, "rb"))
-    tr = data['train']
-    tr_x = tr[0]
-    tr_y = tr[1]
-    te = data['test']
-    te_x = te[0]
-    te_y = te[1]
+    tr_x, tr_y, te_x, te_y, _, _ = load_mnist_data()
 
     height = tr_x.shape[1]
     width = tr_x.shape[2]
@@ -12,7 +12,9 @@ else:
     import urllib as urllib2
     import urlparse
 import tarfile
+from multiprocessing.pool import ThreadPool
 from config import cifar10_data_folder
+from util.storage import write_dataset
 
 def get_cifar10_data(folder, data_url = "https://www.cs.toronto.edu/~kriz/cifar-10-python.tar.gz"):
     scheme, netloc, path, query, fragment = urlparse.urlsplit(data_url)
@@ -29,32 +31,40 @@ def get_cifar10_data(folder, data_url = "https://www.cs.toronto.edu/~kriz/cifar-
 
 
 def one_hot(arr, size, dtype=np.float32):
+    arr = np.asarray(arr)
     arr_out = np.zeros([len(arr), size], dtype=dtype)
-    for i in range(len(arr)):
-        arr_out[i, arr[i]] = 1
+    arr_out[np.arange(len(arr)), arr] = 1
     return arr_out
 
 
-def convert(imgs, img_size=32, n_chans=3, data_format="channels_first"):
-    imgs = imgs.astype(float) / 255.0
+def convert(imgs, img_size=32, n_chans=3, data_format="channels_first", dtype=float, out=None):
+    """Converts the rows of raw CIFAR-10 pixels into images.
+    Args:
+        imgs: A uint8 array of shape (N, n_chans*img_size*img_size), the
+            channels are stored as consecutive planes.
+        img_size: An integer representing the width and height of the images.
+        n_chans: An integer representing the number of channels.
+        data_format: A string representing the data format, "channels_last" or
+            "channels_first"
+        dtype: The type of the output. Integer types keep the raw [0, 255]
+            values, float types are scaled to [0, 1].
+        out: An optional preallocated output array.
+    Returns:
+        A 4D numpy array.
+    """
+    imgs = imgs.reshape(len(imgs), n_chans, img_size, img_size)
     if data_format == "channels_last":
-        conv_imgs = np.zeros(shape=(len(imgs), 32, 32, 3), dtype=float)
+        # transposing the uint8 pixels is cheaper than the scaled values
+        imgs = np.ascontiguousarray(imgs.transpose(0, 2, 3, 1))
+    if out is None:
+        out = np.empty(imgs.shape, dtype=dtype)
+    if np.issubdtype(out.dtype, np.integer):
+        out[...] = imgs
+    elif out.dtype.itemsize < 4: # half precision arithmetic is slow
+        out[...] = np.divide(imgs, np.float32(255.0))
     else:
-        conv_imgs = np.zeros(shape=(len(imgs), 3, 32, 32), dtype=float)
-    for n in range(len(imgs)):
-        data = imgs[n]
-        r = data[0:1024].reshape(32, 32)
-        g = data[1024:2048].reshape(32, 32)
-        b = data[2048:].reshape(32, 32)
-        if data_format == "channels_last":
-            conv_imgs[n,:,:,0] = r
-            conv_imgs[n,:,:,1] = g
-            conv_imgs[n,:,:,2] = b
-        else:
-            conv_imgs[n,0,:,:] = r
-            conv_imgs[n,1,:,:] = g
-            conv_imgs[n,2,:,:] = b
-    return conv_imgs
+        np.divide(imgs, out.dtype.type(255.0), out=out)
+    return out
 
 
 def unpickle(f):
@@ -66,37 +76,69 @@ def unpickle(f):
     return d
 
 
+def convert_batches(paths, img_size=32, n_chans=3, data_format="channels_first",
+                    dtype=np.uint8, n_threads=5):
+    """Reads and converts CIFAR-10 batch files in parallel. All batches are
+    read first, as the size of the output depends on them, then each batch is
+    converted directly into its slice of a preallocated output array, and its
+    raw pixels are released. No per-image or float copies are made, but the
+    raw pixels of all batches are held until their conversion.
+    Returns:
+        A tuple of the images and the integer labels.
+    """
+    items = [None]*len(paths)
+    def read(i):
+        d = unpickle(paths[i])
+        items[i] = (d[b'data'], np.array(d[b'labels']))
+    pool = ThreadPool(n_threads)
+    try:
+        pool.map(read, range(len(paths)))
+        n_data = sum(len(labels) for _, labels in items)
+        if data_format == "channels_last":
+            shape = (n_data, img_size, img_size, n_chans)
+        else:
+            shape = (n_data, n_chans, img_size, img_size)
+        x = np.empty(shape, dtype=dtype)
+        offsets = np.cumsum([0] + [len(labels) for _, labels in items])
+        def conv(i):
+            convert(items[i][0], img_size=img_size, n_chans=n_chans,
+                    data_format=data_format, out=x[offsets[i]:offsets[i+1]])
+            items[i] = (None, items[i][1])
+        pool.map(conv, range(len(paths)))
+    finally:
+        pool.close()
+    y = np.concatenate([labels for _, labels in items])
+    return x, y
+
+
 def main(out_folder = "/home/autasi/Work/gitTF/cifar10/data/", 
-         data_format = "channels_first"):    
+         data_format = "channels_first",
+         write_pickle = False):
     cifar_folder = get_cifar10_data(out_folder)
     n_chans = 3
     img_size = 32
-    tr_x = []
-    tr_y = []
-    for i in range(5):
-        path = os.path.join(cifar_folder, "data_batch_" + str(i+1))
-        d = unpickle(path)
-        data = convert(d[b'data'], img_size=img_size, n_chans=n_chans, data_format=data_format)
-        labels = one_hot(np.array(d[b'labels']), size=10)
-        tr_x.append(data)
-        tr_y.append(labels)
-    tr_x = np.concatenate(tr_x)
-    tr_y = np.concatenate(tr_y)
-    
-    path = os.path.join(cifar_folder, "test_batch")
-    d = unpickle(path)
-    te_x = convert(d[b'data'], img_size=img_size, n_chans=n_chans, data_format=data_format)
-    te_y = one_hot(np.array(d[b'labels']), size=10)
+    paths = [os.path.join(cifar_folder, "data_batch_" + str(i+1)) for i in range(5)]
+    tr_x, tr_y = convert_batches(paths, img_size=img_size, n_chans=n_chans, data_format=data_format)
+    te_x, te_y = convert_batches([os.path.join(cifar_folder, "test_batch")],
+                                 img_size=img_size, n_chans=n_chans, data_format=data_format)
     
-    data = {'train': (tr_x, tr_y), 'test': (te_x, te_y)}
     if data_format == "channels_first":
         suf = "nchw"
     else:
         suf = "nhwc"
-    fname = os.path.join(out_folder, "data_" + suf + ".pkl")
-    with open(fname, "wb") as f:
-        pickle.dump(data, f)
+    # uint8 images and integer labels, memory-mapped by the loaders
+    write_dataset(os.path.join(out_folder, "data_" + suf),
+                  {'train': (tr_x, tr_y), 'test': (te_x, te_y)},
+                  n_classes = 10,
+                  data_format = data_format,
+                  scale = 255.0)
+    if write_pickle:
+        data = {'train': (tr_x / 255.0, one_hot(tr_y, size=10)),
+                'test': (te_x / 255.0, one_hot(te_y, size=10))}
+        fname = os.path.join(out_folder, "data_" + suf + ".pkl")
+        with open(fname, "wb") as f:
+            pickle.dump(data, f)
     
 
 if __name__ == "__main__":
-    main(out_folder=cifar10_data_folder, data_format="channels_last")
\ No newline at end of file
+    main(out_folder=cifar10_data_folder, data_format="channels_last")
@@ -2,10 +2,12 @@
 
 
 from tensorflow.examples.tutorials.mnist import input_data
+import tensorflow as tf
 import numpy as np
 import pickle
 import os
 from config import mnist_data_folder
+from util.storage import write_dataset
 
 def convert(imgs, img_size, data_format="channels_first"):
     if data_format == "channels_first":
@@ -16,24 +18,29 @@ def convert(imgs, img_size, data_format="channels_first"):
 
 
 def main(out_folder = "/home/ucu/Work/git/mnist/data/",
-         data_format = "channels_first"):
-    mnist = input_data.read_data_sets(out_folder, one_hot=True)
+         data_format = "channels_first",
+         write_pickle = False):
+    mnist = input_data.read_data_sets(out_folder, one_hot=False, dtype=tf.uint8, reshape=False)
     img_size = 28
-    tr_x = convert(mnist.train.images, img_size, data_format=data_format)
-    tr_y = mnist.train.labels
-    te_x = convert(mnist.test.images, img_size, data_format=data_format)
-    te_y = mnist.test.labels
-    val_x = convert(mnist.validation.images, img_size, data_format=data_format)
-    val_y = mnist.validation.labels
-    data = {'train': (tr_x, tr_y), 'test': (te_x, te_y), 'validation': (val_x, val_y)}
+    splits = dict()
+    for name, ds in [('train', mnist.train), ('test', mnist.test), ('validation', mnist.validation)]:
+        splits[name] = (convert(ds.images, img_size, data_format=data_format), ds.labels)
     if data_format == "channels_first":
         suf = "nchw"
     else:
         suf = "nhwc"
-    fname = os.path.join(out_folder, "data_" + suf + ".pkl")
-    with open(fname, "wb") as f:
-        pickle.dump(data, f)
+    # uint8 images and integer labels, memory-mapped by the loaders
+    write_dataset(os.path.join(out_folder, "data_" + suf), splits,
+                  n_classes = 10,
+                  data_format = data_format,
+                  scale = 255.0)
+    if write_pickle:
+        data = dict((name, (x.astype(np.float32) / 255.0, np.eye(10, dtype=np.float32)[y]))
+                    for name, (x, y) in splits.items())
+        fname = os.path.join(out_folder, "data_" + suf + ".pkl")
+        with open(fname, "wb") as f:
+            pickle.dump(data, f)
     
 
 if __name__ == "__main__":
-    main(out_folder=mnist_data_folder, data_format="channels_last")
\ No newline at end of file
+    main(out_folder=mnist_data_folder, data_format="channels_last")
@@ -1,7 +1,14 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import sys
+import time
+import threading
 import numpy as np
+if sys.version_info >= (3,):
+    import queue
+else:
+    import Queue as queue
 
 def batch_generator(size, x, y=None, fixed_size=True):
     """Generates batches from one or two input arrays.
@@ -44,7 +51,8 @@ def batch_generator(size, x, y=None, fixed_size=True):
                 
                 
 def random_batch_generator(size, x, y=None, fixed_size=True, seed=None):            
-    """Generates randomized batches from one or two input arrays.
+    """Generates randomized batches from one or two input arrays. Only the
+    items of the current batch are gathered, the inputs are not copied.
     Args:
         size: An integer representing the batch size.
         x: An ndarray representing the input array.
@@ -52,18 +60,233 @@ def random_batch_generator(size, x, y=None, fixed_size=True, seed=None):
         fixed_size: A boolean that defines how batches are generated. If True,
             then all batches have fixed size. If False, then the last batch is
             allowed to have a smaller size.
-        seed: An optional integer representing the random seed number.
+        seed: An optional integer representing the random seed number. If
+            given, a local random state is used, and the global one is left
+            untouched.
     Yields:
         ndarray or tuple of ndarrays: If `y` is None, then a single ndarray
             is generated, otherwise a tuple of two ndarrays. Note, that the
             batch arrays will contain the input elements in random order.
     """
     ndata = x.shape[0]
-    indices = range(0, ndata)
     if seed is not None:
-        np.random.seed(seed)
-    indices = np.random.permutation(indices)
-    xr = x[indices]
-    yr = y[indices] if y is not None else None
-    for items in batch_generator(size, xr, yr, fixed_size):
-        yield items
\ No newline at end of file
+        indices = np.random.RandomState(seed).permutation(ndata)
+    else:
+        indices = np.random.permutation(ndata)
+    for idx in batch_generator(size, indices, fixed_size=fixed_size):
+        if y is not None:
+            yield (x[idx], y[idx])
+        else:
+            yield x[idx]
+
+
+def _gather(arr, idx, out=None):
+    if out is not None and isinstance(arr, np.ndarray):
+        out = out[:len(idx)]
+        np.take(arr, idx, axis=0, out=out)
+        return out
+    return arr[idx]
+
+
+class ShuffledBatchIterator(object):
+    """Iterable class to generate shuffled batches epoch by epoch. Each
+    iteration over the object is a new epoch with a new order drawn from its
+    own random generator, and only the items of the current batch are gathered.
+
+    Attributes:
+        size: An integer representing the batch size.
+        x: An ndarray (or array-like) representing the input array.
+        y: An optional ndarray representing another input array.
+        fixed_size: A boolean that defines how batches are generated, see
+            batch_generator.
+        rng: A numpy.random.Generator defining the epoch orders.
+        shard_index: An integer representing the index of this shard.
+        n_shards: An integer representing the number of shards. Shards of the
+            same seed get disjoint parts of the same epoch order.
+        reuse_buffers: A boolean, if True the batches are gathered into
+            preallocated buffers, which are overwritten by the next batch.
+            Therefore, it must not be used when batches are queued ahead, e.g.
+            by PrefetchLoader.
+        epoch: An integer representing the number of started epochs.
+
+    """
+    def __init__(self, size, x, y=None, fixed_size=True, seed=None,
+                 shard_index=0, n_shards=1, reuse_buffers=False):
+        if not 0 <= shard_index < n_shards:
+            raise ValueError("Invalid shard index: " + str(shard_index))
+        self.size = size
+        self.x = x
+        self.y = y
+        self.fixed_size = fixed_size
+        self.rng = np.random.default_rng(seed)
+        self.shard_index = shard_index
+        self.n_shards = n_shards
+        self.reuse_buffers = reuse_buffers
+        self.epoch = 0
+        self._x_buf = None
+        self._y_buf = None
+        if reuse_buffers:
+            self._x_buf = np.empty((size,) + tuple(x.shape[1:]), dtype=x.dtype)
+            if y is not None:
+                self._y_buf = np.empty((size,) + tuple(y.shape[1:]), dtype=y.dtype)
+
+    def __len__(self):
+        ndata = len(range(self.shard_index, self.x.shape[0], self.n_shards))
+        return (ndata + self.size - 1) // self.size
+
+    def __iter__(self):
+        indices = self.rng.permutation(self.x.shape[0])
+        indices = indices[self.shard_index::self.n_shards]
+        self.epoch += 1
+        for idx in batch_generator(self.size, indices, fixed_size=self.fixed_size):
+            xb = _gather(self.x, idx, self._x_buf)
+            if self.y is not None:
+                yield (xb, _gather(self.y, idx, self._y_buf))
+            else:
+                yield xb
+
+
+class PrefetchLoader(object):
+    """Iterator class to prepare batches in background threads while the
+    consumer (e.g. the training step) is running.
+
+    A producer thread pulls the batches from the wrapped generator in order,
+    and the optional per-batch transform is applied by a pool of worker
+    threads. The prepared batches are kept in a bounded queue and they are
+    yielded in the order of the generator. If the transform has a
+    `sample_transformer` method (e.g. RandomizedBatchTransformer), its random
+    parameters are drawn in the producer thread in batch order, therefore the
+    output is deterministic for a seeded transformer regardless of the number
+    of workers. Note, that numpy and OpenCV release the GIL in their heavy
+    routines, which makes threads sufficient for the overlap.
+
+    Attributes:
+        generator: An iterable of batches, an ndarray or a tuple of ndarrays.
+        transform: An optional callable or randomized batch transformer applied
+            on the first array of each batch.
+        queue_size: An integer representing the maximum number of prepared or
+            in-flight batches.
+        n_workers: An integer representing the number of transform workers.
+        n_batches: An integer representing the number of consumed batches.
+        n_starved: An integer representing the number of batches for which the
+            consumer found the queue empty and had to wait.
+        wait_time: A number representing the total waiting time of the consumer
+            in seconds.
+
+    """
+    _end = object()
+
+    def __init__(self, generator, transform = None, queue_size = 4, n_workers = 1):
+        self.generator = generator
+        self.transform = transform
+        self.queue_size = max(1, queue_size)
+        self.n_workers = max(1, n_workers)
+        self.n_batches = 0
+        self.n_starved = 0
+        self.wait_time = 0.0
+        self._ready = queue.Queue(maxsize = self.queue_size)
+        self._tasks = queue.Queue(maxsize = self.queue_size)
+        self._stop = threading.Event()
+        self._threads = [threading.Thread(target = self._produce)]
+        if transform is not None:
+            self._threads += [threading.Thread(target = self._work)
+                              for _ in range(self.n_workers)]
+        for t in self._threads:
+            t.daemon = True
+            t.start()
+
+    def _put(self, q, item):
+        """Puts an item into a queue unless the loader is closed."""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout = 0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self):
+        """Pulls batches from the generator and schedules their transforms."""
+        try:
+            for items in self.generator:
+                if self._stop.is_set():
+                    return
+                slot = [threading.Event(), None]
+                if self.transform is None:
+                    slot[1] = items
+                    slot[0].set()
+                else:
+                    x = items[0] if isinstance(items, tuple) else items
+                    if hasattr(self.transform, "sample_transformer"):
+                        func = self.transform.sample_transformer(len(x)).transform
+                    else:
+                        func = self.transform
+                    if not self._put(self._tasks, (slot, func, items)):
+                        return
+                if not self._put(self._ready, slot):
+                    return
+        except Exception as e:
+            slot = [threading.Event(), e]
+            slot[0].set()
+            self._put(self._ready, slot)
+            return
+        self._put(self._ready, self._end)
+
+    def _work(self):
+        """Applies the transform on the scheduled batches."""
+        while not self._stop.is_set():
+            try:
+                slot, func, items = self._tasks.get(timeout = 0.1)
+            except queue.Empty:
+                continue
+            try:
+                if isinstance(items, tuple):
+                    slot[1] = (func(items[0]),) + tuple(items[1:])
+                else:
+                    slot[1] = func(items)
+            except Exception as e:
+                slot[1] = e
+            slot[0].set()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        return self.__next__()
+
+    def __next__(self):
+        start = time.time()
+        starved = self._ready.empty()
+        slot = self._ready.get()
+        if slot is self._end:
+            self._ready.put(self._end)
+            raise StopIteration
+        if not slot[0].is_set():
+            starved = True
+            slot[0].wait()
+        if starved:
+            self.n_starved += 1
+            self.wait_time += time.time()-start
+        if isinstance(slot[1], Exception):
+            self.close()
+            raise slot[1]
+        self.n_batches += 1
+        return slot[1]
+
+    def close(self):
+        """Stops the background threads and releases the queued batches."""
+        self._stop.set()
+        for t in self._threads:
+            t.join()
+        self._threads = []
+        # the remaining batches are dropped, and the next call of next()
+        # stops the iteration instead of waiting for the stopped threads
+        while not self._ready.empty():
+            self._ready.get_nowait()
+        self._ready.put_nowait(self._end)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
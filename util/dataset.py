@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import math
+import numpy as np
+import tensorflow as tf
+
+
+def random_affine(
+        images,
+        max_rotation = 3.0,
+        max_translation = 3.0,
+        reflect_y = True,
+        seed = 42,
+        name = "random_affine"):
+    """Applies small random affine transformations (rotation, translation, and
+    reflection) on a batch of images in the graph. The transformations are
+    composed around the image center as done by util.transform.Affine.
+    Note, that pixels mapped from outside of the image are filled with zeros,
+    while Affine replicates the border pixels.
+    Args:
+        images: 4D input tensor, NHWC.
+        max_rotation: A number representing the maximal rotation in degrees.
+        max_translation: A number representing the maximal translation in
+            pixels.
+        reflect_y: A boolean to enable random reflections in the y-axis.
+        seed: An integer representing the random seed.
+        name: Name of the operation.
+    Returns:
+        4D tensor.
+    """
+    with tf.name_scope(name):
+        shape = tf.shape(images)
+        n = shape[0]
+        height = tf.cast(shape[1], tf.float32)
+        width = tf.cast(shape[2], tf.float32)
+        r = tf.random_uniform([n], -max_rotation, max_rotation, seed = seed)
+        r = r * (math.pi / 180.0)
+        tx = tf.random_uniform([n], -max_translation, max_translation, seed = seed+1)
+        ty = tf.random_uniform([n], -max_translation, max_translation, seed = seed+2)
+        if reflect_y:
+            f = tf.where(tf.random_uniform([n], seed = seed+3) < 0.5,
+                         tf.ones([n]), -tf.ones([n]))
+        else:
+            f = tf.ones([n])
+        ca = tf.cos(r)
+        sa = tf.sin(r)
+        # A = R*Fy, the translation keeps the image center fixed
+        a00 = ca*f
+        a01 = -sa
+        a10 = sa*f
+        a11 = ca
+        cx = 0.5*(width-1.0)
+        cy = 0.5*(height-1.0)
+        b0 = tx + cx - (a00*cx + a01*cy)
+        b1 = ty + cy - (a10*cx + a11*cy)
+        zeros = tf.zeros([n])
+        transforms = tf.stack([a00, a01, b0, a10, a11, b1, zeros, zeros], axis = 1)
+        return tf.contrib.image.transform(images, transforms, interpolation = "BILINEAR")
+
+
+class DatasetInput(object):
+    """Class to feed a network from tf.data iterators instead of placeholders.
+
+    The train and test arrays are copied into the graph once, into variables
+    outside of the global variables collection. Training and evaluation
+    datasets are built over these variables and share a single reinitializable
+    iterator. The train set can be evaluated on a fixed subset given by
+    train_eval_indices.
+
+    Attributes:
+        x: A tensor representing the input images of the current batch.
+        gt: A tensor representing the labels of the current batch.
+        epoch_seed: An int64 placeholder representing the shuffling seed.
+        data_init: An operation to copy the data arrays into the graph.
+        train_init: An operation to start a training epoch.
+        train_eval_init: An operation to start the evaluation on train set.
+        test_eval_init: An operation to start the evaluation on test set.
+
+    """
+    def __init__(self, tr_x, tr_y, te_x, te_y,
+                       batch_size,
+                       eval_batch_size = 256,
+                       train_eval_indices = None,
+                       augment = None,
+                       prefetch_size = 4,
+                       n_threads = 4):
+        self._tr_x_in = tf.placeholder(tf.float32, tr_x.shape)
+        self._tr_y_in = tf.placeholder(tf.float32, tr_y.shape)
+        self._te_x_in = tf.placeholder(tf.float32, te_x.shape)
+        self._te_y_in = tf.placeholder(tf.float32, te_y.shape)
+        self._data = (tr_x, tr_y, te_x, te_y)
+        with tf.name_scope("input_data"):
+            tr_x_var = tf.Variable(self._tr_x_in, trainable = False, collections = [])
+            tr_y_var = tf.Variable(self._tr_y_in, trainable = False, collections = [])
+            te_x_var = tf.Variable(self._te_x_in, trainable = False, collections = [])
+            te_y_var = tf.Variable(self._te_y_in, trainable = False, collections = [])
+        self.data_init = tf.group(
+                tr_x_var.initializer, tr_y_var.initializer,
+                te_x_var.initializer, te_y_var.initializer)
+        self.epoch_seed = tf.placeholder(tf.int64, shape = [], name = "epoch_seed")
+
+        train = tf.data.Dataset.from_tensor_slices((tr_x_var, tr_y_var))
+        train = train.shuffle(buffer_size = tr_x.shape[0], seed = self.epoch_seed)
+        train = train.batch(batch_size)
+        if augment is not None:
+            train = train.map(lambda x, y: (augment(x), y),
+                              num_parallel_calls = n_threads)
+        train = train.prefetch(prefetch_size)
+
+        if train_eval_indices is None:
+            train_eval = tf.data.Dataset.from_tensor_slices((tr_x_var, tr_y_var))
+        else: # evaluation on a fixed subset
+            indices = tf.constant(train_eval_indices, dtype = tf.int64)
+            train_eval = tf.data.Dataset.from_tensor_slices(
+                    (tf.gather(tr_x_var, indices), tf.gather(tr_y_var, indices)))
+        train_eval = train_eval.batch(eval_batch_size).prefetch(prefetch_size)
+        test_eval = tf.data.Dataset.from_tensor_slices((te_x_var, te_y_var))
+        test_eval = test_eval.batch(eval_batch_size).prefetch(prefetch_size)
+
+        iterator = tf.data.Iterator.from_structure(
+                train.output_types,
+                (tf.TensorShape([None]+list(tr_x.shape[1:])),
+                 tf.TensorShape([None]+list(tr_y.shape[1:]))))
+        self.x, self.gt = iterator.get_next()
+        self.x = tf.identity(self.x, name = "input")
+        self.gt = tf.identity(self.gt, name = "label")
+        self.train_init = iterator.make_initializer(train)
+        self.train_eval_init = iterator.make_initializer(train_eval)
+        self.test_eval_init = iterator.make_initializer(test_eval)
+
+    def initialize(self, session):
+        """Copies the data arrays into the graph variables.
+        Args:
+            session: A TensorFlow session.
+        """
+        tr_x, tr_y, te_x, te_y = self._data
+        session.run(self.data_init, feed_dict = {
+                self._tr_x_in: np.asarray(tr_x, dtype = np.float32),
+                self._tr_y_in: np.asarray(tr_y, dtype = np.float32),
+                self._te_x_in: np.asarray(te_x, dtype = np.float32),
+                self._te_y_in: np.asarray(te_y, dtype = np.float32)})
+
+
+def run_until_end(session, fetches, feed_dict = None):
+    """Runs fetches until the current iterator is exhausted.
+    Args:
+        session: A TensorFlow session.
+        fetches: Fetches passed to session.run.
+        feed_dict: An optional feed dictionary.
+    Yields:
+        The fetched values of each step.
+    """
+    while True:
+        try:
+            yield session.run(fetches, feed_dict = feed_dict)
+        except tf.errors.OutOfRangeError:
+            return
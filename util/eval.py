@@ -2,27 +2,178 @@
 # -*- coding: utf-8 -*-
 
 import os
+import copy
 import pickle
 import tensorflow as tf
 import numpy as np
-from config import cifar10_data_folder
+from functools import partial
+from config import cifar10_data_folder, mnist_data_folder
 from util.misc import tuple_list_find
 from arch.misc import ExponentialDecay
-from util.batch import random_batch_generator, batch_generator
-from util.transform import RandomizedTransformer, Affine
+from arch.initializers import SeededInitializer
+from arch.io import Checkpoint
+from arch.layers import with_data_format
+from arch import recompute
+from util.batch import random_batch_generator, PrefetchLoader
+from util.transform import RandomizedBatchTransformer, BatchAffine
+from util.dataset import DatasetInput, random_affine, run_until_end
+from util.storage import is_dataset, read_dataset, ScaledImages
+from util.metrics import StreamingAccuracy, is_eval_epoch, eval_subset
+from util.profiler import StepProfiler
+from util.parallel import with_towers, tower_config, lr_factor
 
-def load_cifar10_data():
-    data_path = os.path.join(cifar10_data_folder, "data_nhwc.pkl")
+def _load_data(data_folder, split_names, lazy = False):
+    """Loads a dataset from the memory-mapped format, or from the legacy
+    pickle if it has not been converted.
+    Args:
+        data_folder: A string representing the data folder.
+        split_names: A list of the split names to be returned.
+        lazy: A boolean, if True the images are returned as ScaledImages, which
+            read and scale only the requested batches, and can be normalized
+            per batch by a Normalizer. Otherwise float32 arrays are returned.
+    Returns:
+        A list of the images and labels of the splits.
+    """
+    folder = os.path.join(data_folder, "data_nhwc")
+    if is_dataset(folder):
+        _, splits = read_dataset(folder)
+        data = []
+        for name in split_names:
+            x, y = splits[name]
+            data += [x if lazy else np.asarray(x), y]
+        return data
+    data_path = os.path.join(data_folder, "data_nhwc.pkl")
     data = pickle.load(open(data_path, "rb"))
-    tr = data['train']
-    tr_x = tr[0]
-    tr_y = tr[1]
-    te = data['test']
-    te_x = te[0]
-    te_y = te[1]
+    if lazy:
+        return [arr for name in split_names
+                for arr in (ScaledImages(data[name][0], scale = 1.0), data[name][1])]
+    return [arr for name in split_names for arr in data[name]]
+
+
+def load_cifar10_data(lazy = False):
+    tr_x, tr_y, te_x, te_y = _load_data(
+            cifar10_data_folder, ['train', 'test'], lazy = lazy)
     return tr_x, tr_y, te_x, te_y
 
 
+def load_mnist_data(lazy = False):
+    tr_x, tr_y, te_x, te_y, val_x, val_y = _load_data(
+            mnist_data_folder, ['train', 'test', 'validation'], lazy = lazy)
+    return tr_x, tr_y, te_x, te_y, val_x, val_y
+
+
+def _print_epoch(epoch, lr, acc = None, tr_acc = None, loader = None):
+    print("Epoch: ", epoch)
+    print("Learning rate: ", lr)
+    if acc is not None:
+        print("Test accuracy: ", acc)
+    if tr_acc is not None:
+        print("Train accuracy: ", tr_acc)
+    if loader is not None:
+        print("Input starved batches: ", loader.n_starved, "/", loader.n_batches)
+
+
+def _train_epoch_feed(
+        session, loader, train_step, x, gt, training, learning_rate, lr,
+        profiler = None):
+    """Runs one training epoch on the batches of a loader fed through
+    placeholders. The sampled steps are traced if a profiler is given.
+    """
+    runner = session if profiler is None else profiler.wrap(session)
+    with loader:
+        for (xb, yb) in loader:
+            runner.run(train_step, feed_dict = {x: xb,
+                                                gt: yb,
+                                                training: True,
+                                                learning_rate: lr})
+
+
+def _train_epoch_dataset(
+        session, pipeline, train_step, training, learning_rate, lr, epoch_seed,
+        profiler = None):
+    """Runs one training epoch using tf.data iterators. The sampled steps are
+    traced if a profiler is given.
+    """
+    session.run(pipeline.train_init, feed_dict = {pipeline.epoch_seed: epoch_seed})
+    runner = session if profiler is None else profiler.wrap(session)
+    for _ in run_until_end(runner, train_step, feed_dict = {training: True,
+                                                            learning_rate: lr}):
+        pass
+
+
+def _write_profile(profiler, profile_dir, run_seed):
+    """Prints the profiled time per layer and per scope, and writes them with
+    a Chrome trace of the last sampled step.
+    """
+    if not os.path.isdir(profile_dir):
+        os.makedirs(profile_dir)
+    profiler.print_summary()
+    profiler.print_summary(depth = 2)
+    name = str(run_seed)
+    profiler.write_summary(os.path.join(profile_dir, "layers_" + name + ".json"))
+    profiler.write_summary(os.path.join(profile_dir, "scopes_" + name + ".json"), depth = 2)
+    profiler.write_chrome_trace(os.path.join(profile_dir, "trace_" + name + ".json"))
+
+
+def _evaluate(
+        session, evaluator, training,
+        tr_x, tr_y, te_x, te_y,
+        x = None, gt = None, pipeline = None,
+        eval_train = True,
+        train_indices = None,
+        batch_size = 1024):
+    """Evaluates the network on the test set, and optionally on the train set.
+    Returns:
+        A tuple of the test and train accuracies, the latter is None if the
+        train set is not evaluated.
+    """
+    feed_dict = {training: False}
+    tr_acc = None
+    if pipeline is not None:
+        if eval_train:
+            tr_acc = evaluator.evaluate_iterator(session, pipeline.train_eval_init, feed_dict)
+        acc = evaluator.evaluate_iterator(session, pipeline.test_eval_init, feed_dict)
+    else:
+        if eval_train:
+            tr_acc = evaluator.evaluate(session, x, gt, tr_x, tr_y,
+                                        batch_size = batch_size,
+                                        indices = train_indices,
+                                        feed_dict = feed_dict)
+        acc = evaluator.evaluate(session, x, gt, te_x, te_y,
+                                 batch_size = batch_size,
+                                 feed_dict = feed_dict)
+    return acc, tr_acc
+
+
+def _save_run(session, checkpoint, path, epoch, acc, lr_decay_func, transformer):
+    """Saves the state of a training run after an epoch. The variables are
+    written in the background, the learning rate scheduler and the random
+    states are pickled into the file attributes.
+    """
+    state = {'epoch': epoch,
+             'acc': acc,
+             'lr_decay_func': lr_decay_func,
+             'transformer_state': transformer.random_state.get_state(),
+             'numpy_state': np.random.get_state()}
+    checkpoint.save(session, path, background = True,
+                    attrs = {'epoch': epoch,
+                             'state': np.void(pickle.dumps(state))})
+
+
+def _restore_run(session, checkpoint, path, lr_decay_func, transformer):
+    """Restores the state of a training run saved by _save_run.
+    Returns:
+        A tuple of the next epoch index and the last test accuracy.
+    """
+    attrs = checkpoint.restore(session, path)
+    state = pickle.loads(attrs['state'].tobytes())
+    # the caller's scheduler instance continues from the saved position
+    lr_decay_func.__dict__.update(state['lr_decay_func'].__dict__)
+    transformer.random_state.set_state(state['transformer_state'])
+    np.random.set_state(state['numpy_state'])
+    return state['epoch']+1, state['acc']
+
+
 def _eval_net_custom(
         tr_x, tr_y, te_x, te_y,
         net_func,
@@ -34,7 +185,40 @@ def _eval_net_custom(
         weight_decay = 0.0,
         aux_loss_weight = None,
         label_smoothing = None,
+        prefetch_size = 4,
+        prefetch_workers = 1,
+        input_mode = "feed",
+        eval_every = 1,
+        eval_train = True,
+        train_eval_size = None,
+        eval_batch_size = 1024,
+        n_repeat = 1,
+        run_dir = None,
+        checkpoint_every = 10,
+        profile_dir = None,
+        profile_every = 100,
+        data_format = "channels_last",
+        recompute_scopes = None,
+        recompute_every = 1,
+        n_towers = 1,
+        threads_per_tower = None,
+        lr_scaling = "linear",
         seed = 42):
+    """Builds the network and trains it n_repeat times. The first run uses
+    the initializers of the graph, the following ones re-initialize the
+    variables with the seeds seed+1, seed+2, ... in the same session.
+    If run_dir is given, each run is checkpointed every checkpoint_every
+    epochs, and resumed from its latest checkpoint. If profile_dir is given,
+    every profile_every-th training step is traced, and the profile of each
+    run is written there. The network is built in data_format. If
+    recompute_scopes is given, the activations between the outputs of the
+    matching scopes are recomputed in the backpropagation. If n_towers is
+    larger than one, the network is trained data-parallel by n_towers towers
+    on batches of batch_size each, with the learning rate scaled by
+    lr_scaling.
+    Returns:
+        A list of the final test accuracies of the runs.
+    """
     height = tr_x.shape[1]
     width = tr_x.shape[2]
     n_chans = tr_x.shape[3]
@@ -43,15 +227,34 @@ def _eval_net_custom(
     if optimizer_args is None:
         optimizer_args = dict()
 
+    # the global batch is split into a shard per tower
+    batch_size = batch_size * n_towers
+    lr_scale = lr_factor(lr_scaling, n_towers)
+
     tf.reset_default_graph()
     np.random.seed(seed)
     tf.set_random_seed(seed)    
     
+    # fixed subset of the train set for estimating the train accuracy
+    train_indices = eval_subset(tr_x.shape[0], train_eval_size, seed = seed)
+
     # input variables, image data + ground truth labels
-    x = tf.placeholder(tf.float32, [None, height, width, n_chans], name="input")
-    gt = tf.placeholder(tf.float32, [None, n_classes], name="label")
+    pipeline = None
+    if input_mode == "dataset":
+        pipeline = DatasetInput(
+                tr_x, tr_y, te_x, te_y, batch_size,
+                eval_batch_size = eval_batch_size,
+                train_eval_indices = train_indices,
+                augment = partial(random_affine, seed = seed),
+                prefetch_size = prefetch_size)
+        x = pipeline.x
+        gt = pipeline.gt
+    else:
+        x = tf.placeholder(tf.float32, [None, height, width, n_chans], name="input")
+        gt = tf.placeholder(tf.float32, [None, n_classes], name="label")
     
-    # create network
+    # create network, the inputs are NHWC and transposed in the graph for NCHW
+    net_func = with_towers(with_data_format(net_func, data_format), n_towers)
     if weight_decay is None:
         reg_weights = False
         layers, variables = net_func(x, seed = seed)
@@ -59,6 +262,10 @@ def _eval_net_custom(
         reg_weights = True
         layers, variables = net_func(x, weight_decay = weight_decay, seed = seed)
     
+    # keeps only the outputs of the matching scopes for the backpropagation
+    if recompute_scopes is not None:
+        recompute.checkpoint_scopes(recompute_scopes, every = recompute_every)
+
     # training variable to control dropout
     training = tuple_list_find(variables, "training")[1]
     
@@ -94,67 +301,120 @@ def _eval_net_custom(
     
     # some layers (e.g. batch normalization) require updates to internal variables
     update_ops = tf.get_collection(tf.GraphKeys.UPDATE_OPS)
+    # the builders mark the activations to be kept (e.g. efficient DenseNet),
+    # and the others are recomputed in the backpropagation
+    checkpoints = tf.get_collection(recompute.CHECKPOINTS)
     with tf.control_dependencies(update_ops):
-        train_step = optimizer(**optimizer_args).minimize(loss_fn, global_step = global_step)
+        if checkpoints:
+            train_step = recompute.minimize(
+                    optimizer(**optimizer_args), loss_fn, checkpoints,
+                    global_step = global_step)
+        else:
+            train_step = optimizer(**optimizer_args).minimize(
+                    loss_fn, global_step = global_step,
+                    colocate_gradients_with_ops = (n_towers > 1))
         
-    # correct classifications
-    corr = tf.equal(tf.argmax(logit, 1), tf.argmax(gt, 1))
+    # accuracy accumulated over the evaluation batches
+    evaluator = StreamingAccuracy(logit, gt)
     
-    # accuray = average of correct classifications
-    accuracy = tf.reduce_mean(tf.cast(corr, tf.float32))
-    
-    # apply random affine transformations to training images
-    transformer = RandomizedTransformer(
-            transformer_class = Affine,
-            params = [('shape', (height, width, n_chans)),
-                      ('scale', 1.0)],
-            rand_params = [('r', [-3.0, 3.0]),
-                           ('tx', [-3.0, 3.0]),
-                           ('ty', [-3.0, 3.0]),
-                           ('reflect_y', [False, True])],
-            mode = 'each',
-            random_seed = seed)    
-    
-    acc_final = None
-    session = tf.Session()
+    # re-initializes the weights, optimizer slots and global step per repeat
+    initializer = SeededInitializer() if n_repeat > 1 else None
+
+    # saves all variables, including optimizer slots and global step
+    checkpoint = None
+    if run_dir is not None:
+        if not os.path.isdir(run_dir):
+            os.makedirs(run_dir)
+        checkpoint = Checkpoint()
+
+    accs = []
+    session = tf.Session(config = tower_config(n_towers, threads_per_tower) if n_towers > 1 else None)
     with session.as_default():
-        # initialization of variables
-        session.run(tf.global_variables_initializer())
-        for i in range(n_epochs):
-            lr = next(lr_decay_func)
-            # training via random batches
-            for (xb, yb) in random_batch_generator(batch_size, tr_x, tr_y, seed = seed+i):
-                xbtr = np.zeros_like(xb)
-                for j in range(len(xb)):
-                    xbtr[j] = transformer.transform(xb[j])                
-                session.run(train_step, feed_dict = {x: xbtr,
-                                                     gt: yb,
-                                                     training: True,
-                                                     learning_rate: lr})
-
-            tr_acc = []
-            # evaluations on train set
-            for (xb, yb) in batch_generator(256, tr_x, tr_y, fixed_size = False):
-                ac = session.run(accuracy, feed_dict = {x: xb,
-                                                        gt: yb,
-                                                        training: False})
-                tr_acc.append(ac)    
-    
-            acc = []
-            # evaluations on test set
-            for (xb, yb) in batch_generator(256, te_x, te_y, fixed_size = False):
-                ac = session.run(accuracy, feed_dict = {x: xb,
-                                                        gt: yb,
-                                                        training: False})
-                acc.append(ac)
-            print("Epoch: ", i)
-            print("Learning rate: ", lr)
-            print("Test accuracy: ", np.mean(acc))
-            print("Train accuracy: ", np.mean(tr_acc))
-            acc_final = np.mean(acc)
+        if input_mode == "dataset":
+            pipeline.initialize(session)
+        for n in range(n_repeat):
+            repeat_seed = seed+n
+            # initialization of variables
+            if n == 0:
+                session.run(tf.global_variables_initializer())
+            else:
+                np.random.seed(repeat_seed)
+                initializer.run(session, repeat_seed)
+
+            # apply random affine transformations to training images
+            transformer = RandomizedBatchTransformer(
+                    transformer_class = BatchAffine,
+                    params = [('shape', (height, width, n_chans)),
+                              ('scale', 1.0)],
+                    rand_params = [('r', [-3.0, 3.0]),
+                                   ('tx', [-3.0, 3.0]),
+                                   ('ty', [-3.0, 3.0]),
+                                   ('reflect_y', [False, True])],
+                    random_seed = repeat_seed)
+
+            # each repeat starts the learning rate schedule from the beginning
+            lr_func = copy.deepcopy(lr_decay_func)
+
+            # profiling is off by default, the steps are run directly then
+            profiler = None
+            if profile_dir is not None:
+                profiler = StepProfiler(layers, every = profile_every)
+
+            acc_final = None
+            start_epoch = 0
+            if checkpoint is not None:
+                checkpoint_path = os.path.join(
+                        run_dir, "checkpoint_" + str(repeat_seed) + ".h5")
+                if os.path.isfile(checkpoint_path):
+                    start_epoch, acc_final = _restore_run(
+                            session, checkpoint, checkpoint_path,
+                            lr_func, transformer)
+                    print("Resumed from epoch: ", start_epoch-1)
+            for i in range(start_epoch, n_epochs):
+                lr = next(lr_func)
+                loader = None
+                if input_mode == "dataset":
+                    _train_epoch_dataset(
+                            session, pipeline, train_step,
+                            training, learning_rate, lr*lr_scale, repeat_seed+i,
+                            profiler = profiler)
+                else:
+                    # training via random batches
+                    # batches are augmented in the background during the training steps
+                    loader = PrefetchLoader(
+                            random_batch_generator(batch_size, tr_x, tr_y, seed = repeat_seed+i),
+                            transform = transformer,
+                            queue_size = prefetch_size,
+                            n_workers = prefetch_workers)
+                    _train_epoch_feed(session, loader, train_step, x, gt,
+                                      training, learning_rate, lr*lr_scale,
+                                      profiler = profiler)
+
+                if is_eval_epoch(i, n_epochs, eval_every):
+                    # evaluations on test set and (a subset of) train set
+                    acc, tr_acc = _evaluate(
+                            session, evaluator, training,
+                            tr_x, tr_y, te_x, te_y,
+                            x = x, gt = gt, pipeline = pipeline,
+                            eval_train = eval_train,
+                            train_indices = train_indices,
+                            batch_size = eval_batch_size)
+                    _print_epoch(i, lr, acc, tr_acc, loader = loader)
+                    acc_final = acc
+                else:
+                    _print_epoch(i, lr, loader = loader)
+
+                if (checkpoint is not None) and is_eval_epoch(i, n_epochs, checkpoint_every):
+                    _save_run(session, checkpoint, checkpoint_path, i, acc_final,
+                              lr_func, transformer)
+            if profiler is not None:
+                _write_profile(profiler, profile_dir, repeat_seed)
+            accs.append(acc_final)
+        if checkpoint is not None:
+            checkpoint.wait()
     session.close()
     session = None
-    return acc_final
+    return accs
 
 
 def eval_net_custom(
@@ -169,11 +429,69 @@ def eval_net_custom(
         aux_loss_weight = None,
         label_smoothing = None,
         n_repeat = 1,
+        prefetch_size = 4,
+        prefetch_workers = 1,
+        input_mode = "feed",
+        eval_every = 1,
+        eval_train = True,
+        train_eval_size = None,
+        eval_batch_size = 1024,
+        reuse_graph = False,
+        run_dir = None,
+        checkpoint_every = 10,
+        profile_dir = None,
+        profile_every = 100,
+        data_format = "channels_last",
+        recompute_scopes = None,
+        recompute_every = 1,
+        n_towers = 1,
+        threads_per_tower = None,
+        lr_scaling = "linear",
         seed = 42):
+    """Trains and evaluates a network n_repeat times with the seeds seed,
+    seed+1, ... If reuse_graph is True, the graph and the session are built
+    only once and the variables are re-initialized for each repeat, otherwise
+    every repeat builds its own graph.
+
+    If run_dir is given, every run is checkpointed there after every
+    checkpoint_every epochs and after the last one. A checkpoint holds all
+    variables (weights, batch normalization statistics, optimizer slots,
+    global step), the learning rate scheduler, the random state of the
+    augmentation, and the epoch index. Calling the function again with the
+    same run_dir resumes each run from its latest checkpoint, and finished
+    runs are not trained again. The learning rate scheduler has to be
+    picklable, as the ones in arch.misc. In the "feed" input mode the
+    resumed runs reproduce the uninterrupted ones, except for random ops in
+    the graph (e.g. dropout), whose state TensorFlow does not expose.
+
+    The network is built in data_format ("channels_last" or
+    "channels_first"), the input data stays NHWC and is transposed in the
+    graph. The variables do not depend on the data format, so runs can be
+    resumed in the other one.
+
+    If n_towers is larger than one, the network is trained synchronously
+    data-parallel: n_towers towers (replicas sharing the variables, see
+    util.parallel) process the shards of a global batch of n_towers times
+    batch_size, and the gradients are averaged. The learning rate of
+    lr_decay_func is scaled by lr_scaling ("linear", "sqrt", None or a
+    function of n_towers). If threads_per_tower is given, the process is
+    pinned to n_towers*threads_per_tower cores.
+
+    If recompute_scopes is given (a regex of name scopes, e.g.
+    arch.recompute.BLOCK_SCOPES or LAYER_SCOPES), only the outputs of every
+    recompute_every-th matching scope are kept for the backpropagation, and
+    the other activations are recomputed, which trades compute for memory.
+    Returns:
+        A tuple of the mean, max, and min final test accuracies.
+    """
+    if reuse_graph:
+        runs = [(seed, n_repeat)]
+    else:
+        runs = [(seed+n, 1) for n in range(n_repeat)]
 
     accs = []
-    for n in range(n_repeat):
-        acc = _eval_net_custom(
+    for (run_seed, run_repeat) in runs:
+        accs.extend(_eval_net_custom(
                 tr_x, tr_y, te_x, te_y,
                 net_func,
                 n_epochs,
@@ -184,8 +502,25 @@ def eval_net_custom(
                 weight_decay = weight_decay,
                 aux_loss_weight = aux_loss_weight,
                 label_smoothing = label_smoothing,
-                seed = seed+n)
-        accs.append(acc)
+                prefetch_size = prefetch_size,
+                prefetch_workers = prefetch_workers,
+                input_mode = input_mode,
+                eval_every = eval_every,
+                eval_train = eval_train,
+                train_eval_size = train_eval_size,
+                eval_batch_size = eval_batch_size,
+                n_repeat = run_repeat,
+                run_dir = run_dir,
+                checkpoint_every = checkpoint_every,
+                profile_dir = profile_dir,
+                profile_every = profile_every,
+                data_format = data_format,
+                recompute_scopes = recompute_scopes,
+                recompute_every = recompute_every,
+                n_towers = n_towers,
+                threads_per_tower = threads_per_tower,
+                lr_scaling = lr_scaling,
+                seed = run_seed))
     return np.mean(accs), np.max(accs), np.min(accs)
 
 def _eval_net_basic(
@@ -193,7 +528,30 @@ def _eval_net_basic(
         net_func,
         n_epochs = 50,
         batch_size = 128,
+        prefetch_size = 4,
+        input_mode = "feed",
+        eval_every = 1,
+        eval_train = True,
+        train_eval_size = None,
+        eval_batch_size = 1024,
+        n_repeat = 1,
+        profile_dir = None,
+        profile_every = 100,
+        data_format = "channels_last",
+        recompute_scopes = None,
+        recompute_every = 1,
         seed = 42):
+    """Builds the network and trains it n_repeat times. The first run uses
+    the initializers of the graph, the following ones re-initialize the
+    variables with the seeds seed+1, seed+2, ... in the same session.
+    If profile_dir is given, every profile_every-th training step is traced,
+    and the profile of each run is written there. The network is built in
+    data_format ("channels_last" or "channels_first"). If recompute_scopes
+    is given, the activations between the outputs of the matching scopes
+    are recomputed in the backpropagation.
+    Returns:
+        A list of the final test accuracies of the runs.
+    """
     height = tr_x.shape[1]
     width = tr_x.shape[2]
     n_chans = tr_x.shape[3]
@@ -204,13 +562,31 @@ def _eval_net_basic(
     np.random.seed(seed)
     tf.set_random_seed(seed)    
     
+    # fixed subset of the train set for estimating the train accuracy
+    train_indices = eval_subset(tr_x.shape[0], train_eval_size, seed = seed)
+
     # input variables, image data + ground truth labels
-    x = tf.placeholder(tf.float32, [None, height, width, n_chans], name="input")
-    gt = tf.placeholder(tf.float32, [None, n_classes], name="label")
+    pipeline = None
+    if input_mode == "dataset":
+        pipeline = DatasetInput(
+                tr_x, tr_y, te_x, te_y, batch_size,
+                eval_batch_size = eval_batch_size,
+                train_eval_indices = train_indices,
+                prefetch_size = prefetch_size)
+        x = pipeline.x
+        gt = pipeline.gt
+    else:
+        x = tf.placeholder(tf.float32, [None, height, width, n_chans], name="input")
+        gt = tf.placeholder(tf.float32, [None, n_classes], name="label")
     
-    # create network
+    # create network, the inputs are NHWC and transposed in the graph for NCHW
+    net_func = with_data_format(net_func, data_format)
     layers, variables = net_func(x, seed = seed)
     
+    # keeps only the outputs of the matching scopes for the backpropagation
+    if recompute_scopes is not None:
+        recompute.checkpoint_scopes(recompute_scopes, every = recompute_every)
+
     # training variable to control dropout
     training = tuple_list_find(variables, "training")[1]
     
@@ -228,56 +604,81 @@ def _eval_net_basic(
     
     # some layers (e.g. batch normalization) require updates to internal variables
     update_ops = tf.get_collection(tf.GraphKeys.UPDATE_OPS)
+    checkpoints = tf.get_collection(recompute.CHECKPOINTS)
     with tf.control_dependencies(update_ops):
-        train_step = tf.train.AdamOptimizer(learning_rate=learning_rate).minimize(cross_entropy,
-                                                                                  global_step = global_step)
+        if checkpoints:
+            train_step = recompute.minimize(
+                    tf.train.AdamOptimizer(learning_rate=learning_rate), cross_entropy, checkpoints,
+                    global_step = global_step)
+        else:
+            train_step = tf.train.AdamOptimizer(learning_rate=learning_rate).minimize(cross_entropy,
+                                                                                      global_step = global_step)
         
-    # correct classifications
-    corr = tf.equal(tf.argmax(logit, 1), tf.argmax(gt, 1))
-    
-    # accuray = average of correct classifications
-    accuracy = tf.reduce_mean(tf.cast(corr, tf.float32))
+    # accuracy accumulated over the evaluation batches
+    evaluator = StreamingAccuracy(logit, gt)
     
-    # learning rate with exponential decay
-    exp_decay = ExponentialDecay(start=0.01, stop=0.001, max_steps=50)
+    # re-initializes the weights, optimizer slots and global step per repeat
+    initializer = SeededInitializer() if n_repeat > 1 else None
 
-    acc_final = None
+    accs = []
     session = tf.Session()
     with session.as_default():
-        # initialization of variables
-        session.run(tf.global_variables_initializer())
-        for i in range(n_epochs):
-            lr = next(exp_decay)
-            # training via random batches
-            for (xb, yb) in random_batch_generator(batch_size, tr_x, tr_y, seed = seed+i):
-                session.run(train_step, feed_dict = {x: xb,
-                                                     gt: yb,
-                                                     training: True,
-                                                     learning_rate: lr})
-
-            tr_acc = []
-            # evaluations on train set
-            for (xb, yb) in batch_generator(256, tr_x, tr_y, fixed_size = False):
-                ac = session.run(accuracy, feed_dict = {x: xb,
-                                                        gt: yb,
-                                                        training: False})
-                tr_acc.append(ac)    
-    
-            acc = []
-            # evaluations on test set
-            for (xb, yb) in batch_generator(256, te_x, te_y, fixed_size = False):
-                ac = session.run(accuracy, feed_dict = {x: xb,
-                                                        gt: yb,
-                                                        training: False})
-                acc.append(ac)
-            print("Epoch: ", i)
-            print("Learning rate: ", lr)
-            print("Test accuracy: ", np.mean(acc))
-            print("Train accuracy: ", np.mean(tr_acc))
-            acc_final = np.mean(acc)
+        if input_mode == "dataset":
+            pipeline.initialize(session)
+        for n in range(n_repeat):
+            repeat_seed = seed+n
+            # initialization of variables
+            if n == 0:
+                session.run(tf.global_variables_initializer())
+            else:
+                np.random.seed(repeat_seed)
+                initializer.run(session, repeat_seed)
+
+            # learning rate with exponential decay
+            exp_decay = ExponentialDecay(start=0.01, stop=0.001, max_steps=50)
+
+            # profiling is off by default, the steps are run directly then
+            profiler = None
+            if profile_dir is not None:
+                profiler = StepProfiler(layers, every = profile_every)
+
+            acc_final = None
+            for i in range(n_epochs):
+                lr = next(exp_decay)
+                loader = None
+                if input_mode == "dataset":
+                    _train_epoch_dataset(
+                            session, pipeline, train_step,
+                            training, learning_rate, lr, repeat_seed+i,
+                            profiler = profiler)
+                else:
+                    # training via random batches
+                    loader = PrefetchLoader(
+                            random_batch_generator(batch_size, tr_x, tr_y, seed = repeat_seed+i),
+                            queue_size = prefetch_size)
+                    _train_epoch_feed(session, loader, train_step, x, gt,
+                                      training, learning_rate, lr,
+                                      profiler = profiler)
+
+                if not is_eval_epoch(i, n_epochs, eval_every):
+                    _print_epoch(i, lr, loader = loader)
+                    continue
+                # evaluations on test set and (a subset of) train set
+                acc, tr_acc = _evaluate(
+                        session, evaluator, training,
+                        tr_x, tr_y, te_x, te_y,
+                        x = x, gt = gt, pipeline = pipeline,
+                        eval_train = eval_train,
+                        train_indices = train_indices,
+                        batch_size = eval_batch_size)
+                _print_epoch(i, lr, acc, tr_acc, loader = loader)
+                acc_final = acc
+            if profiler is not None:
+                _write_profile(profiler, profile_dir, repeat_seed)
+            accs.append(acc_final)
     session.close()
     session = None
-    return acc_final
+    return accs
 
 
 def eval_net_basic(
@@ -286,15 +687,51 @@ def eval_net_basic(
         n_repeat = 1,
         n_epochs = 50,
         batch_size = 128,
+        prefetch_size = 4,
+        input_mode = "feed",
+        eval_every = 1,
+        eval_train = True,
+        train_eval_size = None,
+        eval_batch_size = 1024,
+        reuse_graph = False,
+        profile_dir = None,
+        profile_every = 100,
+        data_format = "channels_last",
+        recompute_scopes = None,
+        recompute_every = 1,
         seed = 42):
+    """Trains and evaluates a network n_repeat times with the seeds seed,
+    seed+1, ... If reuse_graph is True, the graph and the session are built
+    only once and the variables are re-initialized for each repeat, otherwise
+    every repeat builds its own graph. If recompute_scopes is given, only
+    the outputs of every recompute_every-th matching scope are kept for the
+    backpropagation, see eval_net_custom.
+    Returns:
+        A tuple of the mean, max, and min final test accuracies.
+    """
+    if reuse_graph:
+        runs = [(seed, n_repeat)]
+    else:
+        runs = [(seed+n, 1) for n in range(n_repeat)]
 
     accs = []
-    for n in range(n_repeat):
-        acc = _eval_net_basic(
+    for (run_seed, run_repeat) in runs:
+        accs.extend(_eval_net_basic(
                 tr_x, tr_y, te_x, te_y,
                 net_func,
                 n_epochs = 50,
                 batch_size = batch_size,
-                seed = seed+n)
-        accs.append(acc)
+                prefetch_size = prefetch_size,
+                input_mode = input_mode,
+                eval_every = eval_every,
+                eval_train = eval_train,
+                train_eval_size = train_eval_size,
+                eval_batch_size = eval_batch_size,
+                n_repeat = run_repeat,
+                profile_dir = profile_dir,
+                profile_every = profile_every,
+                data_format = data_format,
+                recompute_scopes = recompute_scopes,
+                recompute_every = recompute_every,
+                seed = run_seed))
     return np.mean(accs), np.max(accs), np.min(accs)
\ No newline at end of file
@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+from scipy.linalg import solve_triangular
+from scipy.special import ndtr
+from util.eval import eval_net_custom
+
+
+class SearchSpace(object):
+    """Class to map hyperparameters to the unit cube, linearly or in log10
+    scale.
+
+    Attributes:
+        names: A list of the names of the hyperparameters.
+        lows: A numpy array of the lower bounds, log10 for the log scaled.
+        highs: A numpy array of the upper bounds, log10 for the log scaled.
+        log: A boolean numpy array, whether the hyperparameters are log scaled.
+    """
+    def __init__(self, params):
+        """
+        Args:
+            params: A list of tuples (name, low, high) or (name, low, high,
+                "log").
+        """
+        self.names = [p[0] for p in params]
+        self.log = np.array([(len(p) > 3) and (p[3] == "log") for p in params])
+        self.lows = np.array([p[1] for p in params], dtype = np.float64)
+        self.highs = np.array([p[2] for p in params], dtype = np.float64)
+        self.lows[self.log] = np.log10(self.lows[self.log])
+        self.highs[self.log] = np.log10(self.highs[self.log])
+
+    def to_unit(self, values):
+        """Maps a dictionary of hyperparameters to a point of the unit cube."""
+        u = np.array([values[name] for name in self.names], dtype = np.float64)
+        u[self.log] = np.log10(u[self.log])
+        return (u - self.lows) / (self.highs - self.lows)
+
+    def from_unit(self, u):
+        """Maps a point of the unit cube to a dictionary of hyperparameters."""
+        v = self.lows + np.clip(u, 0.0, 1.0) * (self.highs - self.lows)
+        v[self.log] = 10.0**v[self.log]
+        return {name: float(value) for name, value in zip(self.names, v)}
+
+
+def matern52(a, b, length_scale):
+    """Matern 5/2 kernel matrix of the rows of a and b."""
+    sq = (np.sum(a**2, axis = 1)[:, None] + np.sum(b**2, axis = 1)[None, :]
+          - 2.0 * np.dot(a, b.T))
+    r = np.sqrt(5.0 * np.maximum(sq, 0.0)) / length_scale
+    return (1.0 + r + r**2 / 3.0) * np.exp(-r)
+
+
+class GaussianProcess(object):
+    """Gaussian process regression with a Matern 5/2 kernel on the unit cube.
+    The Cholesky factor of the kernel matrix is extended by a row for each
+    observation, which costs O(n^2) instead of the O(n^3) of a new
+    factorization, and the last observations can be removed (e.g. the
+    fantasized ones of a batch). The targets are standardized.
+
+    Attributes:
+        length_scale: A float, the length scale of the kernel.
+        noise: A float, the observation noise variance (of the standardized
+            targets).
+        x: A numpy array of the observed points, n x dims.
+        y: A numpy array of the observed targets.
+        chol: A numpy array, the lower Cholesky factor of the kernel matrix
+            of the observations with the noise.
+    """
+    def __init__(self, n_dims, length_scale = 0.25, noise = 1e-3):
+        self.length_scale = length_scale
+        self.noise = noise
+        self.x = np.zeros((0, n_dims))
+        self.y = np.zeros(0)
+        self.chol = np.zeros((0, 0))
+
+    def add(self, x, y):
+        """Adds an observation, and extends the Cholesky factor."""
+        x = np.asarray(x, dtype = np.float64).reshape(1, -1)
+        n = self.y.shape[0]
+        chol = np.zeros((n+1, n+1))
+        chol[:n, :n] = self.chol
+        if n > 0:
+            k = matern52(self.x, x, self.length_scale)[:, 0]
+            chol[n, :n] = solve_triangular(self.chol, k, lower = True)
+        chol[n, n] = np.sqrt(max(1.0 + self.noise - np.dot(chol[n, :n], chol[n, :n]), 1e-12))
+        self.chol = chol
+        self.x = np.concatenate([self.x, x], axis = 0)
+        self.y = np.append(self.y, float(y))
+
+    def pop(self, n = 1):
+        """Removes the last n observations. The leading block of a Cholesky
+        factor is the factor of the leading block of the matrix.
+        """
+        m = self.y.shape[0] - n
+        self.chol = self.chol[:m, :m]
+        self.x = self.x[:m]
+        self.y = self.y[:m]
+
+    def predict(self, x):
+        """Computes the posterior means and standard deviations of the rows
+        of x, vectorized over the points.
+        Returns:
+            A tuple of the numpy arrays of the means and the standard
+            deviations.
+        """
+        if self.y.shape[0] == 0:
+            return np.zeros(x.shape[0]), np.ones(x.shape[0])
+        mu = np.mean(self.y)
+        sigma = np.std(self.y)
+        if sigma <= 0.0:
+            sigma = 1.0
+        alpha = solve_triangular(
+                self.chol.T, solve_triangular(self.chol, (self.y - mu) / sigma, lower = True),
+                lower = False)
+        ks = matern52(x, self.x, self.length_scale)
+        v = solve_triangular(self.chol, ks.T, lower = True)
+        var = np.maximum(1.0 - np.sum(v**2, axis = 0), 1e-12)
+        return mu + sigma * np.dot(ks, alpha), sigma * np.sqrt(var)
+
+
+def expected_improvement(mean, std, best, xi = 0.01):
+    """Expected improvement over best of the points with normal posteriors."""
+    d = mean - best - xi
+    z = d / std
+    return d * ndtr(z) + std * np.exp(-0.5 * z**2) / np.sqrt(2.0 * np.pi)
+
+
+class BayesianOptimizer(object):
+    """Class of a Bayesian optimization maximizing a score on the unit cube,
+    with a Gaussian process and the expected improvement of random
+    candidates. Batches of points are suggested by the kriging believer
+    heuristic: the suggested (and the pending) points are added to the
+    Gaussian process with their predicted means, until the batch is done.
+
+    Attributes:
+        gp: The GaussianProcess of the observations.
+        n_init: An integer, the number of random points before the model is
+            used.
+        n_candidates: An integer, the number of random candidates scored for
+            a point.
+        chunk_size: An integer, the number of candidates scored at once.
+        xi: A float, the exploration margin of the expected improvement.
+        best: A float, the best observed score.
+        rng: A numpy RandomState.
+    """
+    def __init__(
+            self, n_dims,
+            n_init = 5,
+            n_candidates = 100000,
+            chunk_size = 10000,
+            length_scale = 0.25,
+            noise = 1e-3,
+            xi = 0.01,
+            seed = 42):
+        self.gp = GaussianProcess(n_dims, length_scale = length_scale, noise = noise)
+        self.n_init = n_init
+        self.n_candidates = n_candidates
+        self.chunk_size = chunk_size
+        self.xi = xi
+        self.best = -np.inf
+        self.rng = np.random.RandomState(seed)
+
+    def observe(self, u, score):
+        self.gp.add(u, score)
+        self.best = max(self.best, score)
+
+    def _maximize_ei(self):
+        n_dims = self.gp.x.shape[1]
+        best_u = None
+        best_ei = -np.inf
+        for start in range(0, self.n_candidates, self.chunk_size):
+            candidates = self.rng.rand(min(self.chunk_size, self.n_candidates - start), n_dims)
+            mean, std = self.gp.predict(candidates)
+            ei = expected_improvement(mean, std, self.best, self.xi)
+            i = np.argmax(ei)
+            if ei[i] > best_ei:
+                best_ei = ei[i]
+                best_u = candidates[i]
+        return best_u
+
+    def suggest(self, n = 1, pending = ()):
+        """Suggests a batch of points.
+        Args:
+            n: An integer, the number of points.
+            pending: A list of the points being evaluated.
+        Returns:
+            A list of numpy arrays, the points on the unit cube.
+        """
+        n_observed = self.gp.y.shape[0]
+        n_dims = self.gp.x.shape[1]
+        points = []
+        for u in pending:
+            self.gp.add(u, self.gp.predict(np.reshape(u, (1, -1)))[0][0])
+        for _ in range(n):
+            if (n_observed == 0) or (n_observed + len(pending) + len(points) < self.n_init):
+                u = self.rng.rand(n_dims)
+            else:
+                u = self._maximize_ei()
+            points.append(u)
+            self.gp.add(u, self.gp.predict(np.reshape(u, (1, -1)))[0][0])
+        self.gp.pop(len(pending) + len(points))
+        return points
+
+
+def _load_records(path):
+    records = []
+    if (path is None) or not os.path.isfile(path):
+        return records
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                records.append(json.loads(line))
+    return records
+
+
+def _append_record(path, record):
+    with open(path, "a") as f:
+        f.write(json.dumps(record, sort_keys = True) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def load_results(path):
+    """Loads the results of a search written by bayesian_search.
+    Returns:
+        A list of tuples of the hyperparameters (a dictionary) and the score.
+    """
+    return [(record["params"], record["score"]) for record in _load_records(path)]
+
+
+def _init_worker(core_sets, n_threads):
+    # each worker takes a set of cores, the thread pools of TensorFlow are
+    # sized by the cores the process may run on
+    cores = core_sets.get()
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    os.environ["OMP_NUM_THREADS"] = str(n_threads)
+
+
+def _worker_pool(n_workers, threads_per_worker):
+    """Creates a pool of spawned worker processes, each pinned to its own
+    threads_per_worker cores.
+    """
+    context = multiprocessing.get_context("spawn")
+    cores = list(range(os.cpu_count()))
+    if hasattr(os, "sched_getaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+    core_sets = context.Queue()
+    for i in range(n_workers):
+        core_sets.put(cores[i*threads_per_worker:(i+1)*threads_per_worker])
+    return ProcessPoolExecutor(
+            max_workers = n_workers, mp_context = context,
+            initializer = _init_worker, initargs = (core_sets, threads_per_worker))
+
+
+def bayesian_search(
+        objective, params,
+        n_iters = 30,
+        n_workers = 1,
+        threads_per_worker = 4,
+        results_path = None,
+        n_init = 5,
+        n_candidates = 100000,
+        seed = 42):
+    """Maximizes an objective by Bayesian optimization, evaluated in
+    n_workers parallel worker processes, each pinned to threads_per_worker
+    cores of its own. The search is asynchronous: whenever an evaluation
+    finishes, a new point is suggested with the running ones as pending.
+    If results_path is given, each result is appended there, and a search
+    with the same path is resumed from the finished evaluations, only the
+    remaining ones of the n_iters are run.
+    Args:
+        objective: A picklable function of a dictionary of hyperparameters
+            returning the score, e.g. an EvalNetObjective.
+        params: A list of tuples (name, low, high) or (name, low, high,
+            "log"), the ranges of the hyperparameters.
+        n_iters: An integer, the number of evaluations.
+        n_workers: An integer, the number of worker processes.
+        threads_per_worker: An integer, the number of cores per worker.
+        results_path: A path of a JSON lines file of the results, or None.
+        n_init: An integer, the number of random points.
+        n_candidates: An integer, the number of random candidates scored for
+            a point.
+        seed: An integer, the seed of the candidates.
+    Returns:
+        A tuple of the best hyperparameters and the list of the results, i.e.
+        tuples of the hyperparameters (dictionaries) and the scores.
+    """
+    space = SearchSpace(params)
+    results = load_results(results_path)
+    optimizer = BayesianOptimizer(
+            len(space.names), n_init = n_init, n_candidates = n_candidates,
+            seed = seed + len(results))
+    for values, score in results:
+        optimizer.observe(space.to_unit(values), score)
+    if results:
+        print("Resumed with evaluations: ", len(results))
+
+    pending = dict()
+    n_submitted = len(results)
+    with _worker_pool(n_workers, threads_per_worker) as executor:
+        while (n_submitted < n_iters) or pending:
+            n_new = min(n_workers - len(pending), n_iters - n_submitted)
+            if n_new > 0:
+                for u in optimizer.suggest(n_new, pending = list(pending.values())):
+                    pending[executor.submit(objective, space.from_unit(u))] = u
+                n_submitted = n_submitted + n_new
+            done, _ = wait(list(pending), return_when = FIRST_COMPLETED)
+            for future in done:
+                u = pending.pop(future)
+                values = space.from_unit(u)
+                score = float(future.result())
+                optimizer.observe(u, score)
+                results.append((values, score))
+                if results_path is not None:
+                    _append_record(results_path, {'params': values, 'score': score})
+                print("Evaluation: ", len(results), "params: ", values, "score: ", score)
+
+    best = max(results, key = lambda r: r[1])[0] if results else None
+    return best, results
+
+
+def _run_rung(executor, objective, configs, n_epochs, run_dir, finished, results_path):
+    """Trains configurations for n_epochs each, resumed from their checkpoints,
+    and returns their scores. Finished evaluations are not repeated.
+    """
+    futures = dict()
+    for config_id, values in configs:
+        if (config_id, n_epochs) not in finished:
+            futures[config_id] = executor.submit(
+                    objective, values, n_epochs, os.path.join(run_dir, config_id))
+    for config_id, values in configs:
+        if config_id not in futures:
+            continue
+        score = float(futures[config_id].result())
+        finished[(config_id, n_epochs)] = score
+        _append_record(results_path, {'config': config_id, 'params': values,
+                                      'epochs': n_epochs, 'score': score})
+        print("Config: ", config_id, "epochs: ", n_epochs, "params: ", values, "score: ", score)
+    return [finished[(config_id, n_epochs)] for config_id, _ in configs]
+
+
+# Li et al., Hyperband: A Novel Bandit-Based Approach to Hyperparameter
+# Optimization
+# https://arxiv.org/abs/1603.06560
+def hyperband(
+        objective, params, run_dir,
+        max_epochs = 81,
+        min_epochs = 1,
+        eta = 3,
+        n_brackets = None,
+        n_workers = 1,
+        threads_per_worker = 4,
+        seed = 42):
+    """Searches hyperparameters by Hyperband with the epochs as the resource.
+    Each bracket runs successive halving: random configurations are trained
+    for a few epochs and ranked by their scores, the best 1/eta of them are
+    resumed from their checkpoints for eta times more epochs, and so on up to
+    max_epochs. The brackets start with fewer configurations and more epochs
+    each. The evaluations of a rung run in n_workers worker processes, each
+    pinned to threads_per_worker cores. The results are appended to
+    results.jsonl in run_dir, and a search with the same run_dir skips the
+    finished evaluations, so an interrupted search is resumed.
+    Args:
+        objective: A picklable function of a dictionary of hyperparameters,
+            the number of epochs and the checkpoint folder of the run, which
+            returns the score, e.g. an EvalNetObjective. The learning rate
+            schedule should be the one of max_epochs, so the shorter runs are
+            the beginnings of the full ones.
+        params: A list of tuples (name, low, high) or (name, low, high,
+            "log"), the ranges of the hyperparameters.
+        run_dir: The folder of the checkpoints and the results.
+        max_epochs: An integer, the maximal epochs of a configuration.
+        min_epochs: An integer, the minimal epochs of a configuration.
+        eta: An integer, the fraction of the configurations kept per rung.
+        n_brackets: An integer, the number of brackets run, from the one with
+            the most configurations. If None, all brackets are run.
+        n_workers: An integer, the number of worker processes.
+        threads_per_worker: An integer, the number of cores per worker.
+        seed: An integer, the seed of the configurations.
+    Returns:
+        A tuple of the best hyperparameters (of the longest trained ones) and
+        the list of the results, i.e. dictionaries of the config id, the
+        params, the epochs and the score.
+    """
+    if not os.path.isdir(run_dir):
+        os.makedirs(run_dir)
+    results_path = os.path.join(run_dir, "results.jsonl")
+    finished = {(r['config'], r['epochs']): r['score'] for r in _load_records(results_path)}
+    if finished:
+        print("Resumed with evaluations: ", len(finished))
+
+    space = SearchSpace(params)
+    rng = np.random.RandomState(seed)
+    s_max = int(np.floor(np.log(max_epochs / float(min_epochs)) / np.log(eta) + 1e-9))
+    brackets = list(range(s_max, -1, -1))
+    if n_brackets is not None:
+        brackets = brackets[:n_brackets]
+
+    n_epochs_total = 0
+    n_epochs_full = 0
+    with _worker_pool(n_workers, threads_per_worker) as executor:
+        for s in brackets:
+            n = int(np.ceil((s_max+1) / float(s+1) * eta**s))
+            configs = [("bracket" + str(s) + "_" + str(i), space.from_unit(rng.rand(len(space.names))))
+                       for i in range(n)]
+            n_epochs_full = n_epochs_full + n*max_epochs
+            done_epochs = 0
+            for i in range(s+1):
+                n_epochs = max(int(round(max_epochs * float(eta)**(i-s))), 1)
+                scores = _run_rung(executor, objective, configs, n_epochs, run_dir,
+                                   finished, results_path)
+                n_epochs_total = n_epochs_total + len(configs)*(n_epochs - done_epochs)
+                done_epochs = n_epochs
+                n_keep = max(int(n * float(eta)**(-i-1)), 1)
+                order = np.argsort(scores)[::-1][:n_keep]
+                configs = [configs[j] for j in order]
+    print("Epochs trained: ", n_epochs_total, "epochs of full trainings: ", n_epochs_full)
+
+    results = [r for r in _load_records(results_path)
+               if (r['config'], r['epochs']) in finished]
+    best = None
+    if results:
+        best = max(results, key = lambda r: (r['epochs'], r['score']))['params']
+    return best, results
+
+
+# the datasets loaded in a worker process, by loader function
+_data_cache = dict()
+
+
+class EvalNetObjective(object):
+    """Class of a search objective, which trains a network by
+    eval_net_custom and returns the mean final test accuracy. The data is
+    loaded once per worker process. The epochs and the checkpoint folder
+    of the arguments can be overridden per call, e.g. by hyperband.
+
+    Attributes:
+        load_data: A picklable function returning the tuple tr_x, tr_y,
+            te_x, te_y, e.g. load_cifar10_data.
+        make_args: A picklable function of a dictionary of hyperparameters
+            returning the keyword arguments of eval_net_custom, e.g.
+            net_func, optimizer, n_epochs, batch_size, lr_decay_func.
+    """
+    def __init__(self, load_data, make_args):
+        self.load_data = load_data
+        self.make_args = make_args
+
+    def __call__(self, params, n_epochs = None, run_dir = None):
+        if self.load_data not in _data_cache:
+            _data_cache[self.load_data] = self.load_data()
+        tr_x, tr_y, te_x, te_y = _data_cache[self.load_data]
+        args = self.make_args(params)
+        if n_epochs is not None:
+            args['n_epochs'] = n_epochs
+        if run_dir is not None:
+            args['run_dir'] = run_dir
+        mean_acc, _, _ = eval_net_custom(tr_x, tr_y, te_x, te_y, **args)
+        return float(mean_acc)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import tensorflow as tf
+from util.batch import batch_generator
+from util.dataset import run_until_end
+
+
+class StreamingAccuracy(object):
+    """Class to accumulate the classification accuracy over batches in the
+    graph. Each batch is a single session call of the update operation, and
+    the accuracy is weighted by the number of items, so smaller last batches
+    are counted correctly.
+
+    Attributes:
+        accuracy: A tensor representing the accumulated accuracy.
+        update_op: An operation to accumulate a batch.
+        reset_op: An operation to reset the accumulators.
+
+    """
+    def __init__(self, logit, gt, name = "streaming_accuracy"):
+        with tf.variable_scope(name) as scope:
+            self.accuracy, self.update_op = tf.metrics.accuracy(
+                    labels = tf.argmax(gt, 1),
+                    predictions = tf.argmax(logit, 1))
+            local_vars = tf.get_collection(
+                    tf.GraphKeys.LOCAL_VARIABLES, scope = scope.name)
+        self.reset_op = tf.variables_initializer(local_vars)
+
+    def evaluate(self, session, x, gt, xs, ys,
+                 batch_size = 1024, indices = None, feed_dict = None):
+        """Computes the accuracy on arrays fed through placeholders.
+        Args:
+            session: A TensorFlow session.
+            x: The input placeholder.
+            gt: The label placeholder.
+            xs: An array-like representing the inputs.
+            ys: An array representing the one-hot labels.
+            batch_size: An integer representing the inference batch size.
+            indices: An optional array of indices to evaluate only a subset.
+            feed_dict: An optional dictionary of additional feeds.
+        Returns:
+            The accuracy.
+        """
+        feed = dict(feed_dict or {})
+        session.run(self.reset_op)
+        if indices is None:
+            batches = batch_generator(batch_size, xs, ys, fixed_size = False)
+        else:
+            batches = ((xs[idx], ys[idx]) for idx in
+                       batch_generator(batch_size, indices, fixed_size = False))
+        for (xb, yb) in batches:
+            feed.update({x: xb, gt: yb})
+            session.run(self.update_op, feed_dict = feed)
+        return session.run(self.accuracy)
+
+    def evaluate_iterator(self, session, init_op, feed_dict = None):
+        """Computes the accuracy on a dataset iterator.
+        Args:
+            session: A TensorFlow session.
+            init_op: The operation to initialize the iterator.
+            feed_dict: An optional dictionary of additional feeds.
+        Returns:
+            The accuracy.
+        """
+        session.run([self.reset_op, init_op])
+        for _ in run_until_end(session, self.update_op, feed_dict = feed_dict):
+            pass
+        return session.run(self.accuracy)
+
+
+def is_eval_epoch(epoch, n_epochs, eval_every = 1):
+    """Checks whether evaluation is scheduled after an epoch. The last epoch is
+    always evaluated.
+    """
+    return ((epoch+1) % eval_every == 0) or (epoch == n_epochs-1)
+
+
+def eval_subset(n_data, size, seed = 42):
+    """Selects a fixed random subset for estimating the accuracy.
+    Returns:
+        A sorted array of indices, or None if the full set is used.
+    """
+    if (size is None) or (size >= n_data):
+        return None
+    return np.sort(np.random.RandomState(seed).choice(n_data, size, replace = False))
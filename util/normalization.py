@@ -1,8 +1,12 @@
 #!/usr/bin/env python2
 # -*- coding: utf-8 -*-
 
+import os
+import hashlib
+import tempfile
 import numpy as np
 import scipy as sp
+from util.storage import ScaledImages
 
 
 def global_mean(tr, te = None):
@@ -119,3 +123,398 @@ def ZCA_whitening2(tr, te = None, is_centered = False, eps = 1e-5):
     else:
         return tr
 
+
+
+class Normalizer(object):
+    """Class to fit normalization statistics on a training set once, and apply
+    them on any data, e.g. in place or per batch.
+
+    The statistics are accumulated over chunks of the training set (Chan et al.
+    parallel variant of Welford's algorithm), so no full-size float copies are
+    made. The fitted statistics can be cached on disk, keyed by the mode (and
+    zca_eps for ZCA whitening) and a hash of the dataset, and are loaded
+    instead of refitting on the next run.
+
+    Attributes:
+        mode: A string representing the statistics, "global", "channel" or
+            "pixel" mean and std dev, or "zca" for ZCA whitening. The channels
+            are expected to be the last axis.
+        use_std: A boolean, if False only the mean is subtracted.
+        eps: A number added to the std dev.
+        zca_eps: A number representing the lower bound of the eigenvalues in
+            ZCA whitening.
+        chunk_size: An integer representing the number of items processed at
+            once.
+        cache_folder: An optional string representing the folder of the cache
+            files.
+        mean: A numpy array representing the mean.
+        std: A numpy array representing the std dev.
+        zca_matrix: A numpy array representing the ZCA whitening matrix.
+
+    """
+    def __init__(self, mode = "pixel",
+                       use_std = True,
+                       eps = 1e-7,
+                       zca_eps = 1e-5,
+                       chunk_size = 1000,
+                       cache_folder = None):
+        if mode not in ("global", "channel", "pixel", "zca"):
+            raise ValueError("Unknown normalization mode: " + str(mode))
+        self.mode = mode
+        self.use_std = use_std
+        self.eps = eps
+        self.zca_eps = zca_eps
+        self.chunk_size = chunk_size
+        self.cache_folder = cache_folder
+        self.mean = None
+        self.std = None
+        self.zca_matrix = None
+
+    def _chunks(self, x):
+        for i in range(0, len(x), self.chunk_size):
+            yield np.array(x[i:i+self.chunk_size], dtype = np.float64)
+
+    def dataset_hash(self, x):
+        """Computes a hash of the dataset from its shape, type, and an evenly
+        spaced sample of at most 1000 items.
+        Args:
+            x: An array-like dataset.
+        Returns:
+            A hexadecimal string.
+        """
+        h = hashlib.sha1()
+        h.update(str((tuple(x.shape), str(x.dtype))).encode("utf-8"))
+        for i in np.linspace(0, len(x)-1, num = min(len(x), 1000)).astype(int):
+            h.update(np.ascontiguousarray(x[i]).tobytes())
+        return h.hexdigest()
+
+    def _cache_path(self, x):
+        mode = self.mode
+        if mode == "zca":
+            mode += "_" + repr(self.zca_eps)
+        name = "normalizer_" + mode + "_" + self.dataset_hash(x) + ".npz"
+        return os.path.join(self.cache_folder, name)
+
+    def _reduce_axes(self, ndim):
+        if self.mode == "global":
+            return tuple(range(ndim))
+        if self.mode == "channel":
+            return tuple(range(ndim-1))
+        return (0,)
+
+    def fit(self, x):
+        """Computes the statistics of the training set, or loads them from the
+        cache.
+        Args:
+            x: An array-like training set, e.g. a numpy array, memmap or
+                util.storage.ScaledImages.
+        Returns:
+            The normalizer itself.
+        """
+        path = None
+        if self.cache_folder is not None:
+            path = self._cache_path(x)
+            if os.path.isfile(path):
+                with np.load(path) as stats:
+                    self.mean = stats['mean']
+                    self.std = stats['std']
+                    self.zca_matrix = stats['zca_matrix'] if self.mode == "zca" else None
+                return self
+        if self.mode == "zca":
+            self._fit_zca(x)
+        else:
+            self._fit_moments(x)
+        if path is not None:
+            self._save(path)
+        return self
+
+    def _save(self, path):
+        # writes a temporary file and renames it, so concurrent processes
+        # never load a partially written cache file
+        if not os.path.isdir(self.cache_folder):
+            os.makedirs(self.cache_folder, exist_ok = True)
+        fd, tmp_path = tempfile.mkstemp(suffix = ".npz", dir = self.cache_folder)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, mean = self.mean, std = self.std,
+                         zca_matrix = self.zca_matrix if self.zca_matrix is not None else np.zeros(0))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def _fit_moments(self, x):
+        axes = self._reduce_axes(len(x.shape))
+        n = 0
+        mean = 0.0
+        m2 = 0.0
+        for xc in self._chunks(x):
+            mean_b = np.mean(xc, axis = axes)
+            n_b = xc.size // np.size(mean_b)
+            m2_b = np.sum((xc-mean_b)**2, axis = axes)
+            n_ab = n + n_b
+            delta = mean_b - mean
+            mean = mean + delta*(float(n_b)/n_ab)
+            m2 = m2 + m2_b + delta**2*(float(n)*n_b/n_ab)
+            n = n_ab
+        self.mean = np.asarray(mean)
+        self.std = np.sqrt(np.asarray(m2)/n)
+
+    def _fit_zca(self, x):
+        zca = ZCAWhitening(eps = self.zca_eps, chunk_size = self.chunk_size).fit(x)
+        self.mean = zca.mean
+        self.std = np.ones(0)
+        self.zca_matrix = zca.zca_matrix
+
+    def __call__(self, x):
+        return self.apply(x)
+
+    def apply(self, x, in_place = False):
+        """Normalizes data with the fitted statistics.
+        Args:
+            x: A numpy array, e.g. a batch, or util.storage.ScaledImages.
+            in_place: A boolean, if True x is overwritten chunk by chunk, and
+                keeps its type, otherwise a new float32 array is returned.
+        Returns:
+            A numpy array, or ScaledImages of the same stored images, which
+            apply the normalization on the requested batches.
+        """
+        if isinstance(x, ScaledImages):
+            normalize = self
+            if x.normalize is not None:
+                normalize = lambda xb: self.apply(x.normalize(xb))
+            return ScaledImages(x.data, scale = x.scale, normalize = normalize)
+        if not in_place:
+            out = np.empty(x.shape, dtype = np.float32)
+        else:
+            out = x
+        for i in range(0, len(x), self.chunk_size):
+            xc = np.array(x[i:i+self.chunk_size], dtype = np.float64)
+            if self.mode == "zca":
+                shape = xc.shape
+                xc = np.dot(xc.reshape((len(xc), -1)) - self.mean, self.zca_matrix)
+                xc = xc.reshape(shape)
+            else:
+                xc -= self.mean
+                if self.use_std:
+                    xc /= (self.std+self.eps)
+            out[i:i+self.chunk_size] = xc
+        return out
+
+    def fit_transform(self, tr, te = None, in_place = False):
+        """Fits the statistics on the training set, and normalizes the training
+        and the optional test sets, like the functions of this module do.
+        Returns:
+            The normalized training set, or a tuple of the normalized training
+            and test sets.
+        """
+        self.fit(tr)
+        tr = self.apply(tr, in_place = in_place)
+        if te is not None:
+            te = self.apply(te, in_place = in_place)
+            return (tr, te)
+        else:
+            return tr
+
+
+def _extract_patches(x, patch_size, n_patches, random_state):
+    """Extracts random patches from NHWC images.
+    Returns:
+        A 2D numpy array of shape (n_patches, patch_size*patch_size*C).
+    """
+    n, h, w = x.shape[:3]
+    idx = random_state.randint(0, n, n_patches)
+    ys = random_state.randint(0, h-patch_size+1, n_patches)
+    xs = random_state.randint(0, w-patch_size+1, n_patches)
+    order = np.argsort(idx, kind = "mergesort") # sequential reads on memmaps
+    patches = np.empty((n_patches, patch_size, patch_size, x.shape[3]), dtype = np.float64)
+    for i in order:
+        img = np.asarray(x[idx[i]], dtype = np.float64)
+        patches[i] = img[ys[i]:ys[i]+patch_size, xs[i]:xs[i]+patch_size]
+    return patches.reshape((n_patches, -1))
+
+
+class ZCAWhitening(object):
+    """Class to fit ZCA whitening in bounded memory, and apply it batch by batch
+    in float32.
+
+    The data is only streamed in chunks. With the "covariance" method the full
+    covariance matrix is accumulated and decomposed. With the "randomized"
+    method the top components are found by randomized subspace iteration
+    (Halko et al., Finding structure with randomness, 2011), where each
+    covariance product is one pass over the data, so the covariance matrix is
+    never formed. If only the top components are kept, the remaining subspace
+    is scaled by the average of the remaining eigenvalues, so it is not
+    discarded. In patch-wise mode the whitening is learned on random patches,
+    and applied as a convolution with the filters of the patch centers.
+
+    Attributes:
+        n_components: An optional integer representing the number of top
+            components, all of them are used if None.
+        method: A string, "covariance" or "randomized".
+        patch_size: An optional integer representing the size of the patches
+            for patch-wise whitening of NHWC images.
+        n_patches: An integer representing the number of sampled patches.
+        eps: A number representing the lower bound of the eigenvalues.
+        n_oversamples: An integer representing the extra dimensions of the
+            randomized subspace.
+        n_iter: An integer representing the number of power iterations.
+        chunk_size: An integer representing the number of items processed at
+            once.
+        seed: An integer representing the random seed.
+        mean: A numpy array representing the mean of the features.
+        zca_matrix: A numpy array representing the whitening matrix, or the
+            convolution kernel in patch-wise mode.
+
+    """
+    def __init__(self, n_components = None,
+                       method = "covariance",
+                       patch_size = None,
+                       n_patches = 100000,
+                       eps = 1e-5,
+                       n_oversamples = 10,
+                       n_iter = 2,
+                       chunk_size = 1000,
+                       seed = 42):
+        if method not in ("covariance", "randomized"):
+            raise ValueError("Unknown ZCA method: " + str(method))
+        if (method == "randomized") and (n_components is None):
+            raise ValueError("Randomized ZCA requires n_components.")
+        self.n_components = n_components
+        self.method = method
+        self.patch_size = patch_size
+        self.n_patches = n_patches
+        self.eps = eps
+        self.n_oversamples = n_oversamples
+        self.n_iter = n_iter
+        self.chunk_size = chunk_size
+        self.seed = seed
+        self.mean = None
+        self.zca_matrix = None
+
+    def _chunks(self, x):
+        for i in range(0, len(x), self.chunk_size):
+            xc = np.array(x[i:i+self.chunk_size], dtype = np.float64)
+            yield xc.reshape((len(xc), -1))
+
+    def _moments(self, x):
+        """Computes the mean and the total variance in one pass."""
+        n = 0
+        mean = 0.0
+        m2 = 0.0
+        for xc in self._chunks(x):
+            n_b = len(xc)
+            mean_b = xc.mean(axis = 0)
+            m2_b = np.sum((xc-mean_b)**2, axis = 0)
+            n_ab = n + n_b
+            delta = mean_b - mean
+            mean = mean + delta*(float(n_b)/n_ab)
+            m2 = m2 + m2_b + delta**2*(float(n)*n_b/n_ab)
+            n = n_ab
+        return n, mean, np.sum(m2)/(n-1)
+
+    def _covariance(self, x, n, mean):
+        cov = 0.0
+        for xc in self._chunks(x):
+            xc -= mean
+            cov = cov + np.dot(xc.T, xc)
+        return cov/(n-1)
+
+    def _cov_product(self, x, n, mean, Q):
+        """Computes cov*Q in one pass over the data."""
+        Y = np.zeros_like(Q)
+        for xc in self._chunks(x):
+            xc -= mean
+            Y += np.dot(xc.T, np.dot(xc, Q))
+        return Y/(n-1)
+
+    def _top_components(self, x, n, mean):
+        """Finds the top eigenvalues and eigenvectors of the covariance."""
+        dims = len(mean)
+        if self.method == "covariance":
+            S, U = np.linalg.eigh(self._covariance(x, n, mean))
+        else:
+            rs = np.random.RandomState(self.seed)
+            k = min(dims, self.n_components + self.n_oversamples)
+            Q = rs.normal(size = (dims, k))
+            for _ in range(self.n_iter + 1):
+                Q, _ = np.linalg.qr(self._cov_product(x, n, mean, Q))
+            B = np.dot(Q.T, self._cov_product(x, n, mean, Q))
+            S, V = np.linalg.eigh(0.5*(B+B.T))
+            U = np.dot(Q, V)
+        order = np.argsort(S)[::-1]
+        S = S[order]
+        U = U[:, order]
+        if self.n_components is not None:
+            S = S[:self.n_components]
+            U = U[:, :self.n_components]
+        return S, U
+
+    def fit(self, x):
+        """Fits the whitening on the training set.
+        Args:
+            x: An array-like training set, e.g. a numpy array, memmap or
+                util.storage.ScaledImages.
+        Returns:
+            The whitening itself.
+        """
+        if self.patch_size is not None:
+            rs = np.random.RandomState(self.seed)
+            x = _extract_patches(x, self.patch_size, self.n_patches, rs)
+        n, mean, total_var = self._moments(x)
+        S, U = self._top_components(x, n, mean)
+        dims = len(mean)
+        s = np.sqrt(S.clip(self.eps))
+        W = np.dot(U * (1.0/s), U.T)
+        if len(S) < dims:
+            # the remaining subspace is scaled by its average variance
+            rest_var = max((total_var - np.sum(S))/(dims-len(S)), self.eps)
+            rest = 1.0/np.sqrt(rest_var)
+            W += rest*(np.identity(dims) - np.dot(U, U.T))
+        self.mean = mean.astype(np.float32)
+        if self.patch_size is None:
+            self.zca_matrix = W.astype(np.float32)
+        else:
+            # filters of the patch center, [dy, dx, in_channel, out_channel]
+            p = self.patch_size
+            n_chans = dims // (p*p)
+            W = W.reshape((p, p, n_chans, p, p, n_chans))
+            self.zca_matrix = W[:, :, :, p//2, p//2, :].astype(np.float32)
+            self.mean = self.mean.reshape((p, p, n_chans))
+        return self
+
+    def _apply_patches(self, x):
+        p = self.patch_size
+        lo = p//2
+        hi = p-1-lo
+        xp = np.pad(x, ((0,0), (lo,hi), (lo,hi), (0,0)), mode = "reflect")
+        h, w = x.shape[1:3]
+        out = np.zeros(x.shape, dtype = np.float32)
+        offset = np.zeros(x.shape[3], dtype = np.float32)
+        for dy in range(p):
+            for dx in range(p):
+                K = self.zca_matrix[dy, dx]
+                out += np.dot(xp[:, dy:dy+h, dx:dx+w, :], K)
+                offset += np.dot(self.mean[dy, dx], K)
+        return out - offset
+
+    def __call__(self, x):
+        return self.apply(x)
+
+    def apply(self, x):
+        """Whitens data chunk by chunk in float32.
+        Args:
+            x: An array-like of inputs, e.g. a batch.
+        Returns:
+            A float32 numpy array of the same shape.
+        """
+        out = np.empty(x.shape, dtype = np.float32)
+        for i in range(0, len(x), self.chunk_size):
+            xc = np.array(x[i:i+self.chunk_size], dtype = np.float32)
+            if self.patch_size is None:
+                shape = xc.shape
+                xc = np.dot(xc.reshape((len(xc), -1)) - self.mean, self.zca_matrix)
+                out[i:i+self.chunk_size] = xc.reshape(shape)
+            else:
+                out[i:i+self.chunk_size] = self._apply_patches(xc)
+        return out
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import numpy as np
+import tensorflow as tf
+from util.misc import tuple_list_find
+
+# the outputs of the builders, concatenated over the towers
+_OUTPUTS = ("logit", "prob", "aux_logit", "aux_prob")
+# the offset of the seed of each tower, so the towers draw different dropout
+# masks
+_SEED_OFFSET = 1000
+
+
+def split_batch(inputs, n_shards, name = "split_batch"):
+    """Splits a batch into n_shards parts, whose sizes differ by at most one."""
+    with tf.name_scope(name):
+        n = tf.shape(inputs)[0]
+        sizes = (n + tf.range(n_shards)) // n_shards
+        return tf.split(inputs, sizes, num = n_shards)
+
+
+def with_towers(net_func, n_towers, devices = None):
+    """Wraps a network builder to build data-parallel replicas (towers) of
+    the network, each on a shard of the batch and on its own device. The
+    towers share the variables. The first one is built as a single network,
+    so its op names do not change, and the others in the name scopes
+    tower_1, tower_2, ... The training placeholders of the other towers are
+    replaced by the one of the first, and only the batch normalization
+    updates of the first tower are kept, so the moving statistics are
+    updated once per step. If the builder is called with a seed, it is
+    offset by the index of the tower, so the random ops of the towers (e.g.
+    dropout) differ. As the outputs are concatenated in the order of the
+    batch, a loss averaged over the batch averages the gradients of the
+    towers.
+    Args:
+        net_func: A function building the network, e.g. a builder of the
+            *_graph modules.
+        n_towers: An integer, the number of towers.
+        devices: A list of the devices of the towers, if None the CPU
+            devices of tower_config.
+    Returns:
+        A function with the arguments of net_func, which returns the layers
+        and the variables of the first tower, with the outputs (logit, prob,
+        aux_logit, aux_prob) of all towers.
+    """
+    if n_towers == 1:
+        return net_func
+    if devices is None:
+        devices = ["/cpu:" + str(i) for i in range(n_towers)]
+
+    def build(x, *args, **kwargs):
+        update_ops = tf.get_collection_ref(tf.GraphKeys.UPDATE_OPS)
+        towers = []
+        for i, shard in enumerate(split_batch(x, n_towers)):
+            if i == 0:
+                with tf.device(devices[i]):
+                    towers.append(net_func(shard, *args, **kwargs))
+                continue
+            tower_kwargs = kwargs
+            if "seed" in kwargs:
+                tower_kwargs = dict(kwargs, seed = kwargs['seed'] + _SEED_OFFSET*i)
+            n_updates = len(update_ops)
+            with tf.variable_scope(tf.get_variable_scope(), reuse = True):
+                with tf.name_scope("tower_" + str(i)), tf.device(devices[i]):
+                    towers.append(net_func(shard, *args, **tower_kwargs))
+            del update_ops[n_updates:]
+
+        layers, variables = towers[0]
+        training = tuple_list_find(variables, "training")[1]
+        for _, tower_variables in towers[1:]:
+            tf.contrib.graph_editor.reroute_ts(
+                    [training], [tuple_list_find(tower_variables, "training")[1]])
+
+        outputs = dict()
+        for name in _OUTPUTS:
+            if tuple_list_find(layers, name) is not None:
+                outputs[name] = tf.concat(
+                        [tuple_list_find(tower_layers, name)[1] for tower_layers, _ in towers],
+                        axis = 0, name = name + "_towers")
+        layers = [(name, outputs.get(name, t)) for name, t in layers]
+        return layers, variables
+    return build
+
+
+def tower_config(n_towers, threads_per_tower = None):
+    """Creates the session configuration for the towers on a multicore host:
+    a CPU device per tower, and an inter-op thread per tower, so the ops of
+    the towers run concurrently. TensorFlow shares the intra-op threads of
+    the CPU devices. If threads_per_tower is given, the process is pinned to
+    n_towers*threads_per_tower of its cores, and each op uses that many
+    threads.
+    Returns:
+        A tf.ConfigProto.
+    """
+    n_threads = 0
+    if threads_per_tower is not None:
+        n_threads = n_towers * threads_per_tower
+        if hasattr(os, "sched_setaffinity"):
+            cores = sorted(os.sched_getaffinity(0))[:n_threads]
+            os.sched_setaffinity(0, cores)
+    return tf.ConfigProto(
+            device_count = {'CPU': n_towers},
+            inter_op_parallelism_threads = n_towers,
+            intra_op_parallelism_threads = n_threads)
+
+
+def lr_factor(policy, n_towers):
+    """Returns the factor of the learning rate of n_towers workers, relative
+    to a single one with the same batch size per worker.
+    Args:
+        policy: "linear" (Goyal et al., Accurate, Large Minibatch SGD),
+            "sqrt" (Krizhevsky, One weird trick), None for no scaling, or a
+            function of the number of towers.
+        n_towers: An integer, the number of towers.
+    Returns:
+        A float.
+    """
+    if policy is None:
+        return 1.0
+    if callable(policy):
+        return float(policy(n_towers))
+    if policy == "linear":
+        return float(n_towers)
+    if policy == "sqrt":
+        return float(np.sqrt(n_towers))
+    raise ValueError("Unknown learning rate scaling: " + str(policy))
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import tensorflow as tf
+from tensorflow.python.client import timeline
+
+# prefixes of the backpropagation and the optimizer ops
+_GRADIENT_PREFIX = "gradients/"
+_UPDATE_PREFIX = "update_"
+
+
+def _op_scope(op_name):
+    """Returns the name of the forward op an op belongs to, i.e. gradient ops
+    are attributed to the scope of their forward op, and optimizer updates to
+    the scope of their variable.
+    """
+    if op_name.startswith(_GRADIENT_PREFIX):
+        op_name = op_name[len(_GRADIENT_PREFIX):]
+    parts = op_name.split("/")
+    if (len(parts) > 1) and parts[1].startswith(_UPDATE_PREFIX):
+        # e.g. Momentum/update_residual_1/conv2d/weight/ApplyMomentum
+        parts = [parts[1][len(_UPDATE_PREFIX):]] + parts[2:]
+    return parts
+
+
+class StepProfiler(object):
+    """Class to profile sampled session calls of a training loop. The op times
+    and memory of the sampled steps are collected from the step stats of
+    RunMetadata, and attributed to the named layers of a builder and to the
+    variable scopes.
+
+    Attributes:
+        every: An integer, every n-th step is sampled.
+        skip: An integer representing the number of warmup steps not sampled.
+        max_samples: An integer representing the maximal number of samples.
+        step: An integer representing the number of steps run.
+        n_samples: An integer representing the number of sampled steps.
+        op_stats: A dictionary of op names and lists of the total time in
+            microseconds and the total allocated bytes of the sampled steps.
+
+    """
+    def __init__(self, layers = None, every = 100, skip = 10, max_samples = 20):
+        """
+        Args:
+            layers: An optional list of tuples of layer names and tensors
+                returned by a builder. The ops are attributed to the layers by
+                the top level scope of the layer tensors.
+            every: An integer, every n-th step is sampled.
+            skip: An integer representing the number of warmup steps not
+                sampled.
+            max_samples: An integer representing the maximal number of
+                samples.
+        """
+        self.every = every
+        self.skip = skip
+        self.max_samples = max_samples
+        self.step = 0
+        self.n_samples = 0
+        self.op_stats = dict()
+        self._layer_scopes = dict()
+        if layers is not None:
+            for name, tensor in layers:
+                self._layer_scopes.setdefault(tensor.op.name.split("/")[0], name)
+        self._options = tf.RunOptions(trace_level = tf.RunOptions.FULL_TRACE)
+        self._last_metadata = None
+
+    def is_sampled(self):
+        """Checks whether the next step is sampled."""
+        return (self.n_samples < self.max_samples) and \
+               (self.step >= self.skip) and \
+               ((self.step - self.skip) % self.every == 0)
+
+    def run(self, session, fetches, feed_dict = None):
+        """Runs a step as session.run, and traces it if sampled."""
+        if not self.is_sampled():
+            self.step = self.step + 1
+            return session.run(fetches, feed_dict = feed_dict)
+        metadata = tf.RunMetadata()
+        result = session.run(fetches, feed_dict = feed_dict,
+                             options = self._options,
+                             run_metadata = metadata)
+        self._collect(metadata)
+        self._last_metadata = metadata
+        self.step = self.step + 1
+        self.n_samples = self.n_samples + 1
+        return result
+
+    def wrap(self, session):
+        """Returns an object with the run method of a session, which profiles
+        the sampled steps.
+        """
+        return _ProfiledSession(self, session)
+
+    def _collect(self, metadata):
+        for dev_stats in metadata.step_stats.dev_stats:
+            for node_stats in dev_stats.node_stats:
+                name = node_stats.node_name.split(":")[0]
+                if name == "_SOURCE":
+                    continue
+                elapsed = node_stats.all_end_rel_micros
+                n_bytes = 0
+                for output in node_stats.output:
+                    n_bytes += output.tensor_description.allocation_description.requested_bytes
+                stats = self.op_stats.setdefault(name, [0, 0])
+                stats[0] += elapsed
+                stats[1] += n_bytes
+
+    def summary(self, depth = None):
+        """Aggregates the op stats per layer or per scope.
+        Args:
+            depth: An optional integer. If None, the ops are grouped by the
+                named layers (and by the top level scope for the others),
+                otherwise by the scope prefixes of the given depth, e.g.
+                "residual_2/residual_block_1" for depth 2.
+        Returns:
+            A list of tuples of the group names, the mean time in milliseconds
+            and the mean allocated bytes per sampled step, ranked by time.
+        """
+        groups = dict()
+        for name, (elapsed, n_bytes) in self.op_stats.items():
+            parts = _op_scope(name)
+            if depth is None:
+                key = self._layer_scopes.get(parts[0], parts[0])
+            else:
+                key = "/".join(parts[:depth])
+            stats = groups.setdefault(key, [0, 0])
+            stats[0] += elapsed
+            stats[1] += n_bytes
+        n = max(self.n_samples, 1)
+        rows = [(key, elapsed / 1000.0 / n, n_bytes / n)
+                for key, (elapsed, n_bytes) in groups.items()]
+        return sorted(rows, key = lambda row: row[1], reverse = True)
+
+    def print_summary(self, depth = None, n_rows = 30):
+        """Prints a table of the most expensive layers or scopes."""
+        rows = self.summary(depth)
+        total = sum(row[1] for row in rows)
+        line = "{:<50} {:>12} {:>8} {:>14}"
+        print(line.format("layer" if depth is None else "scope", "time (ms)", "%", "memory (KB)"))
+        for key, elapsed, n_bytes in rows[:n_rows]:
+            print(line.format(key,
+                              "{:.3f}".format(elapsed),
+                              "{:.1f}".format(100.0 * elapsed / max(total, 1e-12)),
+                              "{:.1f}".format(n_bytes / 1024.0)))
+
+    def write_chrome_trace(self, path):
+        """Writes the last sampled step as a Chrome trace (chrome://tracing)."""
+        if self._last_metadata is None:
+            return
+        trace = timeline.Timeline(self._last_metadata.step_stats)
+        with open(path, "w") as f:
+            f.write(trace.generate_chrome_trace_format(show_memory = True))
+
+    def write_summary(self, path, depth = None):
+        """Writes the summary into a JSON file."""
+        rows = self.summary(depth)
+        with open(path, "w") as f:
+            json.dump({'n_samples': self.n_samples,
+                       'rows': [{'name': key, 'time_ms': elapsed, 'bytes': n_bytes}
+                                for key, elapsed, n_bytes in rows]},
+                      f, indent = 2)
+
+
+class _ProfiledSession(object):
+    def __init__(self, profiler, session):
+        self._profiler = profiler
+        self._session = session
+
+    def run(self, fetches, feed_dict = None):
+        return self._profiler.run(self._session, fetches, feed_dict = feed_dict)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import numpy as np
+
+HEADER_FILE = "header.json"
+FORMAT_VERSION = 1
+
+
+def one_hot(labels, n_classes, dtype = np.float32):
+    """Converts integer labels into one-hot encoded vectors.
+    Args:
+        labels: An array of integer labels.
+        n_classes: An integer representing the number of classes.
+        dtype: The type of the output array.
+    Returns:
+        A 2D numpy array of shape (len(labels), n_classes).
+    """
+    return np.eye(n_classes, dtype = dtype)[np.asarray(labels)]
+
+
+class ScaledImages(object):
+    """Class to access stored (e.g. uint8, memory-mapped) images as float32
+    arrays. Scaling and the optional normalization are applied only on the
+    requested items, i.e. per batch.
+
+    Attributes:
+        data: A numpy array or memmap holding the raw images.
+        scale: A number, the raw values are divided by it.
+        normalize: An optional callable applied on the scaled float32 items.
+        shape: A tuple representing the shape of the images.
+        dtype: The type of the output arrays.
+
+    """
+    def __init__(self, data, scale = 255.0, normalize = None):
+        self.data = data
+        self.scale = scale
+        self.normalize = normalize
+        self.shape = data.shape
+        self.dtype = np.dtype(np.float32)
+        self.ndim = data.ndim
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        x = np.asarray(self.data[key], dtype = np.float32)
+        if self.scale != 1.0:
+            x *= np.float32(1.0 / self.scale)
+        if self.normalize is not None:
+            x = self.normalize(x)
+        return x
+
+    def __array__(self, dtype = None):
+        x = self[:]
+        if dtype is not None:
+            x = x.astype(dtype, copy = False)
+        return x
+
+
+def write_dataset(folder, splits, n_classes, data_format = "channels_last", scale = 255.0):
+    """Writes a dataset as .npy files with a small JSON header, which can be
+    opened with memory-mapping.
+    Args:
+        folder: A string representing the output folder.
+        splits: A dictionary of split names (e.g. 'train') and tuples of the
+            raw images (e.g. uint8) and the integer labels.
+        n_classes: An integer representing the number of classes.
+        data_format: A string representing the data format, "channels_last" or
+            "channels_first"
+        scale: A number representing the value the raw images are divided by
+            when read as float.
+    """
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    header = {'version': FORMAT_VERSION,
+              'n_classes': n_classes,
+              'data_format': data_format,
+              'scale': scale,
+              'splits': dict()}
+    for name, (x, y) in splits.items():
+        x_file = name + "_x.npy"
+        y_file = name + "_y.npy"
+        np.save(os.path.join(folder, x_file), np.ascontiguousarray(x))
+        np.save(os.path.join(folder, y_file), np.asarray(y, dtype = np.int64))
+        header['splits'][name] = {'x': x_file,
+                                  'y': y_file,
+                                  'shape': list(x.shape),
+                                  'dtype': str(x.dtype)}
+    with open(os.path.join(folder, HEADER_FILE), "w") as f:
+        json.dump(header, f, indent = 2)
+
+
+def is_dataset(folder):
+    """Checks whether the folder contains a dataset written by write_dataset."""
+    return os.path.isfile(os.path.join(folder, HEADER_FILE))
+
+
+def read_dataset(folder, mmap_mode = "r"):
+    """Reads a dataset written by write_dataset. The images are memory-mapped by
+    default, so the pages are loaded on demand and shared across processes.
+    Args:
+        folder: A string representing the dataset folder.
+        mmap_mode: The memory-mapping mode of numpy.load, or None to read the
+            arrays into memory.
+    Returns:
+        A tuple of the header dictionary, and a dictionary of split names and
+        tuples of ScaledImages and one-hot encoded float32 labels.
+    """
+    with open(os.path.join(folder, HEADER_FILE), "r") as f:
+        header = json.load(f)
+    if header['version'] != FORMAT_VERSION:
+        raise ValueError("Unsupported dataset format version: " + str(header['version']))
+    splits = dict()
+    for name, info in header['splits'].items():
+        x = np.load(os.path.join(folder, info['x']), mmap_mode = mmap_mode)
+        y = np.load(os.path.join(folder, info['y']))
+        splits[name] = (ScaledImages(x, scale = header['scale']),
+                        one_hot(y, header['n_classes']))
+    return header, splits
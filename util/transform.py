@@ -234,3 +234,325 @@ class RandomizedTransformer(object):
         if self.mode == 'each':
             self._init_random_transformer()
         return self.transformer.transform(x)
+
+
+def translation_matrices(tx, ty):
+    """Creates a batch of translation transformation matrices.
+    Args:
+        tx: A numpy array representing the translations along the x axis.
+        ty: A numpy array representing the translations along the y axis.
+    Returns:
+        A batch of transformation matrices represented by a Nx3x3 numpy array.
+    """
+    tx = np.asarray(tx, dtype=np.float64)
+    ty = np.asarray(ty, dtype=np.float64)
+    M = np.zeros((len(tx), 3, 3), dtype=np.float64)
+    M[:, 0, 0] = 1.0
+    M[:, 1, 1] = 1.0
+    M[:, 2, 2] = 1.0
+    M[:, 0, 2] = tx
+    M[:, 1, 2] = ty
+    return M
+
+
+def rotation_matrices(angles):
+    """Creates a batch of rotation transformation matrices.
+    Args:
+        angles: A numpy array representing the rotations in radians.
+    Returns:
+        A batch of transformation matrices represented by a Nx3x3 numpy array.
+    """
+    angles = np.asarray(angles, dtype=np.float64)
+    sa = np.sin(angles)
+    ca = np.cos(angles)
+    M = np.zeros((len(angles), 3, 3), dtype=np.float64)
+    M[:, 0, 0] = ca
+    M[:, 0, 1] = -sa
+    M[:, 1, 0] = sa
+    M[:, 1, 1] = ca
+    M[:, 2, 2] = 1.0
+    return M
+
+
+def scale_matrices(scales):
+    """Creates a batch of scaling transformation matrices.
+    Args:
+        scales: A numpy array representing the ratios of scaling.
+    Returns:
+        A batch of transformation matrices represented by a Nx3x3 numpy array.
+    """
+    scales = np.asarray(scales, dtype=np.float64)
+    M = np.zeros((len(scales), 3, 3), dtype=np.float64)
+    M[:, 0, 0] = scales
+    M[:, 1, 1] = scales
+    M[:, 2, 2] = 1.0
+    return M
+
+
+def y_reflection_matrices(reflect):
+    """Creates a batch of optional reflection matrices along y-axis.
+    Args:
+        reflect: A boolean numpy array, identity is used where it is False.
+    Returns:
+        A batch of transformation matrices represented by a Nx3x3 numpy array.
+    """
+    reflect = np.asarray(reflect, dtype=bool)
+    M = np.zeros((len(reflect), 3, 3), dtype=np.float64)
+    M[:, 0, 0] = np.where(reflect, -1.0, 1.0)
+    M[:, 1, 1] = 1.0
+    M[:, 2, 2] = 1.0
+    return M
+
+
+def transformation_matrices(transformations):
+    """Combines multiple batches of transformation matrices into one batch.
+    Args:
+        transformations: A list of transformation matrix batches, each
+            represented by a Nx3x3 numpy array.
+    Returns:
+        A batch of transformation matrices represented by a Nx3x3 numpy array.
+    """
+    if isinstance(transformations, np.ndarray):
+        return transformations
+    M = None
+    for tr in transformations:
+        if M is None:
+            M = tr
+        else:
+            M = np.matmul(tr, M)
+    return M
+
+
+class BatchAffine(object):
+    """Class to perform affine transformations on a batch of images, each image
+    having its own transformation parameters.
+
+    Attributes:
+        shape: A tuple representing the shape of a single input image.
+        r: A numpy array representing the rotations in degrees.
+        tx: A numpy array representing the translations along x-axis in pixels.
+        ty: A numpy array representing the translations along y-axis in pixels.
+        scale: A number or numpy array representing the ratios of scaling.
+        reflect_y: A boolean or boolean numpy array to indicate the reflections
+            in the y-axis.
+        data_format: A string representing the data format, "channels_last" or
+            "channels_first"
+        tr_mat: An Nx3x3 array representing the transformation matrices.
+
+    """
+    def __init__(self, shape,
+                       r=0.0, tx=0.0, ty=0.0, scale=1.0, reflect_y=False,
+                       data_format="channels_last"):
+        self.shape = shape
+        n = max(np.size(r), np.size(tx), np.size(ty),
+                np.size(scale), np.size(reflect_y))
+        self.r = np.broadcast_to(np.asarray(r, dtype=np.float64), (n,))
+        self.tx = np.broadcast_to(np.asarray(tx, dtype=np.float64), (n,))
+        self.ty = np.broadcast_to(np.asarray(ty, dtype=np.float64), (n,))
+        self.scale = np.broadcast_to(np.asarray(scale, dtype=np.float64), (n,))
+        self.reflect_y = np.broadcast_to(np.asarray(reflect_y, dtype=bool), (n,))
+        self.data_format = data_format
+        self.tr_mat = None
+        self._init_tranformation_matrices()
+
+    def _init_tranformation_matrices(self):
+        """Initializes the affine transformation matrices of the whole batch,
+        composed in the same order as in Affine.
+        """
+        if self.data_format == "channels_last":
+            img_height = self.shape[0]
+            img_width = self.shape[1]
+        else:
+            img_height = self.shape[1]
+            img_width = self.shape[2]
+        n = len(self.r)
+
+        rotation = np.deg2rad(self.r)
+        T = translation_matrices(self.tx, self.ty)
+        R = rotation_matrices(rotation)
+        S = scale_matrices(self.scale)
+        Fy = y_reflection_matrices(self.reflect_y)
+        self.tr_mat = transformation_matrices([Fy, S, R, T])
+
+        center = 0.5*(np.array([img_width, img_height])-1)
+        Tcenter = translation_matrices(np.full(n, -center[0]), np.full(n, -center[1]))
+        Torig = translation_matrices(np.full(n, center[0]), np.full(n, center[1]))
+        self.tr_mat = transformation_matrices([Tcenter, self.tr_mat, Torig])
+
+    def transform(self, x):
+        """Applies the affine transformations on a batch of images. Each image
+        is warped in a single multi-channel call.
+        Args:
+            x: A numpy array representing the input images, NHWC or NCHW.
+        Returns:
+            A numpy array representing the transformed images.
+        """
+        if len(x) != len(self.tr_mat):
+            raise ValueError("Batch size (%d) does not match the number of "
+                             "transformations (%d)." % (len(x), len(self.tr_mat)))
+        if self.data_format == "channels_last":
+            xt = x
+        else:
+            xt = np.transpose(x, (0, 2, 3, 1))
+        height, width, nchan = xt.shape[1:]
+        xc = np.zeros_like(xt, dtype=x.dtype)
+        flags = cv2.WARP_INVERSE_MAP + cv2.INTER_LINEAR
+        for n in range(len(xt)):
+            M = self.tr_mat[n, :2, :]
+            if nchan <= 4: # cv2 supports at most 4 channels
+                xc[n] = cv2.warpAffine(
+                        np.ascontiguousarray(xt[n]), M, dsize=(width, height),
+                        flags=flags, borderMode=cv2.BORDER_REPLICATE
+                        ).reshape(xc[n].shape)
+            else:
+                for i in range(nchan):
+                    xc[n,:,:,i] = cv2.warpAffine(
+                            np.ascontiguousarray(xt[n,:,:,i]), M,
+                            dsize=(width, height),
+                            flags=flags, borderMode=cv2.BORDER_REPLICATE)
+        if self.data_format != "channels_last":
+            xc = np.transpose(xc, (0, 3, 1, 2))
+        return xc
+
+
+def _uint32_to_double(a, b):
+    """Converts pairs of 32 bit random words into doubles in [0, 1), in the same
+    way as numpy.random.RandomState does.
+    """
+    a = (a >> np.uint32(5)).astype(np.float64)
+    b = (b >> np.uint32(6)).astype(np.float64)
+    return (a*67108864.0 + b)/9007199254740992.0
+
+
+class RandomizedBatchTransformer(object):
+    """Class to create and apply transformations with randomized parameters on
+    a batch of inputs. The parameters of the whole batch are sampled at once,
+    and the random stream is consumed exactly as a RandomizedTransformer in
+    'each' mode consumes it when called on the inputs one by one. Therefore, the
+    two produce the same outputs for the same seed.
+
+    Attributes:
+        transformer_class: The class of the batch transformation, which
+            accepts arrays of parameters (e.g. BatchAffine).
+        parms: A list of tuples representing the input parameters. Each tuple
+            contains the parameter name and its value.
+        rand_params: A list of tuples representing the random parameters. Each 
+            tuple contains the parameter name and its random range. For ranges
+            defined as a [low, high] list uniform sampling is performed. For 
+            other cases (options) an item is randomly selected.
+        random_seed: A number representing the random seed.
+
+    """
+    def __init__(self, transformer_class = None,
+                       params = None,
+                       rand_params = None,
+                       random_seed = 42):
+        self.transformer_class = transformer_class
+        self.params = params
+        self.rand_params = rand_params
+        self.random_seed = random_seed
+        self.random_state = np.random.RandomState(random_seed)
+        self._init_sampling_plan()
+
+    def _init_sampling_plan(self):
+        """Builds the list of random draws required by a single input. Each
+        entry is a tuple of the parameter name, the kind of the draw, and its
+        range. The number of 32 bit words consumed by one input is counted, if
+        it is fixed, otherwise the scalar fallback is used for sampling.
+        """
+        self.plan = []
+        self.words_per_item = 0
+        for rand_param in (self.rand_params or []):
+            param_name = rand_param[0]
+            param_range = rand_param[1]
+            if param_range is None: # keep the default value
+                continue
+            if isinstance(param_range, list): # random parameters
+                if isinstance(param_range[0], (bool, str)) or len(param_range) != 2:
+                    self.plan.append((param_name, 'choice', param_range))
+                    n_opts = len(param_range)
+                    if n_opts > 1:
+                        if (n_opts & (n_opts-1)) != 0: # rejection sampling
+                            self.words_per_item = None
+                        elif self.words_per_item is not None:
+                            self.words_per_item += 1
+                else: # range of [low, high)
+                    self.plan.append((param_name, 'uniform', param_range))
+                    if self.words_per_item is not None:
+                        self.words_per_item += 2
+            else:
+                self.plan.append((param_name, 'fixed', param_range))
+
+    def _sample_scalar(self, n):
+        """Samples the parameters item by item."""
+        values = dict((p[0], []) for p in self.plan)
+        for _ in range(n):
+            for param_name, kind, param_range in self.plan:
+                if kind == 'choice':
+                    val = self.random_state.choice(param_range)
+                elif kind == 'uniform':
+                    val = self.random_state.uniform(*param_range)
+                else:
+                    val = param_range
+                values[param_name].append(val)
+        return dict((k, np.array(v)) for k, v in values.items())
+
+    def _sample_vectorized(self, n):
+        """Samples the parameters of all items from one block of random words."""
+        words = self.random_state.randint(
+                0, 2**32, size=n*self.words_per_item, dtype=np.uint32)
+        words = words.reshape(n, self.words_per_item)
+        values = dict()
+        w = 0
+        for param_name, kind, param_range in self.plan:
+            if kind == 'choice':
+                opts = np.array(param_range)
+                if len(opts) == 1:
+                    values[param_name] = np.repeat(opts, n)
+                    continue
+                idx = words[:, w] & np.uint32(len(opts)-1)
+                values[param_name] = opts[idx]
+                w += 1
+            elif kind == 'uniform':
+                low, high = param_range
+                values[param_name] = low + (high-low)*_uint32_to_double(
+                        words[:, w], words[:, w+1])
+                w += 2
+            else:
+                values[param_name] = param_range
+        return values
+
+    def sample(self, n):
+        """Samples the random parameters of n items.
+        Args:
+            n: An integer representing the number of items.
+        Returns:
+            A dictionary of parameter names and numpy arrays of their values.
+        """
+        if self.words_per_item is None:
+            return self._sample_scalar(n)
+        return self._sample_vectorized(n)
+
+    def sample_transformer(self, n):
+        """Creates a batch transformer with randomized parameters for n items.
+        Sampling and applying the transformation are separated, so the random
+        stream can be consumed in order while the transformations are applied
+        concurrently.
+        Args:
+            n: An integer representing the number of items.
+        Returns:
+            An instance of the transformer_class with randomized parameters.
+        """
+        all_params = self.sample(n)
+        if self.params is not None:
+            all_params.update(dict(self.params))
+        return self.transformer_class(**all_params)
+
+    def transform(self, x):
+        """Applies random transformations on a batch of input data.
+        Args:
+            x: A batch of inputs compatible with the randomized transformer.
+        Returns:
+            Output compatible with the output of the randomized transformer.
+        """
+        return self.sample_transformer(len(x)).transform(x)